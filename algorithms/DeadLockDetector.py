@@ -1,19 +1,67 @@
 
+class VariableAccess(object):
+    """
+    Transactions (not read-only) which have operated on one variable, grouped by operation type
+
+    :param self.readers: A set of transactions which have read the variable
+    :param self.writers: A set of transactions which have written the variable
+    :param self.op_counts: A dictionary mapping transaction id to the number of its operations on the variable
+    """
+    __slots__ = ("readers", "writers", "op_counts")
+
+    def __init__(self):
+        self.readers = set()
+        self.writers = set()
+        self.op_counts = {}
+
+    def record(self, trans_id, op_t):
+        """
+        Record an operation of given transaction on the variable
+
+        :param trans_id: transaction id
+        :param op_t: "R" or "W"
+        :return: None
+        """
+        if op_t == "R":
+            self.readers.add(trans_id)
+        else:
+            self.writers.add(trans_id)
+        self.op_counts[trans_id] = self.op_counts.get(trans_id, 0) + 1
+
+    def discard(self, trans_id):
+        """
+        Forget every operation of given transaction on the variable
+
+        :param trans_id: transaction id
+        :return: None
+        """
+        self.readers.discard(trans_id)
+        self.writers.discard(trans_id)
+        self.op_counts.pop(trans_id, None)
+
+
 class WaitFor(object):
     """
     A simple implementation of wait-for graph for deadlock detection
 
     :param self.tm: TransactionManager
-    :param self.var_to_ops: A dictionary mapping variable id to a set of operations which want to access the variable
+    :param self.var_index: A dictionary mapping variable id to a VariableAccess which records the transactions
+                           accessing the variable
+    :param self.trans_to_vars: A dictionary mapping transaction id to the set of variables it has accessed
     :param self.wait_for: A dictionary tracking the wait-for edges, key is the from point, value is a set of transactions
     :param self.trace: A list contains a cycle in the wait-for graph if any circle exists
+    :param self.dirty: An ordered dictionary (used as a set) of transactions which gained outgoing edges since they
+                       were last checked, every cycle in the graph passes through at least one of them
     """
 
     def __init__(self, tm):
         self.tm = tm
-        # Key-Value pair, tracking the operations that access each variable, (variable id: set of operation)
+        # Key-Value pair, tracking the transactions that access each variable, (variable id: VariableAccess)
         # if a variable id does not exist, then no transaction access this variable
-        self.var_to_ops = {}
+        self.var_index = {}
+
+        # Reverse index of self.var_index, (trans_id: set of variable id)
+        self.trans_to_vars = {}
 
         # key value pair, tracking the wait-for-edges, (trans_id: set of transaction)
         self.wait_for = {}
@@ -22,12 +70,24 @@ class WaitFor(object):
         # will be used to find the youngest transaction in the circle
         self.trace = []
 
+        # transactions which got new outgoing edges and have not been proven to be cycle free yet,
+        # incremental detection only searches from these nodes, a dict keeps the check order deterministic
+        self.dirty = {}
+
+    def _add_edge(self, from_trans, to_trans):
+        waits = self.wait_for.get(from_trans, set())
+        if to_trans not in waits:
+            waits.add(to_trans)
+            self.dirty[from_trans] = None
+        self.wait_for[from_trans] = waits
+
     def add_operation(self, operation):
         """
-        Add operation to self.var_to_ops dictionary, for example, if the operation want to access x1,
-        we add the operation in this way self.var_to_ops["x1"].add(operation)
+        Record the operation in self.var_index, for example, if T1 wants to write x1,
+        we record it in this way self.var_index["x1"].record("T1", "W")
 
-        Add new node in wait-for graph if the transactions does not exist
+        Add new node in wait-for graph if the transactions does not exist, edges are derived from the distinct
+        transactions holding the variable instead of every operation ever recorded on it
 
         ReadOnly operation will be ignored
 
@@ -47,87 +107,170 @@ class WaitFor(object):
         if self.tm.transactions[trans_id].is_readonly:
             return
 
-        # Get all operations on the variable
-        ops = self.var_to_ops.get(var_id, set())
+        # Get all transactions on the variable
+        access = self.var_index.get(var_id)
+        if access is None:
+            access = VariableAccess()
+            self.var_index[var_id] = access
 
         # Case 1: operation is R
         if op_t == "R":
             # Check if previous operation of the same transaction operated on the same variable
             # if so, no deadlock will be formed by adding this operation
-            for op in ops:
-                if op.get_parameters()[0] == trans_id:
-                    # Add operation to the dictionary
-                    ops.add(operation)
-                    self.var_to_ops[var_id] = ops
-                    return
-
-            # for any operation which is on the same variable,
-            # if op is W and transaction id is different, then there should be a edge
-            # For example, op is W(T1, x1, 10), the operation to be added is R(T2, x1)
-            # then the edge is T2 -> T1
-            for op in ops:
-                if op.get_op_t() == "W" and op.get_parameters()[0] != trans_id:
-                    waits = self.wait_for.get(trans_id, set())
-                    waits.add(op.get_parameters()[0])
-                    self.wait_for[trans_id] = waits
+            if trans_id not in access.op_counts:
+                # for any transaction which has written the same variable, there should be a edge
+                # For example, op is W(T1, x1, 10), the operation to be added is R(T2, x1)
+                # then the edge is T2 -> T1
+                for writer in access.writers:
+                    if writer != trans_id:
+                        self._add_edge(trans_id, writer)
         # Case 2: operation is W
         else:
-            # Check if previous operation of the same transaction operated on the same variable
+            # Check if previous write of the same transaction operated on the same variable
             # if so, no deadlock will be formed by adding this operation
-            for op in ops:
-                if op.get_parameters()[0] == trans_id and op.get_op_t() == "W":
-                    # Add operation to the dictionary
-                    ops.add(operation)
-                    self.var_to_ops[var_id] = ops
-                    return
-
-            # W operation will conflict with all other operation on the same variable
-            for op in ops:
-                if op.get_parameters()[0] != trans_id:
-                    waits = self.wait_for.get(trans_id, set())
-                    waits.add(op.get_parameters()[0])
-                    self.wait_for[trans_id] = waits
-
-        # Add operation to the dictionary
-        ops.add(operation)
-        self.var_to_ops[var_id] = ops
-
-    def _recursive_check(self, cur_node, target, visited, trace):
-        visited[cur_node] = True
-
-        if cur_node not in self.wait_for:
-            return False
+            if trans_id not in access.writers:
+                # W operation will conflict with all other transactions on the same variable
+                for other in access.op_counts:
+                    if other != trans_id:
+                        self._add_edge(trans_id, other)
+
+        # Record operation in the index
+        access.record(trans_id, op_t)
+        variables = self.trans_to_vars.get(trans_id, set())
+        variables.add(var_id)
+        self.trans_to_vars[trans_id] = variables
+
+    def _find_cycle_from(self, source):
+        """
+        Iterative depth first search for a cycle passing through source, only the part of the graph reachable from
+        source is visited
 
-        trace.append(cur_node)
-        neighbor_nodes = self.wait_for[cur_node]
+        :param source: transaction id
+        :return: A list of transactions forming the cycle (starting with source), or None
+        """
+        parent = {source: None}
+        stack = [(source, iter(self.wait_for.get(source, ())))]
+
+        while stack:
+            cur_node, neighbors = stack[-1]
+            advanced = False
+            for neighbor in neighbors:
+                if neighbor == source:
+                    # rebuild the path source -> ... -> cur_node by following parents
+                    cycle = []
+                    while cur_node is not None:
+                        cycle.append(cur_node)
+                        cur_node = parent[cur_node]
+                    cycle.reverse()
+                    return cycle
+                elif neighbor not in parent and neighbor in self.wait_for:
+                    parent[neighbor] = cur_node
+                    stack.append((neighbor, iter(self.wait_for[neighbor])))
+                    advanced = True
+                    break
+            if not advanced:
+                stack.pop()
+        return None
+
+    def _strongly_connected_components(self):
+        """
+        Tarjan's algorithm over the whole wait-for graph (iterative, so deep graphs do not hit the recursion limit)
 
-        for neighbor in neighbor_nodes:
-            if neighbor == target:
-                return True
-            elif neighbor not in visited:
+        :return: A list of strongly connected components which contain more than one transaction
+        """
+        index = {}
+        low_link = {}
+        on_stack = set()
+        stack = []
+        components = []
+        counter = 0
+
+        for root in list(self.wait_for.keys()):
+            if root in index:
                 continue
-            elif not visited[neighbor]:
-                if self._recursive_check(neighbor, target, visited, trace):
-                    return True
-
-        trace.pop(-1)
-        return False
-
-    def check_deadlock(self):
+            index[root] = low_link[root] = counter
+            counter += 1
+            stack.append(root)
+            on_stack.add(root)
+            work = [(root, iter(self.wait_for.get(root, ())))]
+
+            while work:
+                cur_node, neighbors = work[-1]
+                advanced = False
+                for neighbor in neighbors:
+                    if neighbor not in self.wait_for:
+                        continue
+                    if neighbor not in index:
+                        index[neighbor] = low_link[neighbor] = counter
+                        counter += 1
+                        stack.append(neighbor)
+                        on_stack.add(neighbor)
+                        work.append((neighbor, iter(self.wait_for[neighbor])))
+                        advanced = True
+                        break
+                    elif neighbor in on_stack:
+                        low_link[cur_node] = min(low_link[cur_node], index[neighbor])
+                if advanced:
+                    continue
+
+                work.pop()
+                if work:
+                    caller = work[-1][0]
+                    low_link[caller] = min(low_link[caller], low_link[cur_node])
+
+                if low_link[cur_node] == index[cur_node]:
+                    component = []
+                    while True:
+                        node = stack.pop()
+                        on_stack.remove(node)
+                        component.append(node)
+                        if node == cur_node:
+                            break
+                    if len(component) > 1:
+                        components.append(component)
+        return components
+
+    def check_deadlock(self, incremental=True):
         """
         Detect if there is a circle in current execution
 
+        In incremental mode only transactions which got new wait-for edges since the last check are searched, so the
+        cost is proportional to the part of the graph reachable from the new edges. A node is only marked clean
+        after a search proves that no cycle goes through it, which keeps the invariant that every cycle contains a
+        dirty node.
+
+        With incremental=False, a single Tarjan pass over the whole graph is used instead (useful for batch checks),
+        self.trace will then contain every transaction of the first deadlocked component.
+
+        :param incremental: whether to only search from transactions with new edges
         :return: True if there is a deadlock, otherwise False
         """
-        nodes = list(self.wait_for.keys())
         self.trace = []
 
-        for target in nodes:
-            visited = {node: False for node in nodes}
-            if self._recursive_check(target, target, visited, self.trace):
+        if not incremental:
+            components = self._strongly_connected_components()
+            if components:
+                self.trace = components[0]
+                return True
+            self.dirty = {}
+            return False
+
+        for source in list(self.dirty):
+            cycle = self._find_cycle_from(source) if source in self.wait_for else None
+            if cycle is not None:
+                self.trace = cycle
                 return True
+            self.dirty.pop(source)
         return False
 
+    def get_deadlocked_components(self):
+        """
+        Return every group of transactions which are waiting for each other, computed by one Tarjan pass
+
+        :return: A list of lists of transaction ids
+        """
+        return self._strongly_connected_components()
+
     def get_trace(self):
         """
         Return all transaction in a deadlock circle
@@ -142,18 +285,22 @@ class WaitFor(object):
         """
         Remove wait-for node has the transaction_id, remove all operations belong to the transaction
 
-        Typically, this function will be called when a transaction has been aborted or has committed
+        Typically, this function will be called when a transaction has been aborted or has committed,
+        only the variables the transaction actually accessed are touched
 
         :param transaction_id: identifier of the transaction
         :return: None
         """
-        # Modify var_to_trans
-        for var, ops in self.var_to_ops.items():
-            ops = {op for op in ops if op.get_parameters()[0] != transaction_id}
-            self.var_to_ops[var] = ops
+        # Modify var_index
+        for var_id in self.trans_to_vars.pop(transaction_id, ()):
+            access = self.var_index[var_id]
+            access.discard(transaction_id)
+            if not access.op_counts:
+                self.var_index.pop(var_id)
 
         # Modify wait for graph, delete the node of given transaction id
         self.wait_for.pop(transaction_id, None)
+        self.dirty.pop(transaction_id, None)
 
 
 
@@ -0,0 +1,192 @@
+import configurations
+
+
+class DeadlockPolicy(object):
+    """
+    Decide how the transaction manager deals with deadlocks, a policy either detects cycles in the wait-for graph
+    (TransactionManager.wait_for_graph) and aborts the youngest transaction of each cycle, or prevents cycles from
+    ever forming by comparing the ages (Transaction.start_order) of a blocked transaction and the transactions it
+    waits for, in which case the wait-for graph is not maintained at all
+
+    :param self.tm: TransactionManager
+    """
+
+    # whether the operations are recorded in the wait-for graph
+    uses_graph = True
+
+    def __init__(self, tm):
+        self.tm = tm
+
+    def record(self, operation):
+        """
+        Called when a transaction issues a read or a write
+
+        :param operation: Operation object
+        :return: None
+        """
+        if self.uses_graph:
+            self.tm.wait_for_graph.add_operation(operation)
+
+    def on_blocked(self, operation, tick):
+        """
+        Called every time an operation can not be executed (when it is issued and when a retry fails)
+
+        :param operation: Operation object
+        :param tick: time
+        :return: None
+        """
+        pass
+
+    def after_step(self, operation, tick):
+        """
+        Called at the end of every TransactionManager.step
+
+        :param operation: the new operation of the step
+        :param tick: time
+        :return: None
+        """
+        pass
+
+    def after_batch(self, operations, tick):
+        """
+        Called at the end of every TransactionManager.step_batch, once for the whole batch
+
+        :param operations: the operations of the batch
+        :param tick: time
+        :return: None
+        """
+        if operations:
+            self.after_step(operations[-1], tick)
+
+    def on_idle(self, tick):
+        """
+        Called when a retry pass after the last operation made no progress, before the remaining blocked operations
+        are reported as stalled, the deadlocks not resolved yet (for example closed since the last periodic check)
+        are resolved here
+
+        :param tick: time
+        :return: True if a transaction was aborted, so the blocked operations have to be retried again
+        """
+        return self.uses_graph and self.resolve_deadlocks() > 0
+
+    def resolve_deadlocks(self):
+        """
+        Abort the youngest transaction of each cycle of the wait-for graph until there is no cycle
+
+        :return: the number of deadlocks resolved
+        """
+        resolved = 0
+        while self.tm.wait_for_graph.check_deadlock():
+            self._abort_youngest()
+            resolved += 1
+        return resolved
+
+    def _abort_youngest(self):
+        # the wait-for graph has just found a cycle
+        tm = self.tm
+        trace = tm.wait_for_graph.get_trace()
+        if tm.metrics is not None:
+            tm.metrics.inc("deadlocks")
+            tm.metrics.observe("deadlock_cycle_length", len(trace))
+        t = tm.get_youngest_transaction(trace)[0]
+        tm.abort(t, 2)
+
+
+class EagerDetection(DeadlockPolicy):
+    """
+    Check the wait-for graph after every read and write, the original behaviour
+    """
+
+    def after_step(self, operation, tick):
+        if operation.get_op_t() in {"R", "W"} and self.tm.wait_for_graph.check_deadlock():
+            self._abort_youngest()
+
+    def after_batch(self, operations, tick):
+        # a batch may close several cycles
+        if any(operation.get_op_t() in {"R", "W"} for operation in operations):
+            self.resolve_deadlocks()
+
+
+class PeriodicDetection(DeadlockPolicy):
+    """
+    Check the wait-for graph once every interval ticks and resolve every deadlock found, a deadlock may last up to
+    interval ticks but the detection cost is amortized over them
+
+    :param self.interval: number of ticks between two checks
+    :param self.last_check: tick of the last check
+    """
+
+    def __init__(self, tm, interval):
+        super().__init__(tm)
+        if interval < 1:
+            raise ValueError(f"Invalid deadlock detection interval: {interval}")
+        self.interval = interval
+        self.last_check = 0
+
+    def after_step(self, operation, tick):
+        if tick - self.last_check >= self.interval:
+            self.last_check = tick
+            self.resolve_deadlocks()
+
+
+class WaitDie(DeadlockPolicy):
+    """
+    An older transaction may wait for younger ones, a younger transaction which would wait for an older one is aborted
+    (dies) instead, so every wait goes from older to younger and no cycle can form
+    """
+    uses_graph = False
+
+    def on_blocked(self, operation, tick):
+        tm = self.tm
+        trans_id = operation.get_parameters()[0]
+        conflicts = operation.get_conflicting_transactions(tm) if trans_id in tm.transactions else None
+        if not conflicts:
+            return
+
+        start = tm.transactions[trans_id].start_order
+        if any(tm.transactions[other].start_order < start for other in conflicts if other in tm.transactions):
+            tm.abort(trans_id, 4)
+
+
+class WoundWait(DeadlockPolicy):
+    """
+    A younger transaction may wait for older ones, an older transaction which would wait for younger ones aborts
+    (wounds) them and waits for their locks to be released, so every wait goes from younger to older and no cycle can
+    form
+    """
+    uses_graph = False
+
+    def on_blocked(self, operation, tick):
+        tm = self.tm
+        trans_id = operation.get_parameters()[0]
+        conflicts = operation.get_conflicting_transactions(tm) if trans_id in tm.transactions else None
+        if not conflicts:
+            return
+
+        start = tm.transactions[trans_id].start_order
+        # sorted, so the victims are aborted in a deterministic order, a transaction whose commit has been decided can
+        # not be wounded anymore
+        for other in sorted(conflicts):
+            victim = tm.transactions.get(other)
+            if victim is not None and not victim.committed and victim.start_order > start:
+                tm.abort(other, 4)
+
+
+POLICIES = {
+    "eager": lambda tm, interval: EagerDetection(tm),
+    "periodic": PeriodicDetection,
+    "wait-die": lambda tm, interval: WaitDie(tm),
+    "wound-wait": lambda tm, interval: WoundWait(tm)
+}
+
+
+def create_policy(tm):
+    """
+    Create the deadlock policy described by configurations.py
+
+    :param tm: TransactionManager
+    :return: DeadlockPolicy
+    """
+    if configurations.deadlock_policy not in POLICIES:
+        raise KeyError(f"Unknown deadlock policy: {configurations.deadlock_policy}")
+    return POLICIES[configurations.deadlock_policy](tm, configurations.deadlock_interval)
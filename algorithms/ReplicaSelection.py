@@ -0,0 +1,130 @@
+import configurations
+import random
+
+
+class ReplicaSelector(object):
+    """
+    Decide in which order the replicas of a replicated variable are tried by a read, the read is served by the first
+    up site in that order where the variable is readable (and, for a typical transaction, the read lock is granted)
+
+    Every selector counts the reads served by each site, so the load of the replicas can be compared across policies
+
+    :param self.tm: TransactionManager
+    :param self.reads: A dictionary mapping site id to the number of replicated reads it served
+    """
+
+    def __init__(self, tm):
+        self.tm = tm
+        self.reads = {}
+
+    def order(self, trans_id, var_id, sites):
+        """
+        Order the replicas of a variable for a read
+
+        :param trans_id: transaction id
+        :param var_id: variable id
+        :param sites: A list of ids of the sites holding the variable in increasing order, not to be modified
+        :return: An iterable of site ids
+        """
+        return sites
+
+    def served(self, site_id):
+        """
+        Called when a replicated read has been served by a site
+
+        :param site_id: site id
+        :return: None
+        """
+        self.reads[site_id] = self.reads.get(site_id, 0) + 1
+        if self.tm.metrics is not None:
+            self.tm.metrics.inc(f"replica_reads.site{site_id}")
+
+
+class FirstAvailable(ReplicaSelector):
+    """
+    Try the replicas in increasing site id, the original behaviour, the first site absorbs almost every read
+    """
+    pass
+
+
+class RoundRobin(ReplicaSelector):
+    """
+    Start each read of a variable at the replica after the one the previous read of that variable started at
+
+    :param self.next: A dictionary mapping variable id to the position of the replica the next read starts at
+    """
+
+    def __init__(self, tm):
+        super().__init__(tm)
+        self.next = {}
+
+    def order(self, trans_id, var_id, sites):
+        start = self.next.get(var_id, 0) % len(sites)
+        self.next[var_id] = start + 1
+        return sites[start:] + sites[:start]
+
+
+class LeastLocked(ReplicaSelector):
+    """
+    Try first the replicas whose lock table holds the fewest locked variables, ties are broken by site id
+    """
+
+    def order(self, trans_id, var_id, sites):
+        tm = self.tm
+        return sorted(sites, key=lambda site_id: (len(tm.get_site(site_id).lock_manager.lock_table), site_id))
+
+
+class RandomReplica(ReplicaSelector):
+    """
+    Try the replicas in a random order, seeded with configurations.replica_seed so a run can be reproduced
+
+    :param self.random: random.Random
+    """
+
+    def __init__(self, tm, seed):
+        super().__init__(tm)
+        self.random = random.Random(seed)
+
+    def order(self, trans_id, var_id, sites):
+        sites = list(sites)
+        self.random.shuffle(sites)
+        return sites
+
+
+class Affinity(ReplicaSelector):
+    """
+    Keep the reads of a transaction together: the sites the transaction already accessed are tried first (so its
+    locks, and the participants of its commit, stay on few sites), then the replicas starting at a home site derived
+    from the start tick of the transaction, which spreads the transactions over the sites
+    """
+
+    def order(self, trans_id, var_id, sites):
+        transaction = self.tm.transactions[trans_id]
+        start = transaction.tick % len(sites)
+        rotated = sites[start:] + sites[:start]
+
+        accessed = transaction.sites
+        if not accessed:
+            return rotated
+        return [s for s in rotated if s in accessed] + [s for s in rotated if s not in accessed]
+
+
+SELECTORS = {
+    "first": lambda tm, seed: FirstAvailable(tm),
+    "round-robin": lambda tm, seed: RoundRobin(tm),
+    "least-locked": lambda tm, seed: LeastLocked(tm),
+    "random": RandomReplica,
+    "affinity": lambda tm, seed: Affinity(tm)
+}
+
+
+def create_selector(tm):
+    """
+    Create the replica selector described by configurations.py
+
+    :param tm: TransactionManager
+    :return: ReplicaSelector
+    """
+    if configurations.replica_selection not in SELECTORS:
+        raise KeyError(f"Unknown replica selection: {configurations.replica_selection}")
+    return SELECTORS[configurations.replica_selection](tm, configurations.replica_seed)
@@ -3,7 +3,81 @@ A file contains some global configurations
 
 :param distinct_variable_counts: the number of variable in each site
 :param number_of_sites: the number of sites in the simulation
+:param placement: how variables are placed on sites, "default" (even variables at all sites, odd variable xi at site
+                  i mod number_of_sites + 1), "range" or "hash" (see model/ReplicationMap.py)
+:param replication_factor: the number of sites holding each variable, only used by "range" and "hash" placements
+:param storage: how a site stores committed values, "list" (a Python list over all variables) or "compact" (arrays
+                holding only the variables of the site and a bitset of accessible flags, for large variable spaces)
+:param version_gc_interval: number of ticks between two garbage collections of old versions (used by read-only
+                            transactions), smaller is more aggressive, 0 disables the collection
+:param lock_mode: "try" (a conflicting lock request simply fails and is retried later) or "queued" (conflicting
+                  requests wait in a FIFO queue per variable, so writers can not be starved by new readers)
+:param output_format: how reads, commits, aborts and dumps are reported, "table" (the original pretty tables), "text"
+                      (one short line per event), "jsonl" (one JSON object per event) or "null" (nothing)
+:param metrics: whether the transaction manager records counters and latency histograms (see
+                model/managers/Metrics.py), off by default because timing every step has a cost
+:param deadlock_policy: how deadlocks are handled, "eager" (check the wait-for graph after every read and write),
+                        "periodic" (check it every deadlock_interval ticks), "wait-die" or "wound-wait" (prevent
+                        deadlocks by comparing transaction start ticks, no wait-for graph is maintained)
+:param deadlock_interval: number of ticks between two checks of the "periodic" deadlock policy
+:param group_commit: whether the transactions committing in the same tick release their locks together at the end of
+                     the retry pass (or of the step), waking the blocked operations in a single pass, a released lock
+                     is then only granted to waiting operations at the next tick
+:param wal_dir: directory of the write-ahead logs and checkpoints of the sites (one sub directory per site), the
+                committed state found there is recovered when the sites are created, None disables the logs
+:param wal_sync_batch: number of log records appended between two fsync (a group commit always syncs)
+:param wal_checkpoint_interval: number of log records between two checkpoints of a site, 0 disables checkpoints
+:param commit_protocol: "local" (the write sets are applied and the locks released as soon as a transaction ends) or
+                        "2pc" (the transaction manager runs a two-phase commit with the sites, see
+                        model/managers/TwoPhaseCommit.py)
+:param message_delay: number of ticks a message of the two-phase commit takes to arrive
+:param replica_selection: which up replica serves a read of a replicated variable, "first" (the lowest site id, the
+                          original behaviour), "round-robin", "least-locked", "random" or "affinity" (see
+                          algorithms/ReplicaSelection.py)
+:param replica_seed: random seed of the "random" replica selection
+:param shards: number of worker processes holding the data of the sites (values, versions, logs), the sites are
+               spread over them and the lock managers stay in the main process, 0 keeps everything in one process,
+               meant to partition the memory of large simulations, it does not improve throughput
 """
 
 distinct_variable_counts = 20
 number_of_sites = 10
+placement = "default"
+replication_factor = 3
+storage = "list"
+lock_mode = "try"
+version_gc_interval = 100
+output_format = "table"
+metrics = False
+deadlock_policy = "eager"
+deadlock_interval = 10
+group_commit = False
+wal_dir = None
+wal_sync_batch = 1
+wal_checkpoint_interval = 1000
+commit_protocol = "local"
+message_delay = 1
+replica_selection = "first"
+replica_seed = 0
+shards = 0
+
+
+def snapshot():
+    """
+    Get the value of every setting, passed to worker processes (which may be spawned instead of forked) and saved with
+    bench results
+
+    :return: A dictionary mapping setting name to value
+    """
+    return {name: value for name, value in globals().items()
+            if not name.startswith("_") and isinstance(value, (bool, int, float, str))}
+
+
+def restore(settings):
+    """
+    Set the settings taken by snapshot, in a worker process
+
+    :param settings: A dictionary mapping setting name to value
+    :return: None
+    """
+    globals().update(settings)
@@ -1,58 +1,292 @@
-from utils.FileLoader import FileLoader
-from utils.driver import run, run_interactive
+from utils.FileLoader import iter_cases
+from model.OutputSink import create_sink
+from utils.driver import run, run_interactive, run_parallel, case_wal_dir
+from utils.trace import TraceRecorder, replay_file
+import configurations
 import argparse
+import json
 import sys
 import os
 
 
-def run_file(input_file, output_file):
+def run_file(input_file, output_file, trace=False):
     """
-    Run testing on the case or cases from the input file and save the result in the output file
+    Run testing on the case or cases from the input file and save the result in the output file, cases are streamed
+    one at a time so the input file may be arbitrarily large
 
-    :param input_file: File path of the input case
-    :param output_file: File path of the output result
+    :param input_file: File path of the input case (may be gzip compressed), None or "-" reads the standard input
+    :param output_file: File path of the output result, None or "-" writes to the standard output
+    :param trace: Whether to record a trace of the run next to the output file (output file + ".trace")
     :return: None
     """
-    with open(output_file, "w") as f:
+    f = open_output(output_file)
+    stdout = sys.stdout
+    trace_file = open(output_file + ".trace", "wb") if trace else None
+    recorder = TraceRecorder(trace_file) if trace else None
+    try:
         sys.stdout = f
-        loader = FileLoader(input_file)
-        case_id = 1
-        while loader.has_next():
-            print(f"Test {case_id} Result")
-            c = loader.next_case()
-            run(c)
-            case_id += 1
+        sink = create_sink(configurations.output_format)
+        for case_id, c in enumerate(iter_cases(input_file), 1):
+            sink.case(case_id)
+            run(c, recorder, case_id, wal_dir=case_wal_dir(input_file, case_id))
+    finally:
+        sys.stdout = stdout
+        if f is not stdout:
+            f.close()
+        if trace_file is not None:
+            trace_file.close()
+
+
+def open_output(output_file):
+    """
+    Open the output file of a test file
+
+    :param output_file: File path of the output result, None or "-" represents the standard output
+    :return: A writable text stream
+    """
+    if output_file is None or output_file == "-":
+        return sys.stdout
+    return open(output_file, "w")
+
+
+def run_files(files, jobs=1, trace=False):
+    """
+    Run testing on a list of test files, with more than one job the cases of all files are run in a process pool and
+    the results are written in the same order and format as running them one by one
+
+    :param files: A list of (input file, output file)
+    :param jobs: the number of worker processes
+    :param trace: Whether to record a trace of each file next to its output file (one job only)
+    :return: None
+    """
+    if jobs <= 1:
+        for input_file, output_file in files:
+            run_file(input_file, output_file, trace)
+        return
+
+    tasks = (((output_file, case_id), c) for input_file, output_file in files
+             for case_id, c in enumerate(iter_cases(input_file), 1))
+
+    f, written = None, set()
+    try:
+        for (output_file, case_id), output in run_parallel(tasks, jobs):
+            # results come back in order, so the cases of a file are contiguous
+            if output_file not in written:
+                if f is not None and f is not sys.stdout:
+                    f.close()
+                f = open_output(output_file)
+                written.add(output_file)
+            create_sink(configurations.output_format, f).case(case_id)
+            f.write(output)
+    finally:
+        if f is not None and f is not sys.stdout:
+            f.close()
+
+    # files without any case still get an (empty) result file
+    for input_file, output_file in files:
+        if output_file not in written and output_file not in (None, "-"):
+            open_output(output_file).close()
 
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser("RepCRec")
-    parser.add_argument("mode", type=str, help="program mode (f/d/i), 'i' represents interactive mode")
-    parser.add_argument("-input", type=str, help="input source")
-    parser.add_argument("-output", type=str, help="output source")
+    parser.add_argument("mode", type=str, help="program mode (f/d/i/bench/server/replay/verify), 'i' represents "
+                                               "interactive mode, 'bench' runs a generated workload and reports its "
+                                               "throughput, 'server' serves many clients over TCP or a Unix socket, "
+                                               "'replay' re-executes the trace given as input (see -trace), 'verify' "
+                                               "compares the results of the input with -reference")
+    parser.add_argument("-input", type=str, help="input source, a file may be gzip compressed, "
+                                                 "'-' or no input reads the standard input in 'f' mode")
+    parser.add_argument("-output", type=str, help="output source, '-' or no output writes to the standard output "
+                                                  "in 'f' mode")
+    parser.add_argument("-lock_mode", type=str, choices=["try", "queued"], default=configurations.lock_mode,
+                        help="'try' retries conflicting lock requests, 'queued' makes them wait in FIFO order")
+    parser.add_argument("-sites", type=int, default=configurations.number_of_sites, help="number of sites")
+    parser.add_argument("-variables", type=int, default=configurations.distinct_variable_counts,
+                        help="number of distinct variables")
+    parser.add_argument("-placement", type=str, choices=["default", "range", "hash"],
+                        default=configurations.placement, help="how variables are placed on sites")
+    parser.add_argument("-replication", type=int, default=configurations.replication_factor,
+                        help="number of sites holding each variable (range and hash placements)")
+    parser.add_argument("-storage", type=str, choices=["list", "compact"], default=configurations.storage,
+                        help="'compact' stores only the variables of each site in arrays (large variable spaces)")
+    parser.add_argument("-format", type=str, choices=["table", "text", "jsonl", "null"],
+                        default=configurations.output_format, dest="output_format",
+                        help="'table' prints pretty tables, 'text' one short line per event, 'jsonl' one JSON object "
+                             "per event, 'null' nothing")
+    parser.add_argument("-deadlock", type=str, choices=["eager", "periodic", "wait-die", "wound-wait"],
+                        default=configurations.deadlock_policy, dest="deadlock_policy",
+                        help="'eager' detects deadlocks after every read and write, 'periodic' every "
+                             "-deadlock_interval ticks, 'wait-die' and 'wound-wait' prevent them")
+    parser.add_argument("-deadlock_interval", type=int, default=configurations.deadlock_interval,
+                        help="number of ticks between two deadlock detections of the 'periodic' policy")
+    parser.add_argument("-group_commit", action="store_true", default=configurations.group_commit,
+                        help="transactions committing in the same tick release their locks together")
+    parser.add_argument("-wal", type=str, default=configurations.wal_dir, dest="wal_dir",
+                        help="directory of the write-ahead logs of the sites, the committed state is recovered from it, "
+                             "each case of 'f' and 'd' modes has its own logs in <dir>/<test file>/case<k>")
+    parser.add_argument("-wal_sync_batch", type=int, default=configurations.wal_sync_batch,
+                        help="number of log records between two fsync")
+    parser.add_argument("-wal_checkpoint", type=int, default=configurations.wal_checkpoint_interval,
+                        dest="wal_checkpoint_interval", help="number of log records between two checkpoints")
+    parser.add_argument("-commit", type=str, choices=["local", "2pc"], default=configurations.commit_protocol,
+                        dest="commit_protocol",
+                        help="'local' applies a commit at once, '2pc' runs a two-phase commit with the sites")
+    parser.add_argument("-message_delay", type=int, default=configurations.message_delay,
+                        help="number of ticks a message of the two-phase commit takes to arrive")
+    parser.add_argument("-replica", type=str, choices=["first", "round-robin", "least-locked", "random", "affinity"],
+                        default=configurations.replica_selection, dest="replica_selection",
+                        help="which replica serves a read of a replicated variable")
+    parser.add_argument("-replica_seed", type=int, default=configurations.replica_seed,
+                        help="random seed of the 'random' replica selection")
+    parser.add_argument("-shards", type=int, default=configurations.shards,
+                        help="number of worker processes holding the data of the sites, 0 keeps them in this process, "
+                             "meant to partition the memory of large simulations, it does not improve throughput")
+    parser.add_argument("-version_gc_interval", type=int, default=configurations.version_gc_interval,
+                        help="ticks between two garbage collections of the versions no read-only transaction can "
+                             "read, 0 disables the collection")
+    parser.add_argument("-metrics", action="store_true", default=configurations.metrics,
+                        help="record counters and latency histograms, reported by the 'metrics' command of 'i' mode "
+                             "and in the results of 'bench' mode")
+    parser.add_argument("-j", type=int, default=1, dest="jobs",
+                        help="number of worker processes running test cases in parallel ('f', 'd' and 'verify' modes)")
+    parser.add_argument("-reference", type=str,
+                        help="expected results of 'verify' mode, a file for an input file or a directory of results "
+                             "named after the test files for an input directory (as written by 'd' mode)")
+    parser.add_argument("-trace", action="store_true",
+                        help="record a binary trace of each output file ('f' and 'd' modes), saved as "
+                             "<output file>.trace, which 'replay' mode re-executes")
+    server_args = parser.add_argument_group("server mode", "address the server listens on")
+    server_args.add_argument("-host", type=str, default="127.0.0.1", help="TCP host")
+    server_args.add_argument("-port", type=int, default=7070, help="TCP port")
+    server_args.add_argument("-unix", type=str, default=None, help="Unix socket path, used instead of TCP")
+    bench_args = parser.add_argument_group("bench mode", "parameters of the generated workload")
+    bench_args.add_argument("-transactions", type=int, default=1000, help="number of transactions")
+    bench_args.add_argument("-concurrency", type=int, default=10, help="number of concurrent transactions")
+    bench_args.add_argument("-ops", type=int, default=5, dest="operations_per_transaction",
+                            help="mean number of reads and writes per transaction")
+    bench_args.add_argument("-read_ratio", type=float, default=0.7, help="fraction of reads in read-write transactions")
+    bench_args.add_argument("-readonly", type=float, default=0.1, dest="readonly_fraction",
+                            help="fraction of read-only transactions")
+    bench_args.add_argument("-skew", type=float, default=0.0, help="Zipf exponent of the accessed variables, 0 is uniform")
+    bench_args.add_argument("-fail_rate", type=float, default=0.0, help="probability of a site failure per operation")
+    bench_args.add_argument("-recover_rate", type=float, default=0.1,
+                            help="probability of a failed site recovering per operation")
+    bench_args.add_argument("-seed", type=int, default=0, help="random seed of the workload")
+    bench_args.add_argument("-repeat", type=int, default=1, help="number of runs, the best one is reported")
+    bench_args.add_argument("-batch", type=int, default=1,
+                            help="number of consecutive operations sharing a tick (TransactionManager.step_batch)")
     args = parser.parse_args()
 
+    configurations.lock_mode = args.lock_mode
+    configurations.number_of_sites = args.sites
+    configurations.distinct_variable_counts = args.variables
+    configurations.placement = args.placement
+    configurations.replication_factor = args.replication
+    configurations.storage = args.storage
+    configurations.version_gc_interval = args.version_gc_interval
+    configurations.output_format = args.output_format
+    configurations.metrics = args.metrics
+    configurations.deadlock_policy = args.deadlock_policy
+    configurations.deadlock_interval = args.deadlock_interval
+    configurations.group_commit = args.group_commit
+    configurations.wal_dir = args.wal_dir
+    configurations.wal_sync_batch = args.wal_sync_batch
+    configurations.wal_checkpoint_interval = args.wal_checkpoint_interval
+    configurations.commit_protocol = args.commit_protocol
+    configurations.message_delay = args.message_delay
+    configurations.replica_selection = args.replica_selection
+    configurations.replica_seed = args.replica_seed
+    configurations.shards = args.shards
+    if args.shards > 0 and args.jobs > 1:
+        parser.error("-shards can not be combined with -j, the shards are child processes of the simulation")
+    if args.wal_dir and args.jobs > 1:
+        parser.error("-wal can not be combined with -j, the workers would share the logs of the sites")
+    if args.wal_dir and args.mode == "verify":
+        parser.error("-wal can not be combined with 'verify' mode, the cases would recover the state of previous "
+                     "runs and diverge from the reference")
+    if args.trace and args.jobs > 1:
+        parser.error("-trace can not be combined with -j, a trace follows the transaction manager of one process")
+    if args.trace and args.mode == "f" and args.output in (None, "-"):
+        parser.error("-trace needs an output file, the trace is saved next to it")
+
     mode, input_src, output_src = args.mode, args.input, args.output
 
     if args.mode == "f":
-        run_file(input_src, output_src)
+        run_files([(input_src, output_src)], args.jobs, args.trace)
 
     elif args.mode == "d":
         files = os.listdir(input_src)
 
         try:
             os.mkdir(output_src)
-        except Exception as e:
+        except FileExistsError:
             print("Directory already exists, ignore")
 
-        for file_name in files:
-            if file_name.endswith(".txt"):
+        pairs = []
+        for file_name in sorted(files):
+            if file_name.endswith(".txt") or file_name.endswith(".txt.gz"):
                 input_file_name = os.path.join(input_src, file_name)
-                output_file_name = os.path.join(output_src, file_name)
-                run_file(input_file_name, output_file_name)
+                # results of compressed traces are written uncompressed
+                output_file_name = os.path.join(output_src, file_name[:-3] if file_name.endswith(".gz") else file_name)
+                pairs.append((input_file_name, output_file_name))
+        run_files(pairs, args.jobs, args.trace)
 
     elif args.mode == "i":
         run_interactive()
 
+    elif args.mode == "verify":
+        from utils.verify import verify_files
+
+        if input_src is None or args.reference is None:
+            parser.error("'verify' mode needs -input and -reference")
+        if os.path.isdir(input_src):
+            pairs = [(os.path.join(input_src, file_name),
+                      os.path.join(args.reference, file_name[:-3] if file_name.endswith(".gz") else file_name))
+                     for file_name in sorted(os.listdir(input_src))
+                     if file_name.endswith(".txt") or file_name.endswith(".txt.gz")]
+        else:
+            pairs = [(input_src, args.reference)]
+
+        f = open_output(output_src)
+        try:
+            total, diverged = verify_files(pairs, args.jobs, f)
+        finally:
+            if f is not sys.stdout:
+                f.close()
+        sys.exit(1 if diverged else 0)
+
+    elif args.mode == "replay":
+        f = open_output(output_src)
+        stdout = sys.stdout
+        try:
+            sys.stdout = f
+            replay_file(input_src)
+        finally:
+            sys.stdout = stdout
+            if f is not stdout:
+                f.close()
+
+    elif args.mode == "bench":
+        from utils.bench import bench
+        from utils.workload import WorkloadGenerator
+
+        generator = WorkloadGenerator(args.transactions, args.concurrency, args.operations_per_transaction,
+                                      args.read_ratio, args.readonly_fraction, args.skew, args.fail_rate,
+                                      args.recover_rate, configurations.number_of_sites,
+                                      configurations.distinct_variable_counts, args.seed)
+        f = open_output(output_src)
+        try:
+            json.dump(bench(generator, args.repeat, args.batch), f, indent=2)
+            f.write("\n")
+        finally:
+            if f is not sys.stdout:
+                f.close()
+
+    elif args.mode == "server":
+        from utils.server import run_server
+        run_server(args.host, args.port, args.unix)
+
 
 
 
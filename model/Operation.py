@@ -1,24 +1,39 @@
-import re
-from . import Operation, print_result, parse_variable_id, do_read
+import sys
+from . import Operation, parse_variable_id, do_read
 from model.Transaction import Transaction
-from configurations import *
 
-TABLE_HEADERS = ["Site Name"] + [f"x{i}" for i in range(1, distinct_variable_counts + 1)]
+# Operations whose first parameter is an existing transaction
+TRANSACTION_OPERATIONS = {"R", "W", "end"}
 
 
 class OperationParser(object):
-    reg_pattern = r"(.*)\((.*?)\)"
-
     @staticmethod
     def parse(line):
         """
-        Extract operation type and parameters out from a textual parameter
+        Extract operation type and parameters out from a textual parameter, anything after the closing parenthesis
+        (for example a comment) is ignored. Operation types and parameters are interned, so transaction and variable
+        ids of different operations share the same string objects
 
         :param line: A textual operation, for example "begin(T1)"
         :return: (operation type, parameters)
         """
-        res = re.search(OperationParser.reg_pattern, line)
-        return res.group(1), [s.strip() for s in res.group(2).split(",")]
+        op_t, sep, rest = line.partition("(")
+        para, sep2, _ = rest.partition(")")
+        if not sep or not sep2:
+            raise ValueError(f"Can not parse operation: {line}")
+
+        return sys.intern(op_t.strip()), [sys.intern(s.strip()) for s in para.split(",")]
+
+    @staticmethod
+    def parse_many(lines):
+        """
+        Parse a whole test case into operation objects
+
+        :param lines: An iterable of textual operations
+        :return: A list of operations
+        """
+        parse, create = OperationParser.parse, OperationCreator.create
+        return [create(*parse(line)) for line in lines]
 
 
 class Begin(Operation):
@@ -57,20 +72,15 @@ class BeginRO(Operation):
         :param tm: Transaction Manager
         :return: True
         """
-        trans = Transaction(self.para[0], tick, True)
+        trans = Transaction(self.para[0], tick, True, tm.sub_tick)
 
         if trans.transaction_id in tm.transactions:
             raise KeyError(f"Dupilcated transaction {trans.transaction_id}")
         else:
+            # no snapshot is taken, read-only reads resolve the version visible at the start tick of the
+            # transaction from the version chains kept by each data manager
             tm.transactions[trans.transaction_id] = trans
-            # take snapshot for each site at current tick
-            for site in tm.sites:
-                # only take snapshot when site is up
-
-                # All sites will take snapshot, but only the variable is accessible will be included in the
-                # snapshot which means for fail site, only non replicated data will be included
-                # for up sites all accessible variable will be included in the snapshot
-                site.snapshot(tick)
+            tm.active_readonly[trans.transaction_id] = tick
 
         return True
 
@@ -80,6 +90,10 @@ class Read(Operation):
         super().__init__(para)
         Operation.__setattr__(self, "op_t", "R")
 
+        # typed parameters, parsed once
+        self.trans_id, self.var_name = para[0], para[1]
+        _, self.var_id = parse_variable_id(self.var_name)
+
     def execute(self, tick: int, tm, retry=False):
         """
         Execute the read operation, for both read and readonly
@@ -92,26 +106,26 @@ class Read(Operation):
         if not retry:
             self.save_to_transaction(tm)
 
-        trans_id, var_id_str = self.para[0], self.para[1]
-        _, var_id = parse_variable_id(var_id_str)
+        trans_id, var_id_str, var_id = self.trans_id, self.var_name, self.var_id
+        replication_map = tm.replication_map
         # Case 1: read_only transaction
         if tm.transactions[trans_id].is_readonly:
-            trans_start_tick = tm.transactions[trans_id].tick
-            # Situation 1.1: if the index of variable read is odd, then we just need to check specific site
-            # we do not abort the transaction because we know this variable can only be accessed by one site,
-            # if the site is down, we just need to wait it recover and we can get the value
-            if var_id % 2 != 0:
-                site = tm.get_site(var_id % number_of_sites + 1)
+            trans_start_tick, trans_sub_tick = tm.transactions[trans_id].tick, tm.transactions[trans_id].sub_tick
+            # Situation 1.1: if the variable is not replicated (odd index by default), then we just need to check
+            # specific site, we do not abort the transaction because we know this variable can only be accessed by
+            # one site, if the site is down, we just need to wait it recover and we can get the value
+            if not replication_map.is_replicated(var_id):
+                site = tm.get_site(replication_map.home_site(var_id))
                 if not site.up:
                     return False
-                elif var_id in site.snapshots[trans_start_tick] and var_id in site.snapshots[trans_start_tick]:
-                    headers = ["Transaction", "Site", var_id_str]
-                    # Only one row here
-                    rows = [[trans_id, f"{site.site_id}", f"{site.get_snapshot_variable(trans_start_tick, var_id)}"]]
-                    print_result(headers, rows)
+
+                readable, value = site.read_version(trans_start_tick, var_id, trans_sub_tick)
+                if readable:
+                    tm.sink.read(trans_id, site.site_id, var_id, value)
                     return True
 
-            # Situation 1.2: if the index of variable read is even, we check the first available site to read
+            # Situation 1.2: if the variable is replicated (even index by default), we check the first available site
+            # to read
             # if we can not access the variable from all up sites, abort the read-only transaction,
             # by the definition:
             #       If xi is replicated then RO can read xi from site s if xi was committed
@@ -119,8 +133,8 @@ class Read(Operation):
             #       xi was commited and RO began.
             # This indicates we can not read any value (if the value had not been changed and committed by a transaction
             # after the site recovered) from a site fail and recover before the RO transaction began, any value had been
-            # changed and committed by a transaction will be accessible, the logic is coded in site.snapshot and
-            # site.fail.
+            # changed and committed by a transaction will be accessible, the logic is coded in the version chains
+            # of DataManager (commit_variable and disable_accessibility).
             # Note: if we could not access the replicated value from all up sites, then we abort the transaction,
             # because even the site with the latest committed value recover later than RO began,
             # by definition above and how we read data:
@@ -132,46 +146,96 @@ class Read(Operation):
             # transaction.
             else:
                 has = False
-                for site in tm.sites:
+                for site_id in tm.replica_selector.order(trans_id, var_id, replication_map.sites_of(var_id)):
+                    site = tm.get_site(site_id)
+                    readable, value = site.read_version(trans_start_tick, var_id, trans_sub_tick)
                     # if the site has the variable is down, has -> True, we could retry latter
-                    if not site.up and trans_start_tick in site.snapshots and var_id in site.snapshots[trans_start_tick]:
+                    if not site.up and readable:
                         has = True
-                    elif trans_start_tick in site.snapshots and var_id in site.snapshots[trans_start_tick]:
-                        headers = ["Transaction", "Site", var_id_str]
-                        # Only one row here
-                        rows = [[trans_id, f"{site.site_id}", f"{site.get_snapshot_variable(trans_start_tick, var_id)}"]]
-                        print_result(headers, rows)
+                    elif readable:
+                        tm.replica_selector.served(site_id)
+                        tm.sink.read(trans_id, site.site_id, var_id, value)
                         return True
-                # No site has the variable in the snapshot
+                # No site has a readable version of the variable
                 if not has:
                     tm.abort(trans_id, 3)
                     return True
-        # Case 2: typical transaction and the index of variable read is odd, then we just need to check specific site
-        elif var_id % 2 != 0:
-            site = tm.get_site(var_id % number_of_sites + 1)
+        # Case 2: typical transaction and the variable is not replicated, then we just need to check specific site
+        elif not replication_map.is_replicated(var_id):
+            site = tm.get_site(replication_map.home_site(var_id))
             if not site.up:
                 return False
             elif site.data_manager.check_accessibility(var_id):
-                if site.lock_manager.try_lock_variable(trans_id, var_id_str, 0):
-                    return do_read(trans_id, var_id, site)
+                if tm.try_lock(site, trans_id, var_id_str, 0):
+                    return do_read(trans_id, var_id, site, tm.sink)
                 else:
                     return False
-        # Case 3: typical transaction and the index of variable read is even,
+        # Case 3: typical transaction and the variable is replicated, the replicas are tried in the order given by
+        # the replica selection policy
         else:
-            for site in tm.sites:
+            first_accessible = None
+            for site_id in tm.replica_selector.order(trans_id, var_id, replication_map.sites_of(var_id)):
+                site = tm.get_site(site_id)
                 if not site.up:
                     continue
                 elif site.data_manager.check_accessibility(var_id):
-                    if site.lock_manager.try_lock_variable(trans_id, var_id_str, 0):
-                        return do_read(trans_id, var_id, site)
+                    # do not queue in every replica, only in the first one if no replica can be read now
+                    if tm.try_lock(site, trans_id, var_id_str, 0, False):
+                        tm.replica_selector.served(site_id)
+                        return do_read(trans_id, var_id, site, tm.sink)
+                    elif first_accessible is None:
+                        first_accessible = site
+
+            if first_accessible is not None and first_accessible.lock_manager.queued:
+                tm.try_lock(first_accessible, trans_id, var_id_str, 0)
         return False
 
+    def get_wait_keys(self, tm):
+        """
+        A read waits for its site (non replicated variable) or any site (replicated variable) to recover, a read of
+        a typical transaction also waits for locks on the variable to be released
+
+        :param tm: Transaction Manager
+        :return: A list of keys
+        """
+        trans_id, var_id_str, var_id = self.trans_id, self.var_name, self.var_id
+        replication_map = tm.replication_map
+        if replication_map.is_replicated(var_id):
+            site_key = ("site", None)
+        else:
+            site_key = ("site", replication_map.home_site(var_id))
+
+        if tm.transactions[trans_id].is_readonly:
+            return [site_key]
+        return [("var", var_id_str), site_key]
+
+    def get_conflicting_transactions(self, tm):
+        """
+        A read of a typical transaction conflicts with the write locks on the variable at the up sites where it is
+        readable, a read-only transaction never waits for locks
+
+        :param tm: Transaction Manager
+        :return: A set of transaction ids
+        """
+        conflicts = set()
+        if tm.transactions[self.trans_id].is_readonly:
+            return conflicts
+        for site_id in tm.replication_map.sites_of(self.var_id):
+            site = tm.get_site(site_id)
+            if site.up and site.data_manager.check_accessibility(self.var_id):
+                conflicts |= site.lock_manager.get_conflicting_transactions(self.trans_id, self.var_name, 0)
+        return conflicts
+
 
 class Write(Operation):
     def __init__(self, para):
         super().__init__(para)
         Operation.__setattr__(self, "op_t", "W")
 
+        # typed parameters, parsed once
+        self.trans_id, self.var_name, self.value = para[0], para[1], int(para[2])
+        _, self.var_id = parse_variable_id(self.var_name)
+
     def execute(self, tick: int, tm, retry=False):
         """
         Execute Write operation
@@ -184,41 +248,48 @@ class Write(Operation):
         if not retry:
             self.save_to_transaction(tm)
 
-        trans_id, var_id_str, write_value = self.para[0], self.para[1], int(self.para[2])
-        _, var_id = parse_variable_id(var_id_str)
+        trans_id, var_id_str, var_id, write_value = self.trans_id, self.var_name, self.var_id, self.value
+        replication_map = tm.replication_map
 
-        # Case 1: variable id is odd
-        if var_id % 2 != 0:
-            site = tm.get_site(var_id % number_of_sites + 1)
+        # Case 1: variable is not replicated (odd index by default)
+        if not replication_map.is_replicated(var_id):
+            site = tm.get_site(replication_map.home_site(var_id))
             # Situation 1.1: Site failed, return false
             if not site.up:
                 # print(f"Site {site.site_id} is down, {self}")
                 return False
             # Situation 1.2: Site up and lock variable succeed, return true
-            elif site.lock_manager.try_lock_variable(trans_id, var_id_str, 1):
-                logs = site.data_manager.log.get(trans_id, {})
-                logs[var_id] = write_value
-                site.data_manager.log[trans_id] = logs
+            elif tm.try_lock(site, trans_id, var_id_str, 1):
+                site.data_manager.write_uncommitted(trans_id, var_id, write_value)
                 return True
             # Situation 1.3: Site up, but lock variable failed, return false
             else:
                 # print(f"Site {site.site_id} is up, but can not get the lock, {self}")
                 return False
-        # Case 2: variable id is even, need to get locks of all available sites
+        # Case 2: variable is replicated (even index by default), need to get locks of all available sites
         else:
             locked_sites = []
+            # (site, lock held before this write) of the sites locked so far
+            previous_locks = []
             # Try to lock all sites have given variable
-            for site in tm.sites:
+            for site_id in replication_map.sites_of(var_id):
+                site = tm.get_site(site_id)
                 # ignore fail sites
                 if not site.up:
                     continue
+                previous = site.lock_manager.get_lock_type(trans_id, var_id_str)
                 # try to lock the variable in health site and append it to locked sites
-                elif site.lock_manager.try_lock_variable(trans_id, var_id_str, 1):
+                if tm.try_lock(site, trans_id, var_id_str, 1):
                     locked_sites.append(site)
-                # if lock conflicting in any health site, release all locks added previously
+                    previous_locks.append((site, previous))
+                # if lock conflicting in any health site, undo the locks added or promoted previously, the locks the
+                # transaction held before this write are kept
                 else:
-                    for locked_site in locked_sites:
-                        locked_site.try_unlock_variable(var_id_str, trans_id)
+                    for locked_site, previous in previous_locks:
+                        if previous is None:
+                            locked_site.lock_manager.try_unlock_variable(var_id_str, trans_id)
+                        elif previous == 0:
+                            locked_site.lock_manager.demote_variable(var_id_str, trans_id)
                     # print(f"Can not get all exclusive locks for a site-wide variable, {self}")
                     return False
 
@@ -229,12 +300,39 @@ class Write(Operation):
             # At this point, we can guarantee that program has got all necessary locks for the write operation
             # Perform write operation on all locked sites
             for locked_site in locked_sites:
-                logs = locked_site.data_manager.log.get(trans_id, {})
-                logs[var_id] = write_value
-                locked_site.data_manager.log[trans_id] = logs
+                locked_site.data_manager.write_uncommitted(trans_id, var_id, write_value)
 
             return True
 
+    def get_wait_keys(self, tm):
+        """
+        A write waits for locks on the variable to be released and for the site(s) holding the variable to recover
+
+        :param tm: Transaction Manager
+        :return: A list of keys
+        """
+        var_id_str, var_id = self.var_name, self.var_id
+        replication_map = tm.replication_map
+        if replication_map.is_replicated(var_id):
+            site_key = ("site", None)
+        else:
+            site_key = ("site", replication_map.home_site(var_id))
+        return [("var", var_id_str), site_key]
+
+    def get_conflicting_transactions(self, tm):
+        """
+        A write conflicts with every other lock on the variable at the up sites holding it
+
+        :param tm: Transaction Manager
+        :return: A set of transaction ids
+        """
+        conflicts = set()
+        for site_id in tm.replication_map.sites_of(self.var_id):
+            site = tm.get_site(site_id)
+            if site.up:
+                conflicts |= site.lock_manager.get_conflicting_transactions(self.trans_id, self.var_name, 1)
+        return conflicts
+
 
 class Dump(Operation):
     def __init__(self, para):
@@ -250,8 +348,7 @@ class Dump(Operation):
         :param tm: Transaction Manager
         :return: True
         """
-        rows = [site.echo() for site in tm.sites]
-        print_result(TABLE_HEADERS, rows)
+        tm.sink.dump(tm.sites)
         return True
 
 
@@ -275,8 +372,14 @@ class Fail(Operation):
 
         # Flag transaction to be aborted when commit
         for trans_id in transactions:
+            # a transaction aborted by a two-phase commit holds its locks until the decision reaches the site
+            if trans_id not in tm.transactions:
+                continue
             tm.transactions[trans_id].to_be_aborted = True
-        site.fail()
+            # a blocked commit of the transaction can abort now
+            tm.notify(("trans", trans_id))
+        site.fail(tick, tm.sub_tick)
+        tm.notify_site_changed(site_id)
         return True
 
 
@@ -295,6 +398,7 @@ class Recover(Operation):
         """
         site_id = int(self.para[0])
         tm.get_site(site_id).recover()
+        tm.notify_site_changed(site_id)
         return True
 
 
@@ -325,36 +429,41 @@ class End(Operation):
 
         # commit all changes made by given transaction
         trans_id = self.para[0]
-        trans_start_time = tm.transactions[trans_id].tick
 
         # If there are blocked operation of the commit transaction, block the commit
         if trans_id in tm.blocked_transactions:
             return False
 
-        print(f"Transaction {trans_id} commit")
+        # two-phase commit, the outcome is reported when the votes of the sites reach the coordinator
+        if tm.coordinator is not None:
+            tm.coordinator.start(trans_id, tick)
+            return True
 
-        for site in tm.sites:
-            # Check if the site has changed by the given transaction
-            if site.up and trans_id in site.data_manager.log:
-                change_logs = site.data_manager.log[trans_id]
-                for var_id, val in change_logs.items():
-                    site.data_manager.set_variable(var_id, val)
-                    site.data_manager.is_accessible[var_id - 1] = True
-                # delete the change, because commit
-                site.data_manager.log.pop(trans_id)
-            # when readonly transaction end, delete the snapshot belongs to it
-            elif site.up and trans_start_time in site.snapshots:
-                site.snapshots.pop(trans_start_time)
+        tm.transactions[trans_id].committed = True
+        tm.sink.commit(trans_id)
+        if tm.metrics is not None:
+            tm.metrics.inc("commits")
 
-            site.lock_manager.release_transaction_locks(trans_id)
+        # apply the write sets and release the locks, only at the sites the transaction accessed
+        tm.commit(trans_id, tick)
 
-        if trans_id in tm.blocked_transactions:
-            tm.transactions.remove(trans_id)
+        # versions kept for a read-only transaction can be collected once it ends
+        tm.active_readonly.pop(trans_id, None)
         # When transaction commit, we need to remove the transaction in the wait for graph
         tm.wait_for_graph.remove_transaction(trans_id)
 
         return True
 
+    def get_wait_keys(self, tm):
+        """
+        A commit waits for the blocked operations of its transaction to clear (or for the transaction to be flagged
+        to be aborted)
+
+        :param tm: Transaction Manager
+        :return: A list of keys
+        """
+        return [("trans", self.para[0])]
+
 
 class OperationCreator(object):
     types = {
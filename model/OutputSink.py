@@ -0,0 +1,239 @@
+import json
+
+# Human readable message and short machine readable code of each abort type, see TransactionManager.abort
+ABORT_MESSAGES = {
+    1: "site failure",
+    2: "deadlock",
+    3: "read-only, no version available of the variable to read",
+    4: "deadlock prevention",
+    5: "client disconnected"
+}
+ABORT_CODES = {
+    1: "site_failure",
+    2: "deadlock",
+    3: "no_version",
+    4: "prevention",
+    5: "disconnected"
+}
+
+
+class OutputSink(object):
+    """
+    Receive the observable events of a simulation (reads, commits, aborts, dumps) and decide how they are reported,
+    operations and the transaction manager never print by themselves
+
+    :param self.stream: A writable text stream, None means the current sys.stdout
+    """
+
+    def __init__(self, stream=None):
+        self.stream = stream
+
+    def case(self, case_id):
+        """
+        A new test case starts
+
+        :param case_id: the index of the case in its file, starting from 1
+        :return: None
+        """
+        pass
+
+    def read(self, trans_id, site_id, var_id, value):
+        """
+        A transaction read a variable
+
+        :param trans_id: transaction id
+        :param site_id: the site the value was read from
+        :param var_id: variable id (integer)
+        :param value: the value read
+        :return: None
+        """
+        pass
+
+    def commit(self, trans_id):
+        """
+        A transaction committed
+
+        :param trans_id: transaction id
+        :return: None
+        """
+        pass
+
+    def abort(self, trans_id, abort_type):
+        """
+        A transaction aborted
+
+        :param trans_id: transaction id
+        :param abort_type: 1 => site fail, 2 => dead lock, 3 => read-only no available version,
+                           4 => deadlock prevention, 5 => client disconnected (server mode)
+        :return: None
+        """
+        pass
+
+    def dump(self, sites):
+        """
+        Report the committed values of every site
+
+        :param sites: A list of sites
+        :return: None
+        """
+        pass
+
+    def ignored(self, operation):
+        """
+        Report an operation of a transaction which does not exist (never began, or aborted before the operation was
+        issued), the operation is not executed
+
+        :param operation: Operation object
+        :return: None
+        """
+        pass
+
+    def stalled(self, operations):
+        """
+        Report the operations left blocked when a test case can not terminate
+
+        :param operations: An iterable of operations
+        :return: None
+        """
+        pass
+
+
+class NullSink(OutputSink):
+    """
+    Discard every event, used when only the final state or the metrics of a simulation matter
+    """
+    pass
+
+
+class PrettyTableSink(OutputSink):
+    """
+    The original output format, each read and each dump is printed as a table
+    """
+
+    def case(self, case_id):
+        print(f"Test {case_id} Result", file=self.stream)
+
+    def read(self, trans_id, site_id, var_id, value):
+        print_table(["Transaction", "Site", f"x{var_id}"], [[trans_id, f"{site_id}", f"{value}"]], self.stream)
+
+    def commit(self, trans_id):
+        print(f"Transaction {trans_id} commit", file=self.stream)
+
+    def abort(self, trans_id, abort_type):
+        print(f"Transaction {trans_id} aborted ({ABORT_MESSAGES[abort_type]})", file=self.stream)
+
+    def dump(self, sites):
+        headers = ["Site Name"] + [f"x{i}" for i in range(1, len(sites[0].data_manager.dump_values()) + 1)]
+        print_table(headers, [site.echo() for site in sites], self.stream)
+
+    def ignored(self, operation):
+        print(f"Operation {operation} ignored, transaction {operation.para[0]} does not exist", file=self.stream)
+
+    def stalled(self, operations):
+        print("Following operation can not be executed, maybe the test case is not terminable:", file=self.stream)
+        for op in operations:
+            print(op, file=self.stream)
+
+
+class TextSink(OutputSink):
+    """
+    One short line per event, for example "R T1 x2 20 @1", "C T1", "A T2 deadlock", "I W(T2,x1,5)", a dump prints one
+    line per site with the variables held by the site only
+    """
+
+    def case(self, case_id):
+        print(f"Test {case_id} Result", file=self.stream)
+
+    def read(self, trans_id, site_id, var_id, value):
+        print(f"R {trans_id} x{var_id} {value} @{site_id}", file=self.stream)
+
+    def commit(self, trans_id):
+        print(f"C {trans_id}", file=self.stream)
+
+    def abort(self, trans_id, abort_type):
+        print(f"A {trans_id} {ABORT_CODES[abort_type]}", file=self.stream)
+
+    def dump(self, sites):
+        for site in sites:
+            values = " ".join(f"x{i}={val}" for i, val in enumerate(site.data_manager.dump_values(), 1)
+                              if val is not None)
+            print(f"D {site.site_id} {'up' if site.up else 'down'} {values}", file=self.stream)
+
+    def ignored(self, operation):
+        print(f"I {operation}", file=self.stream)
+
+    def stalled(self, operations):
+        for op in operations:
+            print(f"S {op}", file=self.stream)
+
+
+class JsonLinesSink(OutputSink):
+    """
+    One JSON object per event, for example {"event": "read", "trans": "T1", "var": "x2", "value": 20, "site": 1}
+    """
+
+    def _emit(self, event):
+        print(json.dumps(event), file=self.stream)
+
+    def case(self, case_id):
+        self._emit({"event": "case", "case": case_id})
+
+    def read(self, trans_id, site_id, var_id, value):
+        self._emit({"event": "read", "trans": trans_id, "var": f"x{var_id}", "value": value, "site": site_id})
+
+    def commit(self, trans_id):
+        self._emit({"event": "commit", "trans": trans_id})
+
+    def abort(self, trans_id, abort_type):
+        self._emit({"event": "abort", "trans": trans_id, "reason": ABORT_CODES[abort_type]})
+
+    def dump(self, sites):
+        for site in sites:
+            values = {f"x{i}": val for i, val in enumerate(site.data_manager.dump_values(), 1) if val is not None}
+            self._emit({"event": "dump", "site": site.site_id, "up": site.up, "values": values})
+
+    def ignored(self, operation):
+        self._emit({"event": "ignored", "operation": str(operation)})
+
+    def stalled(self, operations):
+        self._emit({"event": "stalled", "operations": [str(op) for op in operations]})
+
+
+def print_table(headers, rows, stream=None):
+    """
+    Print the rows using pretty table
+
+    :param headers: table headers
+    :param rows: table rows
+    :param stream: A writable text stream, None means the current sys.stdout
+    :return: None
+    """
+    # only this output format needs prettytable
+    from prettytable import PrettyTable
+
+    table = PrettyTable()
+    table.field_names = headers
+    for row in rows:
+        table.add_row(row)
+    print(table, file=stream)
+
+
+SINKS = {
+    "table": PrettyTableSink,
+    "text": TextSink,
+    "jsonl": JsonLinesSink,
+    "null": NullSink
+}
+
+
+def create_sink(kind, stream=None):
+    """
+    Create the output sink of a simulation
+
+    :param kind: "table", "text", "jsonl" or "null"
+    :param stream: A writable text stream, None means the current sys.stdout
+    :return: OutputSink
+    """
+    if kind not in SINKS:
+        raise KeyError(f"Unknown output format: {kind}")
+    return SINKS[kind](stream)
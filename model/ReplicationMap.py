@@ -0,0 +1,191 @@
+import configurations
+
+
+class ReplicationMap(object):
+    """
+    Decide which sites hold each variable, every component (data managers, operations) asks the same shared instance
+    instead of computing the placement by itself
+
+    A variable held by more than one site is a replicated variable, it follows the available copies rules
+    (write all available copies, read any readable copy, not readable after recovery until a new commit)
+
+    :param self.number_of_sites: the number of sites in the simulation
+    :param self.variable_counts: the number of distinct variables, ids are 1 to variable_counts
+    """
+
+    def __init__(self, number_of_sites, variable_counts):
+        if number_of_sites < 1:
+            raise ValueError(f"Invalid number of sites: {number_of_sites}")
+        if variable_counts < 1:
+            raise ValueError(f"Invalid number of variables: {variable_counts}")
+
+        self.number_of_sites = number_of_sites
+        self.variable_counts = variable_counts
+
+    def sites_of(self, var_id):
+        """
+        Get the sites holding given variable
+
+        :param var_id: variable id
+        :return: A list of site ids in increasing order
+        """
+        raise NotImplementedError
+
+    def variables_of(self, site_id):
+        """
+        Get the variables held by given site
+
+        :param site_id: site id
+        :return: An iterable of variable ids in increasing order
+        """
+        raise NotImplementedError
+
+    def is_replicated(self, var_id):
+        """
+        Check if the variable is held by more than one site
+
+        :param var_id: variable id
+        :return: True or False
+        """
+        return len(self.sites_of(var_id)) > 1
+
+    def home_site(self, var_id):
+        """
+        Get the only site holding a non replicated variable
+
+        :param var_id: variable id
+        :return: site id
+        """
+        return self.sites_of(var_id)[0]
+
+
+class DefaultReplicationMap(ReplicationMap):
+    """
+    The placement of the RepCRec specification: even variables are replicated at all sites, odd variable xi is only
+    at site (i mod number_of_sites) + 1
+    """
+
+    def __init__(self, number_of_sites, variable_counts):
+        super().__init__(number_of_sites, variable_counts)
+        self._all_sites = list(range(1, number_of_sites + 1))
+
+    def sites_of(self, var_id):
+        if var_id % 2 == 0:
+            return self._all_sites
+        return [var_id % self.number_of_sites + 1]
+
+    def is_replicated(self, var_id):
+        return var_id % 2 == 0
+
+    def home_site(self, var_id):
+        return var_id % self.number_of_sites + 1
+
+    def variables_of(self, site_id):
+        # odd variables whose residue modulo number_of_sites is site_id - 1, merged with all even variables
+        first = site_id - 1 if site_id > 1 else self.number_of_sites
+        odd = (i for i in range(first, self.variable_counts + 1, self.number_of_sites) if i % 2 != 0)
+        next_odd = next(odd, None)
+        for i in range(2, self.variable_counts + 1, 2):
+            while next_odd is not None and next_odd < i:
+                yield next_odd
+                next_odd = next(odd, None)
+            yield i
+        while next_odd is not None:
+            yield next_odd
+            next_odd = next(odd, None)
+
+
+class RangeReplicationMap(ReplicationMap):
+    """
+    Split variables into number_of_sites contiguous ranges, range k is held by site k and the next
+    replication_factor - 1 sites (wrapping around)
+
+    :param self.replication_factor: the number of sites holding each variable
+    """
+
+    def __init__(self, number_of_sites, variable_counts, replication_factor):
+        super().__init__(number_of_sites, variable_counts)
+        if not 1 <= replication_factor <= number_of_sites:
+            raise ValueError(f"Invalid replication factor: {replication_factor}")
+        self.replication_factor = replication_factor
+        self._range_size = -(-variable_counts // number_of_sites)
+
+    def _primary(self, var_id):
+        return (var_id - 1) // self._range_size
+
+    def sites_of(self, var_id):
+        primary = self._primary(var_id)
+        return sorted((primary + j) % self.number_of_sites + 1 for j in range(self.replication_factor))
+
+    def is_replicated(self, var_id):
+        return self.replication_factor > 1
+
+    def variables_of(self, site_id):
+        primaries = sorted((site_id - 1 - j) % self.number_of_sites for j in range(self.replication_factor))
+        for primary in primaries:
+            start = primary * self._range_size + 1
+            yield from range(start, min(start + self._range_size, self.variable_counts + 1))
+
+
+class HashReplicationMap(ReplicationMap):
+    """
+    Hash each variable to a primary site, the variable is held by the primary site and the next
+    replication_factor - 1 sites (wrapping around). The variables of each site are computed once when the map is built
+
+    :param self.replication_factor: the number of sites holding each variable
+    """
+
+    # Knuth's multiplicative hash
+    MULTIPLIER = 2654435761
+
+    def __init__(self, number_of_sites, variable_counts, replication_factor):
+        super().__init__(number_of_sites, variable_counts)
+        if not 1 <= replication_factor <= number_of_sites:
+            raise ValueError(f"Invalid replication factor: {replication_factor}")
+        self.replication_factor = replication_factor
+
+        self._site_variables = [[] for _ in range(number_of_sites)]
+        for var_id in range(1, variable_counts + 1):
+            for site_id in self.sites_of(var_id):
+                self._site_variables[site_id - 1].append(var_id)
+
+    def _primary(self, var_id):
+        return (var_id * self.MULTIPLIER % 2 ** 32) % self.number_of_sites
+
+    def sites_of(self, var_id):
+        primary = self._primary(var_id)
+        return sorted((primary + j) % self.number_of_sites + 1 for j in range(self.replication_factor))
+
+    def is_replicated(self, var_id):
+        return self.replication_factor > 1
+
+    def variables_of(self, site_id):
+        return self._site_variables[site_id - 1]
+
+
+PLACEMENTS = {
+    "default": lambda sites, variables, factor: DefaultReplicationMap(sites, variables),
+    "range": RangeReplicationMap,
+    "hash": HashReplicationMap
+}
+
+_shared = {}
+
+
+def get_replication_map():
+    """
+    Get the replication map described by configurations.py, it is built once and shared until the configuration
+    changes
+
+    :return: ReplicationMap
+    """
+    key = (configurations.placement, configurations.number_of_sites, configurations.distinct_variable_counts,
+           configurations.replication_factor)
+    if key not in _shared:
+        if configurations.placement not in PLACEMENTS:
+            raise KeyError(f"Unknown placement: {configurations.placement}")
+        _shared.clear()
+        _shared[key] = PLACEMENTS[configurations.placement](configurations.number_of_sites,
+                                                            configurations.distinct_variable_counts,
+                                                            configurations.replication_factor)
+    return _shared[key]
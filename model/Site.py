@@ -1,30 +1,30 @@
 from model.managers.DataManager import DataManager
 from model.managers.LockManager import LockManager
-from copy import deepcopy
+import configurations
 
 
 class Site(object):
-    def __init__(self, site_id):
+    def __init__(self, site_id, data_manager=None, wal_dir=None):
         self.site_id = site_id
-        self.data_manager = DataManager(site_id)
-        self.lock_manager = LockManager()
+        # the data may be held by a shard process (a RemoteDataManager, see model/managers/ShardPool.py)
+        self.data_manager = data_manager if data_manager is not None else DataManager(site_id, wal_dir)
+        self.lock_manager = LockManager(queued=configurations.lock_mode == "queued")
 
         # Flag to indicate site status
         self.up = True
-        # Snapshots for multi-version read consistency
-        self.snapshots = {}
 
-    def fail(self):
+    def fail(self, tick, sub_tick=0):
         """
         Change site status to false and clear all uncommitted changes in this site
 
+        :param tick: time of the failure
+        :param sub_tick: position of the failure in its batch, 0 outside of a batch
         :return: None
         """
         self.up = False
         self.data_manager.clear_uncommitted_changes()
         self.lock_manager.clear()
-        self.data_manager.disable_accessibility()
-        # self.snapshots = {}
+        self.data_manager.disable_accessibility(tick, sub_tick)
 
     def echo(self):
         """
@@ -33,7 +33,7 @@ class Site(object):
         :return: All variable values to prettyTable (which will be printed in dump operation)
         """
         prefix = f"Site {self.site_id} ({'up' if self.up else 'down'})"
-        return [prefix] + [v for v in self.data_manager.data]
+        return [prefix] + self.data_manager.dump_values()
 
     def recover(self):
         """
@@ -43,26 +43,13 @@ class Site(object):
         """
         self.up = True
 
-    def snapshot(self, tick):
+    def read_version(self, tick, var_id, sub_tick=0):
         """
-        For multi-version consistency, take snapshot of current data
+        For multi-version consistency, query the value of the variable committed before given tick
 
-        :param tick: time
-        :return: None
-        """
-        available_data = {}
-        for idx, d in enumerate(self.data_manager.data):
-            if d and self.data_manager.is_accessible[idx]:
-                available_data[idx + 1] = d
-
-        self.snapshots[tick] = deepcopy(available_data)
-
-    def get_snapshot_variable(self, tick, var_id):
-        """
-        Query variable data from snapshot of given tick
-
-        :param tick: time
+        :param tick: start time of the read-only transaction
         :param var_id: variable id
-        :return: variable value
+        :param sub_tick: position of the begin of the read-only transaction in its batch, 0 outside of a batch
+        :return: (True, value) if the variable can be read at the tick, otherwise (False, None)
         """
-        return self.snapshots[tick][var_id]
+        return self.data_manager.read_version(var_id, tick, sub_tick)
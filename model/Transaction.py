@@ -1,4 +1,7 @@
 
+from itertools import count
+
+
 class Transaction(object):
     """
     A class to represent transaction
@@ -7,8 +10,20 @@ class Transaction(object):
     :param self.is_readonly: True if the transaction is readonly otherwise False
     :param self.to_be_aborted: Whether this transaction is going to be aborted because of site failure
     :param self.tick: transaction start time
+    :param self.sub_tick: position of the begin of the transaction in its batch (see TransactionManager.step_batch), 0
+                          outside of a batch, a read-only transaction reads the versions committed before
+                          (tick, sub_tick)
+    :param self.start_order: (start time, creation sequence number), orders the transactions by age even when they
+                             started in the same tick (see TransactionManager.step_batch)
+    :param self.committed: Whether the commit of the transaction has been decided, with a two-phase commit its locks
+                           are held until the decision reaches every site
+    :param self.sites: A set of ids of the sites where the transaction requested locks (and wrote), commit and abort
+                       only visit these sites
     """
-    def __init__(self, identifier, tick, is_readonly=False):
+    # creation sequence numbers
+    _sequence = count()
+
+    def __init__(self, identifier, tick, is_readonly=False, sub_tick=0):
         self.transaction_id = identifier
         self.is_readonly = is_readonly
 
@@ -20,6 +35,12 @@ class Transaction(object):
 
         # Start time of this transaction
         self.tick = tick
+        self.sub_tick = sub_tick
+        self.start_order = (tick, next(Transaction._sequence))
+
+        self.committed = False
+
+        self.sites = set()
 
     def add_operation(self, operation):
         """
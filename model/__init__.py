@@ -1,4 +1,6 @@
-from prettytable import PrettyTable
+import re
+
+VARIABLE_ID_PATTERN = re.compile(r"(\D*)(\d+)$")
 
 
 class Operation(object):
@@ -25,6 +27,30 @@ class Operation(object):
         """
         pass
 
+    def get_wait_keys(self, tm):
+        """
+        Return the events a blocked operation is waiting for, the transaction manager only retries a blocked
+        operation after one of these events happened. Keys are tuples:
+
+            ("var", variable id): a lock on the variable was released in some site
+            ("site", site id): the site changed status, ("site", None) matches any site
+            ("trans", transaction id): the transaction has no more blocked operations or is flagged to be aborted
+
+        :param tm: Transaction Manager
+        :return: A list of keys
+        """
+        return []
+
+    def get_conflicting_transactions(self, tm):
+        """
+        Get the transactions holding (or waiting for, in queued lock mode) locks which prevent this blocked operation
+        from executing, used by the deadlock prevention policies
+
+        :param tm: Transaction Manager
+        :return: A set of transaction ids
+        """
+        return set()
+
     def save_to_transaction(self, tm):
         """
         Append operation to corresponding transaction's operation list
@@ -39,7 +65,7 @@ class Operation(object):
             raise KeyError(f"Try to execute {self.op_t} in a non-existing transaction")
 
         tm.transactions[transaction_id].add_operation(self)
-        tm.wait_for_graph.add_operation(self)
+        tm.deadlock_policy.record(self)
 
     def get_parameters(self):
         return self.para
@@ -55,44 +81,30 @@ def parse_variable_id(variable_id):
     :param variable_id: variable id string
     :return: A tuple
     """
-    for idx, c in enumerate(variable_id):
-        if c.isdigit():
-            return variable_id[:idx], int(variable_id[idx:])
-
-
-def print_result(headers, rows):
-    """
-    Print the query result using pretty table, only for dump operation now
+    # fast path for the usual "x<digits>" form
+    if variable_id[:1] == "x" and variable_id[1:].isdigit():
+        return "x", int(variable_id[1:])
 
-    :param headers: table headers
-    :param rows: table rows
-    :return: None
-    """
-    table = PrettyTable()
-    table.field_names = headers
-    for row in rows:
-        table.add_row(row)
-    print(table)
+    res = VARIABLE_ID_PATTERN.match(variable_id)
+    if res is None:
+        raise ValueError(f"Invalid variable id: {variable_id}")
+    return res.group(1), int(res.group(2))
 
 
 # Read variable from log if the variable was modified by transaction,
 # otherwise read from committed data
-def do_read(trans_id, var_id, site):
+def do_read(trans_id, var_id, site, sink):
     """
-    Read the variable, and print in prettytable
+    Read the variable, and report the value to the output sink
 
     :param trans_id: transaction id
     :param var_id: variable id
     :param site: site
+    :param sink: OutputSink
     :return:
     """
+    res = site.data_manager.read_for_transaction(trans_id, var_id)
 
-    # Case 1: data has been changed by the same transaction but not commit before
-    if trans_id in site.data_manager.log and var_id in site.data_manager.log[trans_id]:
-        res = site.data_manager.log[trans_id][var_id]
-    else:
-        res = site.data_manager.get_variable(var_id)
-
-    print_result(["Transaction", "Site", f"x{var_id}"], [[trans_id, f"{site.site_id}", res]])
+    sink.read(trans_id, site.site_id, var_id, res)
 
     return True
@@ -1,36 +1,164 @@
-from configurations import distinct_variable_counts, number_of_sites
+from model.ReplicationMap import get_replication_map
+from model.managers.Storage import create_storage
+from model.managers.WriteAheadLog import WriteAheadLog, COMMIT, FAIL
+import configurations
+import os
+from bisect import bisect_right
 
 
-class DataManager(object):
+class VersionChain(object):
     """
-    A class to initialize and manage data
+    Committed history of one variable in a site, used by read-only transactions (multi-version read consistency)
+
+    Every entry records the (tick, sub tick) it happened at, the committed value and whether the value could be read
+    from the site since then (a replicated variable is not readable from the time its site fails until a
+    transaction commits a new value to it), the sub tick orders the operations of a batch sharing a tick (see
+    TransactionManager.step_batch)
+
+    :param self.ticks: A list of (tick, sub tick) in increasing order
+    :param self.values: A list of committed values, parallel to self.ticks
+    :param self.readable: A list of readable flags, parallel to self.ticks
     """
-    @staticmethod
-    def _init_db(idx):
+    __slots__ = ("ticks", "values", "readable")
+
+    def __init__(self, tick, value, readable):
+        self.ticks = [(tick, 0)]
+        self.values = [value]
+        self.readable = [readable]
+
+    def append(self, tick, value, readable, sub_tick=0):
         """
-        Initialize data based on the site id
+        Record a new committed value or a change of readability
 
-        :param idx: site id
-        :return: list of value of variable
+        :param tick: time
+        :param value: committed value
+        :param readable: whether the value can be read from the site
+        :param sub_tick: position of the operation in its batch, 0 outside of a batch
+        :return: None
         """
-        data = [None] * distinct_variable_counts
+        self.ticks.append((tick, sub_tick))
+        self.values.append(value)
+        self.readable.append(readable)
 
-        for i in range(1, distinct_variable_counts + 1):
-            if i % 2 == 0 or i % number_of_sites + 1 == idx:
-                data[i - 1] = 10 * i
-        return data
+    def prune(self, watermark):
+        """
+        Drop the versions which are older than the version visible at the watermark
 
-    def __init__(self, site_id):
-        self.site_id = site_id
-        self.data = self._init_db(site_id)
+        :param watermark: the oldest tick a read may happen at
+        :return: number of versions dropped
+        """
+        # the versions of later operations of the watermark's batch are kept
+        idx = bisect_right(self.ticks, (watermark, 0)) - 1
+        if idx <= 0:
+            return 0
+        del self.ticks[:idx]
+        del self.values[:idx]
+        del self.readable[:idx]
+        return idx
+
+    def visible(self, tick, sub_tick=0):
+        """
+        Find the version visible at given tick
 
-        # Initialize accessible flag, False for None variable, True for others
-        self.is_accessible = [False if v is None else True for v in self.data]
+        :param tick: time
+        :param sub_tick: position of the operation in its batch, 0 outside of a batch
+        :return: (True, value) if a readable version exists at the tick, otherwise (False, None)
+        """
+        idx = bisect_right(self.ticks, (tick, sub_tick)) - 1
+        if idx < 0 or not self.readable[idx]:
+            return False, None
+        return True, self.values[idx]
+
+
+class DataManager(object):
+    """
+    A class to initialize and manage data
+
+    :param self.replication_map: ReplicationMap shared by all sites
+    :param self.storage: Committed values and accessible flags (ListStorage or CompactStorage, see configurations)
+    :param self.log: A dictionary of uncommitted changes of each transaction
+    :param self.prepared: A dictionary of the changes of the transactions prepared by a two-phase commit, unlike
+                          self.log they are kept when the site fails
+    :param self.versions: A dictionary mapping variable id to its VersionChain, only for variables changed since
+                          the last garbage collection, any other variable has a single version which is its current
+                          committed value
+    :param self.wal: WriteAheadLog of the committed changes (when a log directory is given), otherwise None
+    """
+    def __init__(self, site_id, wal_dir=None):
+        self.site_id = site_id
+        self.replication_map = get_replication_map()
+        self.storage = create_storage(configurations.storage, self.replication_map.variables_of(site_id),
+                                      self.replication_map.variable_counts)
 
         # Any change before commit will be stored in self.log
         # self.log is a key-value pair, each pair contains the transaction id and its change
         self.log = {}
 
+        # Changes of the transactions which voted yes in a two-phase commit, waiting for the decision
+        self.prepared = {}
+
+        # Committed history of changed variables in this site, initial values are committed at tick 0
+        self.versions = {}
+
+        # Optional durability, the committed state of a previous run is recovered from the log of the site, the logs
+        # are in wal_dir (configurations.wal_dir by default)
+        wal_dir = wal_dir or configurations.wal_dir
+        self.wal = None
+        if wal_dir:
+            self.wal = WriteAheadLog(os.path.join(wal_dir, f"site{site_id}"),
+                                     configurations.wal_sync_batch, configurations.wal_checkpoint_interval)
+            self.recover_from_log()
+
+    def recover_from_log(self):
+        """
+        Rebuild the committed values and accessible flags from the checkpoint and the log of the site, the version
+        history starts again from the recovered state
+
+        :return: None
+        """
+        entries, records = self.wal.recover()
+        for idx, (val, accessible) in entries.items():
+            self.storage.set(idx, val)
+            self.storage.set_accessible(idx, accessible)
+
+        for record_type, tick, items in records:
+            if record_type == COMMIT:
+                self.storage.commit_many(items)
+            elif record_type == FAIL:
+                for i in self.replication_map.variables_of(self.site_id):
+                    self.storage.set_accessible(i, not self.replication_map.is_replicated(i))
+
+    def checkpoint(self):
+        """
+        Write the committed data of the site to a checkpoint of the log, the log restarts empty
+
+        :return: None
+        """
+        self.wal.checkpoint((i, self.storage.get(i), self.storage.is_accessible(i))
+                            for i in self.replication_map.variables_of(self.site_id))
+
+    def sync_log(self):
+        """
+        Make the records appended to the log durable, no-op without log
+
+        :return: None
+        """
+        if self.wal is not None:
+            self.wal.sync()
+
+    def _log_commit(self, tick, changes):
+        self.wal.log_commit(tick, changes)
+        if self.wal.should_checkpoint():
+            self.checkpoint()
+
+    def _record_version(self, idx, tick, value, readable, sub_tick=0):
+        chain = self.versions.get(idx)
+        if chain is None:
+            # the variable had a single version so far, its current committed state
+            chain = VersionChain(0, self.storage.get(idx), self.storage.is_accessible(idx))
+            self.versions[idx] = chain
+        chain.append(tick, value, readable, sub_tick)
+
     def clear_uncommitted_changes(self):
         """
         Reset log to empty because of site fail
@@ -39,6 +167,16 @@ class DataManager(object):
         """
         self.log = {}
 
+    def prepare(self, transaction_id):
+        """
+        Prepare the changes of a transaction for a two-phase commit, they survive a failure of the site until the
+        decision of the coordinator arrives
+
+        :param transaction_id: transaction id
+        :return: None
+        """
+        self.prepared[transaction_id] = self.log.pop(transaction_id, {})
+
     def commit(self, transaction_id):
         """
         Commit changes and clear log belongs to that transaction.
@@ -47,22 +185,105 @@ class DataManager(object):
 
         :return: None
         """
-        self.data.update(self.log[transaction_id])
+        for idx, val in self.log[transaction_id].items():
+            self.set_variable(idx, val)
         self.log[transaction_id] = {}
 
-    def disable_accessibility(self):
+    def disable_accessibility(self, tick, sub_tick=0):
         """
         Change accessible flag to False after recover (Only for replicated variable), which means the non replicated
         variables can be write and read any other variable can be write but can not be read before any write operation
         commit on it
 
+        :param tick: time of the site failure, recorded in the version chains of replicated variables
+        :param sub_tick: position of the failure in its batch, 0 outside of a batch
         :return: None
         """
-        for i in range(1, distinct_variable_counts + 1):
-            if i % 2 != 0 and i % number_of_sites + 1 == self.site_id:
-                self.is_accessible[i - 1] = True
+        if self.wal is not None:
+            self.wal.log_fail(tick)
+
+        # variables not held by this site are never accessible, only visit the held ones
+        for i in self.replication_map.variables_of(self.site_id):
+            if not self.replication_map.is_replicated(i):
+                self.storage.set_accessible(i, True)
             else:
-                self.is_accessible[i - 1] = False
+                self._record_version(i, tick, self.storage.get(i), False, sub_tick)
+                self.storage.set_accessible(i, False)
+
+    def commit_variable(self, idx, val, tick, sub_tick=0):
+        """
+        Commit a value of the variable, the variable becomes readable and a new version is recorded
+
+        :param idx: variable id
+        :param val: variable value
+        :param tick: commit time
+        :param sub_tick: position of the commit in its batch, 0 outside of a batch
+        :return: None
+        """
+        self._record_version(idx, tick, val, True, sub_tick)
+        self.set_variable(idx, val)
+        self.storage.set_accessible(idx, True)
+        if self.wal is not None:
+            self._log_commit(tick, [(idx, val)])
+
+    def commit_transaction(self, trans_id, tick, sub_tick=0):
+        """
+        Commit every value logged (or prepared) by the transaction in this site at once, the variables become
+        readable and new versions are recorded
+
+        :param trans_id: transaction id
+        :param tick: commit time
+        :param sub_tick: position of the commit in its batch, 0 outside of a batch
+        :return: None
+        """
+        changes = self.prepared.pop(trans_id, None) or self.log.pop(trans_id, None)
+        if not changes:
+            return
+        for idx, val in changes.items():
+            self._record_version(idx, tick, val, True, sub_tick)
+        self.storage.commit_many(changes.items())
+        if self.wal is not None:
+            self._log_commit(tick, list(changes.items()))
+
+    def collect_versions(self, watermark):
+        """
+        Garbage collect versions which can not be read by any read-only transaction started at or after watermark
+
+        :param watermark: start tick of the oldest active read-only transaction
+        :return: number of versions reclaimed
+        """
+        reclaimed = 0
+        for idx in list(self.versions):
+            chain = self.versions[idx]
+            reclaimed += chain.prune(watermark)
+            # the only version left is the current committed state, no need to keep the chain
+            if len(chain.ticks) == 1:
+                self.versions.pop(idx)
+        return reclaimed
+
+    def count_versions(self):
+        """
+        Count the versions kept in this site
+
+        :return: number of versions
+        """
+        return self.storage.count() + sum(len(chain.ticks) - 1 for chain in self.versions.values())
+
+    def read_version(self, idx, tick, sub_tick=0):
+        """
+        Read the committed value of the variable visible to a read-only transaction started at given tick
+
+        :param idx: variable id
+        :param tick: start time of the read-only transaction
+        :param sub_tick: position of the begin of the read-only transaction in its batch, 0 outside of a batch
+        :return: (True, value) if the site can serve the read, otherwise (False, None)
+        """
+        chain = self.versions.get(idx)
+        if chain is not None:
+            return chain.visible(tick, sub_tick)
+        if self.storage.is_accessible(idx):
+            return True, self.storage.get(idx)
+        return False, None
 
     def revert_transaction_changes(self, transaction_id):
         """
@@ -71,6 +292,33 @@ class DataManager(object):
         :return: None
         """
         self.log.pop(transaction_id, None)
+        self.prepared.pop(transaction_id, None)
+
+    def write_uncommitted(self, transaction_id, idx, val):
+        """
+        Log a value written by a transaction, it is applied when the transaction commits
+
+        :param transaction_id: transaction id
+        :param idx: variable id
+        :param val: variable value
+        :return: None
+        """
+        logs = self.log.get(transaction_id, {})
+        logs[idx] = val
+        self.log[transaction_id] = logs
+
+    def read_for_transaction(self, transaction_id, idx):
+        """
+        Read a variable for a typical transaction, the value it wrote itself if it has not committed yet, otherwise
+        the committed value
+
+        :param transaction_id: transaction id
+        :param idx: variable id
+        :return: value of the variable
+        """
+        if transaction_id in self.log and idx in self.log[transaction_id]:
+            return self.log[transaction_id][idx]
+        return self.storage.get(idx)
 
     def get_variable(self, idx):
         """
@@ -79,7 +327,7 @@ class DataManager(object):
         :param idx: variable id
         :return: value of the variable
         """
-        return self.data[idx - 1]
+        return self.storage.get(idx)
 
     def set_variable(self, idx, val):
         """
@@ -89,7 +337,7 @@ class DataManager(object):
         :param val: variable value
         :return: None
         """
-        self.data[idx - 1] = val
+        self.storage.set(idx, val)
     
     def check_accessibility(self, idx):
         """
@@ -98,4 +346,20 @@ class DataManager(object):
         :param idx: variable id
         :return: True or False
         """
-        return self.is_accessible[idx - 1]
\ No newline at end of file
+        return self.storage.is_accessible(idx)
+
+    def accessible_variables(self):
+        """
+        Get the variables of this site which can be accessed
+
+        :return: list of variable ids
+        """
+        return [i for i in self.replication_map.variables_of(self.site_id) if self.storage.is_accessible(i)]
+
+    def dump_values(self):
+        """
+        Return the committed value of every variable, None for variables not in this site
+
+        :return: list of values
+        """
+        return self.storage.row()
\ No newline at end of file
@@ -0,0 +1,86 @@
+import configurations
+
+
+class GarbageCollector(object):
+    """
+    Reclaim versions of variables which can no longer be read by any read-only transaction
+
+    The low watermark is the start tick of the oldest active read-only transaction (or the current tick if there is
+    none), for each variable only the version visible at the low watermark and the later ones are kept, the runs and
+    reclaimed versions are counted in the metrics registry of the transaction manager as "gc.runs" and "gc.reclaimed"
+
+    :param self.tm: TransactionManager
+    :param self.interval: number of ticks between two collections, 0 disables the collector
+    :param self.last_run: tick of the last collection
+    :param self.runs: number of collections
+    :param self.reclaimed: number of versions reclaimed
+    :param self.last_watermark: low watermark used by the last collection
+    """
+
+    def __init__(self, tm, interval=None):
+        self.tm = tm
+        self.interval = configurations.version_gc_interval if interval is None else interval
+        self.last_run = 0
+
+        # statistics
+        self.runs = 0
+        self.reclaimed = 0
+        self.last_watermark = None
+
+    def low_watermark(self, tick):
+        """
+        Get the oldest tick a read-only transaction may still read at
+
+        :param tick: current time
+        :return: tick
+        """
+        if self.tm.active_readonly:
+            return min(self.tm.active_readonly.values())
+        return tick
+
+    def maybe_collect(self, tick):
+        """
+        Run a collection if at least self.interval ticks passed since the last one
+
+        :param tick: current time
+        :return: number of versions reclaimed
+        """
+        if self.interval <= 0 or tick - self.last_run < self.interval:
+            return 0
+        return self.collect(tick)
+
+    def collect(self, tick):
+        """
+        Reclaim old versions in every site
+
+        :param tick: current time
+        :return: number of versions reclaimed
+        """
+        watermark = self.low_watermark(tick)
+        if self.tm.shards is not None:
+            # every shard collects the versions of its sites in parallel
+            reclaimed = sum(self.tm.shards.call_all("collect_versions", watermark))
+        else:
+            reclaimed = sum(site.data_manager.collect_versions(watermark) for site in self.tm.sites)
+
+        self.last_run = tick
+        self.runs += 1
+        self.reclaimed += reclaimed
+        self.last_watermark = watermark
+        if self.tm.metrics is not None:
+            self.tm.metrics.inc("gc.runs")
+            self.tm.metrics.inc("gc.reclaimed", reclaimed)
+        return reclaimed
+
+    def get_stats(self):
+        """
+        Return statistics of the collector
+
+        :return: A dictionary
+        """
+        return {
+            "runs": self.runs,
+            "reclaimed": self.reclaimed,
+            "last_watermark": self.last_watermark,
+            "live_versions": sum(site.data_manager.count_versions() for site in self.tm.sites)
+        }
@@ -1,61 +1,273 @@
+from time import perf_counter_ns
+
+
+class LockEntry(object):
+    """
+    Locks held on one variable in a site
+
+    :param self.shared: A set of transactions holding a shared (read) lock
+    :param self.exclusive: The transaction holding the exclusive (write) lock, None if there is no exclusive lock
+    """
+    __slots__ = ("shared", "exclusive")
+
+    def __init__(self, shared=None, exclusive=None):
+        self.shared = shared if shared is not None else set()
+        self.exclusive = exclusive
+
+    def is_free(self):
+        return not self.shared and self.exclusive is None
+
 
 class LockManager(object):
-    # 0 represents share lock, 1 represent exclusive lock
-    # variable: {0: set(transaction_id), 1: transaction_id}
-    def __init__(self):
+    """
+    Maintains the lock table of a site
+
+    :param self.lock_table: A dictionary mapping variable id to its LockEntry
+    :param self.trans_to_vars: A dictionary mapping transaction id to the set of variables it holds locks on,
+                               so releasing or querying the locks of a transaction only touches those variables
+    :param self.release_listeners: A list of callbacks invoked with the variable id when a lock is released
+    :param self.queued: Whether conflicting requests wait in a FIFO queue per variable instead of simply failing
+    :param self.wait_queues: A dictionary mapping variable id to a list of [transaction id, lock type] waiting for it
+    :param self.trans_to_waits: A dictionary mapping transaction id to the set of variables it is waiting for
+    :param self.grant_listeners: A list of callbacks invoked with (variable id, transaction id) when a queued
+                                 request is granted
+    :param self.metrics: Metrics registry set by the transaction manager, None if metrics are disabled
+    """
+    def __init__(self, queued=False):
         self.lock_table = {}
+        self.trans_to_vars = {}
+
+        # Callbacks invoked with the variable id whenever a lock on that variable is released,
+        # the transaction manager uses them to wake up operations waiting for the variable
+        self.release_listeners = []
+
+        # Queued lock mode, a request which can not be granted waits in the queue of the variable,
+        # new requests never jump ahead of waiting ones, so a writer can not be starved by a stream of readers
+        self.queued = queued
+        self.wait_queues = {}
+        self.trans_to_waits = {}
+        self.grant_listeners = []
+
+        self.metrics = None
+
+    def _hold(self, transaction_id, variable_id):
+        variables = self.trans_to_vars.get(transaction_id)
+        if variables is None:
+            variables = set()
+            self.trans_to_vars[transaction_id] = variables
+        variables.add(variable_id)
 
-    def try_lock_variable(self, transaction_id, variable_id, lock_type):
+    def _drop(self, transaction_id, variable_id):
+        variables = self.trans_to_vars.get(transaction_id)
+        if variables is not None:
+            variables.discard(variable_id)
+            if not variables:
+                self.trans_to_vars.pop(transaction_id)
+
+    def add_release_listener(self, listener):
+        """
+        Register a callback which will be called with the variable id every time a lock on it is released
+
+        :param listener: callable taking a variable id
+        :return: None
+        """
+        self.release_listeners.append(listener)
+
+    def _notify_released(self, variable_id):
+        for listener in self.release_listeners:
+            listener(variable_id)
+
+    def add_grant_listener(self, listener):
+        """
+        Register a callback which will be called with (variable id, transaction id) every time a queued lock request
+        is granted (only in queued mode)
+
+        :param listener: callable taking a variable id and a transaction id
+        :return: None
+        """
+        self.grant_listeners.append(listener)
+
+    def try_lock_variable(self, transaction_id, variable_id, lock_type, enqueue=True):
         """
         Try to get some lock of a variable in current site
 
+        In queued mode, a request which can not be granted is appended to the wait queue of the variable (if enqueue
+        is True) and will be granted in FIFO order once the conflicting locks are released, a new request is never
+        granted ahead of waiting requests unless the transaction already holds a lock on the variable
+
         :param transaction_id: transaction id
         :param variable_id: variable id
         :param lock_type: 0 represent read lock (shared lock), 1 represent write lock (exclusive lock)
+        :param enqueue: whether to wait in the queue if the lock can not be granted (queued mode only)
         :return: True if get lock otherwise False
         """
+        if self.metrics is not None:
+            start = perf_counter_ns()
+            granted = self._try_lock(transaction_id, variable_id, lock_type, enqueue)
+            self.metrics.observe("lock_ns", perf_counter_ns() - start)
+            self.metrics.inc("lock.granted" if granted else "lock.denied")
+            return granted
+        return self._try_lock(transaction_id, variable_id, lock_type, enqueue)
+
+    def _try_lock(self, transaction_id, variable_id, lock_type, enqueue):
         # Make sure given lock type is 0 or 1
         if lock_type != 0 and lock_type != 1:
             raise ValueError(f"Unknown lock type: {lock_type}")
 
+        if not self.queued:
+            return self._grant(transaction_id, variable_id, lock_type)
+
+        queue = self.wait_queues.get(variable_id)
+        holds = variable_id in self.trans_to_vars.get(transaction_id, ())
+
+        # Requests waiting ahead of this one, a transaction already holding a lock does not wait behind them
+        if queue and not holds and queue[0][0] != transaction_id:
+            if enqueue:
+                self._enqueue(transaction_id, variable_id, lock_type, False)
+            return False
+
+        if self._grant(transaction_id, variable_id, lock_type):
+            if queue and queue[0][0] == transaction_id and queue[0][1] <= lock_type:
+                self._dequeue(transaction_id, variable_id)
+            return True
+
+        if enqueue:
+            # a lock upgrade waits in front of the queue, it already holds a shared lock
+            self._enqueue(transaction_id, variable_id, lock_type, holds)
+        return False
+
+    def _enqueue(self, transaction_id, variable_id, lock_type, front):
+        queue = self.wait_queues.get(variable_id)
+        if queue is None:
+            queue = []
+            self.wait_queues[variable_id] = queue
+
+        for waiter in queue:
+            if waiter[0] == transaction_id:
+                # already waiting, a write request replaces a waiting read request of the same transaction
+                waiter[1] = max(waiter[1], lock_type)
+                return
+
+        if front:
+            # behind other upgrades only
+            idx = 0
+            while idx < len(queue) and variable_id in self.trans_to_vars.get(queue[idx][0], ()):
+                idx += 1
+            queue.insert(idx, [transaction_id, lock_type])
+        else:
+            queue.append([transaction_id, lock_type])
+        self.trans_to_waits.setdefault(transaction_id, set()).add(variable_id)
+
+    def _dequeue(self, transaction_id, variable_id):
+        queue = self.wait_queues.get(variable_id)
+        if queue is not None:
+            queue[:] = [waiter for waiter in queue if waiter[0] != transaction_id]
+            if not queue:
+                self.wait_queues.pop(variable_id)
+
+        waits = self.trans_to_waits.get(transaction_id)
+        if waits is not None:
+            waits.discard(variable_id)
+            if not waits:
+                self.trans_to_waits.pop(transaction_id)
+
+    def _grant_waiters(self, variable_id):
+        """
+        Grant the waiting requests from the head of the queue of given variable while they are compatible with the
+        current locks, then notify the grant listeners
+
+        :param variable_id: variable id
+        :return: None
+        """
+        queue = self.wait_queues.get(variable_id)
+        granted = []
+        while queue:
+            transaction_id, lock_type = queue[0]
+            if not self._grant(transaction_id, variable_id, lock_type):
+                break
+            self._dequeue(transaction_id, variable_id)
+            granted.append(transaction_id)
+            queue = self.wait_queues.get(variable_id)
+
+        for transaction_id in granted:
+            for listener in self.grant_listeners:
+                listener(variable_id, transaction_id)
+
+    def _grant(self, transaction_id, variable_id, lock_type):
+        """
+        Grant the lock if it is compatible with the locks held on the variable, ignoring the wait queue
+
+        :param transaction_id: transaction id
+        :param variable_id: variable id
+        :param lock_type: 0 represent read lock (shared lock), 1 represent write lock (exclusive lock)
+        :return: True if get lock otherwise False
+        """
+        entry = self.lock_table.get(variable_id)
+
         # Case 1: no lock on give variable
-        elif variable_id not in self.lock_table:
+        if entry is None:
             # Situation 1: shared lock, initialize shared lock on the variable
             # and add transaction_id to the shared lock list
             if lock_type == 0:
-                self.lock_table[variable_id] = {0: {transaction_id}, 1: None}
+                self.lock_table[variable_id] = LockEntry(shared={transaction_id})
 
             # Situation 2: exclusive lock, initialize exclusive lock on the variable
             # and change the exclusive flag to give transaction_id
-            elif lock_type == 1:
-                self.lock_table[variable_id] = {0: set(), 1: transaction_id}
+            else:
+                self.lock_table[variable_id] = LockEntry(exclusive=transaction_id)
+            self._hold(transaction_id, variable_id)
             return True
 
         # Case 2: some locks on given variable
         else:
             # Situation 1: shared lock, no exclusive lock exists, add the transaction_id in the shared lock list
-            if lock_type == 0 and (self.lock_table[variable_id][1] is None or
-                                   self.lock_table[variable_id][1] == transaction_id):
-                self.lock_table[variable_id][0].add(transaction_id)
+            if lock_type == 0 and (entry.exclusive is None or entry.exclusive == transaction_id):
+                entry.shared.add(transaction_id)
+                self._hold(transaction_id, variable_id)
                 return True
 
             # Situation 2: shared lock, exclusive lock exists, reject lock the variable for the transaction
-            elif lock_type == 0 and self.lock_table[variable_id][1] is not None:
+            elif lock_type == 0:
                 return False
 
             # Situation 3: Exclusive lock, any existing lock of different transaction will conflict with it
-            elif lock_type == 1:
+            else:
                 # Situation 3.1: given transaction has a shared lock on given variable id (promote lock)
-                if transaction_id in self.lock_table[variable_id][0] and len(self.lock_table[variable_id][0]) == 1:
-                    self.lock_table[variable_id][0].remove(transaction_id)
-                    self.lock_table[variable_id][1] = transaction_id
+                if transaction_id in entry.shared and len(entry.shared) == 1:
+                    entry.shared.remove(transaction_id)
+                    entry.exclusive = transaction_id
                     return True
                 # Situation 3.2: given transaction has an exclusive lock on given variable id, just return True
-                elif transaction_id == self.lock_table[variable_id][1]:
+                elif transaction_id == entry.exclusive:
                     return True
                 else:
                     return False
 
+    def get_conflicting_transactions(self, transaction_id, variable_id, lock_type):
+        """
+        Get the transactions a lock request of given transaction has to wait for: the holders of conflicting locks
+        and, in queued mode, the transactions waiting ahead of it in the queue
+
+        :param transaction_id: transaction id
+        :param variable_id: variable id
+        :param lock_type: 0 represent read lock (shared lock), 1 represent write lock (exclusive lock)
+        :return: A set of transaction ids
+        """
+        conflicts = set()
+        entry = self.lock_table.get(variable_id)
+        if entry is not None:
+            if entry.exclusive is not None and entry.exclusive != transaction_id:
+                conflicts.add(entry.exclusive)
+            if lock_type == 1:
+                conflicts.update(t for t in entry.shared if t != transaction_id)
+
+        if self.queued:
+            for waiter_id, _ in self.wait_queues.get(variable_id, ()):
+                if waiter_id == transaction_id:
+                    break
+                conflicts.add(waiter_id)
+        return conflicts
+
     def try_unlock_variable(self, variable_id, transaction_id):
         """
         Try to unlock a variable
@@ -64,49 +276,100 @@ class LockManager(object):
         :param transaction_id: transaction id
         :return: None
         """
-        lock = self.lock_table.get(variable_id, None)
+        entry = self.lock_table.get(variable_id, None)
 
-        if lock is None:
+        if entry is None:
             raise KeyError(f"Try to unlock the variable ({variable_id}) which has no lock on it")
 
         unlock_counts = 0
 
-        if transaction_id in self.lock_table[variable_id][0]:
-            self.lock_table[variable_id][0].remove(transaction_id)
+        if transaction_id in entry.shared:
+            entry.shared.remove(transaction_id)
             unlock_counts += 1
 
-        if transaction_id == self.lock_table[variable_id][1]:
-            self.lock_table[variable_id][1] = None
+        if transaction_id == entry.exclusive:
+            entry.exclusive = None
             unlock_counts += 1
 
         # There is only one lock on given variable for the given transaction,
         # we need to make sure this is true, if there is a bug, this will work
         assert unlock_counts == 1
 
+        self._drop(transaction_id, variable_id)
+        if entry.is_free():
+            self.lock_table.pop(variable_id)
+
+        if self.queued:
+            self._grant_waiters(variable_id)
+        self._notify_released(variable_id)
+
+    def get_lock_type(self, transaction_id, variable_id):
+        """
+        Get the lock a transaction holds on a variable
+
+        :param transaction_id: transaction id
+        :param variable_id: variable id
+        :return: 0 for a shared lock, 1 for an exclusive lock, None if the transaction holds no lock on the variable
+        """
+        entry = self.lock_table.get(variable_id)
+        if entry is None:
+            return None
+        if entry.exclusive == transaction_id:
+            return 1
+        if transaction_id in entry.shared:
+            return 0
+        return None
+
+    def demote_variable(self, variable_id, transaction_id):
+        """
+        Turn the exclusive lock of a transaction on a variable back into a shared lock, used to undo a promotion
+
+        :param variable_id: variable id
+        :param transaction_id: transaction id
+        :return: None
+        """
+        entry = self.lock_table.get(variable_id)
+        if entry is None or entry.exclusive != transaction_id:
+            raise KeyError(f"Try to demote the lock of {transaction_id} on {variable_id} which is not exclusive")
+
+        entry.exclusive = None
+        entry.shared.add(transaction_id)
+
+        # other readers may proceed now
+        if self.queued:
+            self._grant_waiters(variable_id)
+        self._notify_released(variable_id)
+
     def release_transaction_locks(self, trans_id):
         """
-        Iterate lock on each variable, if the lock is set by given trans_id, release it
+        Release every lock set by given trans_id, only the variables locked by the transaction are visited
 
         :param trans_id: Transaction id
         :return: None
         """
-        to_be_delete = []
-        for var_id, locks in self.lock_table.items():
+        released = self.trans_to_vars.pop(trans_id, ())
+        for var_id in released:
+            entry = self.lock_table[var_id]
             # release read lock
-            read_locks = locks[0]
-            if trans_id in read_locks:
-                read_locks.remove(trans_id)
+            entry.shared.discard(trans_id)
 
             # release write lock
-            write_lock = locks[1]
-            if write_lock == trans_id:
-                self.lock_table[var_id][1] = None
+            if entry.exclusive == trans_id:
+                entry.exclusive = None
+
+            if entry.is_free():
+                self.lock_table.pop(var_id)
 
-            if len(locks[0]) == 0 and locks[1] is None:
-                to_be_delete.append(var_id)
+        if self.queued:
+            # the transaction stops waiting as well, this may unblock requests queued behind it
+            waiting = self.trans_to_waits.pop(trans_id, ())
+            for var_id in waiting:
+                self._dequeue(trans_id, var_id)
+            for var_id in set(released) | set(waiting):
+                self._grant_waiters(var_id)
 
-        for var_id in to_be_delete:
-            self.lock_table.pop(var_id)
+        for var_id in released:
+            self._notify_released(var_id)
 
     def clear(self):
         """
@@ -114,7 +377,23 @@ class LockManager(object):
 
         :return: None
         """
+        released = list(self.lock_table.keys())
         self.lock_table = {}
+        self.trans_to_vars = {}
+        self.wait_queues = {}
+        self.trans_to_waits = {}
+
+        for var_id in released:
+            self._notify_released(var_id)
+
+    def holds_locks(self, transaction_id):
+        """
+        Check if given transaction holds any lock on this site
+
+        :param transaction_id: transaction id
+        :return: True or False
+        """
+        return transaction_id in self.trans_to_vars
 
     # Get all the transactions that have one or more locks in this site
     def get_involved_transactions(self):
@@ -123,12 +402,5 @@ class LockManager(object):
 
         :return: A set of transactions
         """
-        transactions = set()
-        for var_id, locks in self.lock_table.items():
-            # Transaction has read lock on var_id
-            for t_id in locks[0]:
-                transactions.add(t_id)
-            # Transaction has exclusive lock on var id:
-            if locks[1]:
-                transactions.add(locks[1])
-        return transactions
+        return set(self.trans_to_vars.keys())
+
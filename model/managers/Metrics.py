@@ -0,0 +1,168 @@
+import configurations
+
+
+class Histogram(object):
+    """
+    Distribution of non negative integer samples (nanoseconds, ticks, counts) in power of two buckets, recording a
+    sample is O(1) and the memory does not depend on the number of samples
+
+    :param self.buckets: A list, buckets[k] counts the samples v with v.bit_length() == k (2^(k-1) <= v < 2^k)
+    :param self.count: the number of samples
+    :param self.total: the sum of the samples
+    :param self.min: the smallest sample, None if there is no sample
+    :param self.max: the largest sample, None if there is no sample
+    """
+    __slots__ = ("buckets", "count", "total", "min", "max")
+
+    def __init__(self):
+        self.buckets = [0] * 65
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = None
+
+    def record(self, value):
+        value = int(value)
+        if value < 0:
+            value = 0
+        self.buckets[min(value.bit_length(), 64)] += 1
+        self.count += 1
+        self.total += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def percentile(self, p):
+        """
+        Get an upper bound of the p-th percentile, the upper bound of the bucket holding it
+
+        :param p: percentile between 0 and 100
+        :return: integer, None if there is no sample
+        """
+        if self.count == 0:
+            return None
+        rank = max(1, -(-self.count * p // 100))
+        seen = 0
+        for k, n in enumerate(self.buckets):
+            seen += n
+            if seen >= rank:
+                return min((1 << k) - 1, self.max)
+        return self.max
+
+    def snapshot(self):
+        """
+        Summarize the distribution
+
+        :return: A dictionary with count, mean, min, max, p50, p90 and p99
+        """
+        return {
+            "count": self.count,
+            "mean": self.total / self.count if self.count else None,
+            "min": self.min,
+            "max": self.max,
+            "p50": self.percentile(50),
+            "p90": self.percentile(90),
+            "p99": self.percentile(99)
+        }
+
+
+class Metrics(object):
+    """
+    Registry of named counters and histograms filled by the transaction manager and the lock managers
+
+    Metrics are optional, when they are disabled the components hold None instead of a registry and only pay for a
+    None check, nothing is timed or counted
+
+    Names used by the simulation:
+        ops.<op>                operations received, per operation type
+        step_ns.<op>            latency of TransactionManager.step, per operation type (step_ns.batch for a whole
+                                TransactionManager.step_batch, batch_size is its number of operations)
+        execute_ns.<op>         latency of the first execution of an operation (commit is execute_ns.end)
+        phase_ns.<phase>        time spent in retry, deadlock (detection) and gc per step
+        lock.granted/denied     lock requests of LockManager.try_lock_variable, lock_ns is their latency
+        blocked                 operations which were blocked at least once
+        retries                 executions of blocked operations
+        retry_attempts.<op>     executions needed by a blocked operation before it completed
+        wait_ticks.<op>         ticks a blocked operation waited (for locks or sites) before it completed
+        deadlocks               deadlocks detected, deadlock_cycle_length is the number of transactions involved
+        commits, aborts.<code>  transaction outcomes, see OutputSink.ABORT_CODES
+        replica_reads.site<id>  replicated reads served by each site, see algorithms/ReplicaSelection.py
+        2pc.messages.<message>  messages sent by a two-phase commit (prepare, vote, commit, abort)
+        2pc.round_trip_ticks    ticks from the prepare messages to the decision of a two-phase commit
+        2pc.aborted             two-phase commits aborted because a site voted no
+
+    :param self.counters: A dictionary mapping name to integer
+    :param self.histograms: A dictionary mapping name to Histogram
+    """
+
+    def __init__(self):
+        self.counters = {}
+        self.histograms = {}
+
+    def inc(self, name, n=1):
+        """
+        Add n to a counter
+
+        :param name: counter name
+        :param n: increment
+        :return: None
+        """
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def observe(self, name, value):
+        """
+        Record a sample in a histogram
+
+        :param name: histogram name
+        :param value: non negative integer
+        :return: None
+        """
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            histogram = Histogram()
+            self.histograms[name] = histogram
+        histogram.record(value)
+
+    def reset(self):
+        """
+        Drop every counter and histogram
+
+        :return: None
+        """
+        self.counters = {}
+        self.histograms = {}
+
+    def snapshot(self):
+        """
+        Get the current values, ready to be saved as JSON
+
+        :return: A dictionary with counters and histograms
+        """
+        return {
+            "counters": dict(sorted(self.counters.items())),
+            "histograms": {name: h.snapshot() for name, h in sorted(self.histograms.items())}
+        }
+
+    def report(self):
+        """
+        Format the current values as text, one counter or histogram per line
+
+        :return: string
+        """
+        lines = [f"{name}: {value}" for name, value in sorted(self.counters.items())]
+        for name, h in sorted(self.histograms.items()):
+            s = h.snapshot()
+            lines.append(f"{name}: count={s['count']} mean={s['mean']:.1f} min={s['min']} p50<={s['p50']} "
+                         f"p90<={s['p90']} p99<={s['p99']} max={s['max']}")
+        return "\n".join(lines) if lines else "No metrics recorded"
+
+
+def create_metrics():
+    """
+    Create the metrics registry described by configurations.py
+
+    :return: Metrics, None if metrics are disabled
+    """
+    return Metrics() if configurations.metrics else None
+
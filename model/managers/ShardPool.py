@@ -0,0 +1,319 @@
+import atexit
+import configurations
+from multiprocessing import Pipe, Process
+from model.managers.DataManager import DataManager
+from model.ReplicationMap import get_replication_map
+
+
+def _shard_main(conn, settings, site_ids):
+    """
+    Main loop of a shard process, it holds the DataManager of each of its sites and executes the batches of commands
+    sent by the ShardPool in order, replying to each batch with the result of its last command, a command without
+    site id is executed by every site of the shard and its result is the list of their results
+
+    :param conn: the shard end of the pipe
+    :param settings: the configurations of the parent process (a shard may be spawned instead of forked)
+    :param site_ids: ids of the sites held by the shard
+    :return: None
+    """
+    configurations.restore(settings)
+
+    managers = {}
+    while True:
+        batch = conn.recv()
+        if batch is None:
+            break
+        result = None
+        try:
+            for site_id, method, args in batch:
+                if method == "reset":
+                    for manager in managers.values():
+                        if manager.wal is not None:
+                            manager.wal.close()
+                    managers = {i: DataManager(i, *args) for i in site_ids}
+                elif site_id is None:
+                    result = [getattr(manager, method)(*args) for manager in managers.values()]
+                else:
+                    result = getattr(managers[site_id], method)(*args)
+            conn.send((True, result))
+        except Exception as e:
+            conn.send((False, e))
+
+    for manager in managers.values():
+        if manager.wal is not None:
+            manager.wal.close()
+
+
+class ShardPool(object):
+    """
+    Worker processes (shards) holding the data of the sites: committed values, uncommitted changes, version chains,
+    write-ahead logs and checkpoints, site i is held by shard (i - 1) mod the number of shards
+
+    The transaction manager and the lock managers stay in the main process, a lock decision is needed at once by
+    every read and write and its release wakes up blocked operations immediately. Only the data of the sites is
+    sharded, through a RemoteDataManager per site:
+        - commands without a result (uncommitted writes, commits, reverts, failures, checkpoints) are queued per shard
+          and sent as one batch
+        - commands with a result (reads of committed values, dumps) send the queued batch of their shard with them
+          and wait for the reply, so a shard always executes the commands of a site in order
+        - the accessible flags and the uncommitted writes of each site are mirrored by its RemoteDataManager, so the
+          accessibility checks of reads and deadlock detection and the reads of a transaction's own writes need no
+          round trip, a read of a committed value is the only one
+        - at the start of every tick (TransactionManager.retry) the queued batches of all shards are sent at once,
+          the shards execute the commits of the previous tick (and their fsync) in parallel while the main process
+          runs the tick, a shard acknowledges a batch when the next one is sent, so it is at most one tick behind and
+          its errors are raised at most one tick late
+        - a collection of old versions is sent to every shard at once (call_all) instead of one call per site
+
+    :param self.shards: the number of shard processes
+    :param self.number_of_sites: the number of sites
+    """
+
+    def __init__(self, shards, number_of_sites):
+        self.shards = shards
+        self.number_of_sites = number_of_sites
+        settings = configurations.snapshot()
+
+        self._conns = []
+        self._processes = []
+        self._pending = [[] for _ in range(shards)]
+        # number of batches sent to each shard whose reply has not been received yet
+        self._unacked = [0] * shards
+        for shard in range(shards):
+            site_ids = list(range(shard + 1, number_of_sites + 1, shards))
+            parent, child = Pipe()
+            process = Process(target=_shard_main, args=(child, settings, site_ids), daemon=True)
+            process.start()
+            child.close()
+            self._conns.append(parent)
+            self._processes.append(process)
+
+    def shard_of(self, site_id):
+        return (site_id - 1) % self.shards
+
+    def post(self, site_id, method, *args):
+        """
+        Queue a command without result for the shard of a site
+
+        :param site_id: site id
+        :param method: name of the DataManager method
+        :param args: arguments of the method
+        :return: None
+        """
+        self._pending[self.shard_of(site_id)].append((site_id, method, args))
+
+    def call(self, site_id, method, *args):
+        """
+        Execute a command on the shard of a site after the commands queued for the shard, and wait for its result
+
+        :param site_id: site id
+        :param method: name of the DataManager method
+        :param args: arguments of the method
+        :return: the result of the method
+        """
+        shard = self.shard_of(site_id)
+        self._send(shard, [(site_id, method, args)])
+        return self._receive(shard)
+
+    def call_all(self, method, *args):
+        """
+        Execute a command on every site after the queued commands, the shards execute it in parallel
+
+        :param method: name of the DataManager method
+        :param args: arguments of the method
+        :return: list of the results of the method, one per site
+        """
+        for shard in range(self.shards):
+            self._send(shard, [(None, method, args)])
+
+        results, error = [], None
+        for shard in range(self.shards):
+            try:
+                results.extend(self._receive(shard))
+            except Exception as e:
+                error = error or e
+        if error is not None:
+            raise error
+        return results
+
+    def _send(self, shard, commands):
+        batch, self._pending[shard] = self._pending[shard], []
+        batch.extend(commands)
+        self._conns[shard].send(batch)
+        self._unacked[shard] += 1
+
+    def _receive(self, shard):
+        """
+        Receive the replies of every batch sent to a shard, the first error is raised once they are all received
+
+        :param shard: shard index
+        :return: the result of the last batch
+        """
+        result, error = None, None
+        while self._unacked[shard]:
+            ok, result = self._conns[shard].recv()
+            self._unacked[shard] -= 1
+            if not ok:
+                error = error or result
+        if error is not None:
+            raise error
+        return result
+
+    def flush(self):
+        """
+        Send the queued commands of every shard at once without waiting for them to be executed, the reply of the
+        batch sent by the previous flush is received first, so each shard has at most one batch in flight
+
+        :return: None
+        """
+        error = None
+        for shard in range(self.shards):
+            if not self._pending[shard]:
+                continue
+            try:
+                self._receive(shard)
+            except Exception as e:
+                error = error or e
+            self._send(shard, [])
+        if error is not None:
+            raise error
+
+    def reset(self, wal_dir=None):
+        """
+        Give every site a fresh DataManager (recovered from its log if logs are enabled), dropping queued commands
+
+        :param wal_dir: directory of the write-ahead logs of the sites, configurations.wal_dir by default
+        :return: None
+        """
+        self._pending = [[(None, "reset", (wal_dir,))] for _ in range(self.shards)]
+        self.flush()
+        for shard in range(self.shards):
+            self._receive(shard)
+
+    def data_manager(self, site_id):
+        """
+        Get the proxy of the DataManager of a site
+
+        :param site_id: site id
+        :return: RemoteDataManager
+        """
+        return RemoteDataManager(self, site_id)
+
+    def close(self):
+        """
+        Stop the shard processes, their logs are synced and closed
+
+        :return: None
+        """
+        for conn in self._conns:
+            conn.send(None)
+        for process in self._processes:
+            process.join()
+        self._conns = []
+        self._processes = []
+
+
+class RemoteDataManager(object):
+    """
+    Proxy of the DataManager of a site held by a shard, it offers the methods of DataManager used by the sites, the
+    operations and the transaction manager
+
+    The accessible flags and the uncommitted changes are kept in step with the DataManager, they only change through
+    the commands posted by this proxy (the flags held by the shard are fetched once when the proxy is created)
+
+    :param self.pool: ShardPool
+    :param self.site_id: site id
+    :param self.accessible: A set of the accessible variable ids of the site
+    :param self.log: A dictionary mapping transaction id to its uncommitted changes in the site (variable id to value)
+    :param self.prepared: A dictionary mapping transaction id to its changes prepared for a two-phase commit
+    """
+
+    def __init__(self, pool, site_id):
+        self.pool = pool
+        self.site_id = site_id
+        self.accessible = set(pool.call(site_id, "accessible_variables"))
+        self.log = {}
+        self.prepared = {}
+
+    def write_uncommitted(self, transaction_id, idx, val):
+        self.log.setdefault(transaction_id, {})[idx] = val
+        self.pool.post(self.site_id, "write_uncommitted", transaction_id, idx, val)
+
+    def commit_transaction(self, trans_id, tick, sub_tick=0):
+        changes = self.prepared.pop(trans_id, None) or self.log.pop(trans_id, None)
+        if changes:
+            self.accessible.update(changes)
+        self.pool.post(self.site_id, "commit_transaction", trans_id, tick, sub_tick)
+
+    def prepare(self, transaction_id):
+        self.prepared[transaction_id] = self.log.pop(transaction_id, {})
+        self.pool.post(self.site_id, "prepare", transaction_id)
+
+    def revert_transaction_changes(self, transaction_id):
+        self.log.pop(transaction_id, None)
+        self.prepared.pop(transaction_id, None)
+        self.pool.post(self.site_id, "revert_transaction_changes", transaction_id)
+
+    def clear_uncommitted_changes(self):
+        self.log = {}
+        self.pool.post(self.site_id, "clear_uncommitted_changes")
+
+    def disable_accessibility(self, tick, sub_tick=0):
+        replication_map = get_replication_map()
+        self.accessible = {i for i in replication_map.variables_of(self.site_id)
+                           if not replication_map.is_replicated(i)}
+        self.pool.post(self.site_id, "disable_accessibility", tick, sub_tick)
+
+    def checkpoint(self):
+        self.pool.post(self.site_id, "checkpoint")
+
+    def sync_log(self):
+        # the records are durable once the call returns, as with a local log
+        self.pool.call(self.site_id, "sync_log")
+
+    def read_for_transaction(self, transaction_id, idx):
+        changes = self.log.get(transaction_id)
+        if changes is not None and idx in changes:
+            return changes[idx]
+        return self.pool.call(self.site_id, "read_for_transaction", transaction_id, idx)
+
+    def get_variable(self, idx):
+        return self.pool.call(self.site_id, "get_variable", idx)
+
+    def check_accessibility(self, idx):
+        return idx in self.accessible
+
+    def read_version(self, idx, tick, sub_tick=0):
+        return self.pool.call(self.site_id, "read_version", idx, tick, sub_tick)
+
+    def dump_values(self):
+        return self.pool.call(self.site_id, "dump_values")
+
+    def collect_versions(self, watermark):
+        return self.pool.call(self.site_id, "collect_versions", watermark)
+
+    def count_versions(self):
+        return self.pool.call(self.site_id, "count_versions")
+
+
+_pool = None
+
+
+def get_shard_pool():
+    """
+    Get the shard processes described by configurations.py, they are started on first use and reused by every
+    simulation of the process (see ShardPool.reset)
+
+    :return: ShardPool, None if the sites are not sharded
+    """
+    global _pool
+    if configurations.shards <= 0:
+        return None
+    if _pool is not None and (_pool.shards, _pool.number_of_sites) != (configurations.shards,
+                                                                        configurations.number_of_sites):
+        _pool.close()
+        _pool = None
+    if _pool is None:
+        _pool = ShardPool(configurations.shards, configurations.number_of_sites)
+        atexit.register(_pool.close)
+    return _pool
@@ -0,0 +1,130 @@
+from array import array
+from bisect import bisect_left
+
+
+class ListStorage(object):
+    """
+    Committed values of a site kept in Python lists indexed by variable id - 1, None for variables the site does not
+    hold, with a parallel list of accessible flags
+
+    :param self.values: A list of committed values
+    :param self.accessible: A list of accessible flags
+    """
+
+    def __init__(self, variables, variable_counts):
+        self.values = [None] * variable_counts
+        self.accessible = [False] * variable_counts
+        for i in variables:
+            self.values[i - 1] = 10 * i
+            self.accessible[i - 1] = True
+
+    def holds(self, var_id):
+        return self.values[var_id - 1] is not None
+
+    def get(self, var_id):
+        return self.values[var_id - 1]
+
+    def set(self, var_id, val):
+        self.values[var_id - 1] = val
+
+    def is_accessible(self, var_id):
+        return self.accessible[var_id - 1]
+
+    def set_accessible(self, var_id, flag):
+        self.accessible[var_id - 1] = flag
+
+    def commit_many(self, items):
+        values, accessible = self.values, self.accessible
+        for var_id, val in items:
+            values[var_id - 1] = val
+            accessible[var_id - 1] = True
+
+    def count(self):
+        return sum(1 for v in self.values if v is not None)
+
+    def row(self):
+        return list(self.values)
+
+
+class CompactStorage(object):
+    """
+    Committed values of a site kept only for the variables the site holds: a sorted array of variable ids, an array
+    of 64 bit integer values and a bitset of accessible flags. Lookups use binary search on the ids
+
+    :param self.variable_counts: the number of distinct variables in the simulation
+    :param self.ids: An array of the held variable ids in increasing order
+    :param self.values: An array of committed values, parallel to self.ids
+    :param self.accessible: A bytearray used as a bitset of accessible flags, parallel to self.ids
+    """
+
+    def __init__(self, variables, variable_counts):
+        self.variable_counts = variable_counts
+        self.ids = array("L" if variable_counts < 2 ** 32 else "Q", variables)
+        self.values = array("q", (10 * i for i in self.ids))
+        self.accessible = bytearray(b"\xff" * ((len(self.ids) + 7) // 8))
+
+    def _index(self, var_id):
+        pos = bisect_left(self.ids, var_id)
+        if pos < len(self.ids) and self.ids[pos] == var_id:
+            return pos
+        return -1
+
+    def holds(self, var_id):
+        return self._index(var_id) >= 0
+
+    def get(self, var_id):
+        pos = self._index(var_id)
+        return self.values[pos] if pos >= 0 else None
+
+    def set(self, var_id, val):
+        pos = self._index(var_id)
+        if pos < 0:
+            raise KeyError(f"Variable x{var_id} is not stored in this site")
+        self.values[pos] = val
+
+    def is_accessible(self, var_id):
+        pos = self._index(var_id)
+        return pos >= 0 and bool(self.accessible[pos >> 3] & (1 << (pos & 7)))
+
+    def set_accessible(self, var_id, flag):
+        pos = self._index(var_id)
+        if pos < 0:
+            return
+        if flag:
+            self.accessible[pos >> 3] |= 1 << (pos & 7)
+        else:
+            self.accessible[pos >> 3] &= ~(1 << (pos & 7)) & 0xff
+
+    def commit_many(self, items):
+        for var_id, val in items:
+            self.set(var_id, val)
+            self.set_accessible(var_id, True)
+
+    def count(self):
+        return len(self.ids)
+
+    def row(self):
+        row = [None] * self.variable_counts
+        for var_id, val in zip(self.ids, self.values):
+            row[var_id - 1] = val
+        return row
+
+
+STORAGES = {
+    "list": ListStorage,
+    "compact": CompactStorage
+}
+
+
+def create_storage(kind, variables, variable_counts):
+    """
+    Create the storage backend of a data manager
+
+    :param kind: "list" or "compact"
+    :param variables: iterable of the variable ids held by the site, in increasing order
+    :param variable_counts: the number of distinct variables in the simulation
+    :return: ListStorage or CompactStorage
+    """
+    if kind not in STORAGES:
+        raise KeyError(f"Unknown storage: {kind}")
+    return STORAGES[kind](variables, variable_counts)
@@ -1,4 +1,16 @@
-from algorithms.DeadLockDetector import *
+from algorithms.DeadLockDetector import WaitFor
+from algorithms.DeadlockPolicy import create_policy
+from algorithms.ReplicaSelection import create_selector
+from model.managers.GarbageCollector import GarbageCollector
+from model.ReplicationMap import get_replication_map
+from model.managers.Metrics import create_metrics
+from model.managers.ShardPool import get_shard_pool
+from model.managers.TwoPhaseCommit import create_coordinator
+from model.OutputSink import create_sink, ABORT_CODES
+from model.Operation import TRANSACTION_OPERATIONS
+from time import perf_counter_ns
+import configurations
+import heapq
 
 
 class TransactionManager(object):
@@ -8,66 +20,386 @@ class TransactionManager(object):
 
     :param self.transactions: A set to store all running transactions
     :param self.wait_for_graph: A Wait-For object to detect deadlock
-    :param self.blocked: A list contains all blocked operations
+    :param self.deadlock_policy: DeadlockPolicy deciding how deadlocks are detected or prevented
+    :param self.blocked: An ordered dictionary (used as an ordered set) contains all blocked operations
     :param self.blocked_transactions: A set of blocked transactions
     :param self.sites: A list of all sites in the simulation
+    :param self.replication_map: ReplicationMap deciding which sites hold each variable
+    :param self.replica_selector: ReplicaSelector deciding which replica serves a read of a replicated variable
+    :param self.wait_queues: A dictionary mapping a wait key (see Operation.get_wait_keys) to the blocked operations
+                             waiting for it
+    :param self.woken: A set of blocked operations whose wait key fired, they will be retried in the next retry
+    :param self.active_readonly: A dictionary mapping running read-only transaction id to its start tick
+    :param self.gc: A GarbageCollector reclaiming versions no read-only transaction can read
+    :param self.sink: OutputSink receiving reads, commits, aborts and dumps
+    :param self.metrics: Metrics registry, None if metrics are disabled
+    :param self.group_commit: Whether the locks of the transactions committed in a retry pass or a step are released
+                              together at its end (see flush_commits)
+    :param self.coordinator: TwoPhaseCommit coordinating the commits with the sites, None for the local commit
+    :param self.shards: ShardPool holding the data of the sites, None if the sites are not sharded
+    :param self.sub_tick: position (from 1) of the operation being executed by step_batch in its batch, 0 outside
+                          of a batch, the commits, failures and read-only starts of a batch are ordered by it in the
+                          version chains
+    :param self.recorder: TraceRecorder receiving every execution, lock grant, abort and group commit flush (see
+                          utils/trace.py), None if the run is not traced
     """
 
-    def __init__(self):
+    def __init__(self, sink=None, metrics=None):
         self.transactions = {}
         self.wait_for_graph = WaitFor(self)
+        self.deadlock_policy = create_policy(self)
 
-        # store all blocked transaction and its operations
-        self.blocked = []
+        # store all blocked operations in the order they were blocked, (operation: sequence number)
+        self.blocked = {}
 
         # store all blocked transaction id
         self.blocked_transactions = set()
 
         # store Site object to these
         self.sites = []
+        self.replication_map = get_replication_map()
+        self.replica_selector = create_selector(self)
+
+        # wait queues, (wait key: ordered dict of operations), and the keys each blocked operation waits on
+        self.wait_queues = {}
+        self._op_keys = {}
+
+        # operations to be retried in the next retry
+        self.woken = set()
+
+        # number of blocked operations (except end) per transaction, and the transactions whose count changed
+        # since the last retry, self.blocked_transactions is only refreshed at the end of each retry
+        self._blocked_counts = {}
+        self._changed_transactions = set()
+
+        # blocked operations of each transaction, used to drop them when the transaction aborts
+        self._blocked_by_trans = {}
+
+        # running read-only transactions, their start ticks bound the version garbage collection
+        self.active_readonly = {}
+        self.gc = GarbageCollector(self)
+
+        # every observable event of the simulation is reported through the sink
+        self.sink = sink if sink is not None else create_sink(configurations.output_format)
+
+        # optional instrumentation, every use is guarded by a None check so it costs nothing when disabled,
+        # (block tick, executions) of each blocked operation, only tracked when metrics are enabled
+        self.metrics = metrics if metrics is not None else create_metrics()
+        self._block_info = {}
+
+        # group commit, transactions committed but whose locks are not released yet, [(trans_id, site ids)]
+        self.group_commit = configurations.group_commit
+        self._commit_group = []
+
+        # two-phase commit, its messages are delivered at the beginning of each retry
+        self.coordinator = create_coordinator(self)
+
+        # sharded sites, the shards execute the commands of a tick while the next one runs
+        self.shards = get_shard_pool()
+
+        # optional trace of the run, every use is guarded by a None check as for the metrics
+        self.recorder = None
+
+        self.sub_tick = 0
+
+        self._seq = 0
+        # heap of (sequence number, operation) being retried and the sequence number being executed,
+        # operations woken during a retry pass with a larger sequence number are retried in the same pass
+        self._pending = None
+        self._pass_pos = -1
+
+    def notify(self, key):
+        """
+        Wake up every blocked operation waiting for the given key
+
+        :param key: wait key, for example ("var", "x2")
+        :return: None
+        """
+        queue = self.wait_queues.pop(key, None)
+        if not queue:
+            return
+
+        for op in queue:
+            self._unregister(op)
+            seq = self.blocked[op]
+            if self._pending is not None and seq > self._pass_pos:
+                heapq.heappush(self._pending, (seq, op))
+            else:
+                self.woken.add(op)
+
+    def notify_site_changed(self, site_id):
+        """
+        Wake up operations waiting for the given site (or any site) to change status
+
+        :param site_id: site id
+        :return: None
+        """
+        self.notify(("site", site_id))
+        self.notify(("site", None))
+
+    def _on_lock_released(self, variable_id):
+        self.notify(("var", variable_id))
+
+    def _on_lock_granted(self, variable_id, transaction_id):
+        # a queued request has been granted, the blocked operation can now complete
+        self.notify(("var", variable_id))
+
+    def _register(self, op):
+        keys = op.get_wait_keys(self)
+        self._op_keys[op] = keys
+        for key in keys:
+            queue = self.wait_queues.get(key)
+            if queue is None:
+                queue = {}
+                self.wait_queues[key] = queue
+            queue[op] = None
+
+    def _unregister(self, op):
+        for key in self._op_keys.pop(op, ()):
+            queue = self.wait_queues.get(key)
+            if queue is not None:
+                queue.pop(op, None)
+                if not queue:
+                    self.wait_queues.pop(key)
+
+    def _block(self, op):
+        self.blocked[op] = self._seq
+        self._seq += 1
+
+        trans_id = op.get_parameters()[0]
+        self._blocked_by_trans.setdefault(trans_id, []).append(op)
+        if op.get_op_t() != "end":
+            self._blocked_counts[trans_id] = self._blocked_counts.get(trans_id, 0) + 1
+            self._changed_transactions.add(trans_id)
+
+        self._register(op)
+
+    def _unblock(self, op):
+        self.blocked.pop(op)
+        self._block_info.pop(op, None)
+        self._unregister(op)
+        self.woken.discard(op)
+
+        trans_id = op.get_parameters()[0]
+        ops = self._blocked_by_trans.get(trans_id)
+        if ops is not None:
+            ops.remove(op)
+            if not ops:
+                self._blocked_by_trans.pop(trans_id)
+        if op.get_op_t() != "end":
+            self._blocked_counts[trans_id] -= 1
+            if self._blocked_counts[trans_id] == 0:
+                self._blocked_counts.pop(trans_id)
+            self._changed_transactions.add(trans_id)
 
     def retry(self, tick):
         """
         retry blocked operations (update blocked operations and blocked transactions)
 
+        Only operations which have been woken up by an event they wait for (lock released, site status changed or
+        their transaction's blocked operations cleared) are executed, in the order they were blocked
+
         :return: None
         """
-        op_b = []
-        tx_b = set()
-        for op in self.blocked:
-            if not op.execute(tick, self, True):
-                op_b.append(op)
+        if self.shards is not None:
+            self.shards.flush()
+        if self.recorder is not None:
+            self.recorder.begin_tick(tick)
+        if self.coordinator is not None:
+            self.coordinator.deliver(tick)
+
+        self._pending = [(self.blocked[op], op) for op in self.woken]
+        heapq.heapify(self._pending)
+        self.woken = set()
 
-                if op.get_op_t() == "end" and op.get_parameters()[0] not in tx_b:
+        current = None
+        try:
+            while self._pending:
+                seq, op = heapq.heappop(self._pending)
+                # the operation may have been removed by an abort during this pass
+                if self.blocked.get(op) != seq:
                     continue
+                self._pass_pos = seq
+                self._unregister(op)
+
+                current = op
+                if self.metrics is not None:
+                    self.metrics.inc("retries")
+                    if op in self._block_info:
+                        self._block_info[op][1] += 1
+
+                if self.recorder is not None:
+                    self.recorder.executing(op)
+                succeed = op.execute(tick, self, True)
+                if self.recorder is not None:
+                    self.recorder.executed(op, succeed)
 
-                tx_b.add(op.get_parameters()[0])
+                if succeed:
+                    if self.metrics is not None and op in self._block_info:
+                        block_tick, executions = self._block_info.pop(op)
+                        self.metrics.observe("wait_ticks." + op.get_op_t(), tick - block_tick)
+                        self.metrics.observe("retry_attempts." + op.get_op_t(), executions)
+                    # an end which aborted its own transaction has already been removed
+                    if op in self.blocked:
+                        self._unblock(op)
+                else:
+                    self._register(op)
+                    self.deadlock_policy.on_blocked(op, tick)
+                current = None
+        finally:
+            # if an operation raised, it and the operations not retried yet will be retried next time
+            if current is not None and current in self.blocked:
+                self.woken.add(current)
+            for _, op in self._pending:
+                if op in self.blocked and op not in self._op_keys:
+                    self.woken.add(op)
+            self._pending = None
+            self._pass_pos = -1
 
-        self.blocked = op_b
-        self.blocked_transactions = tx_b
+        self._refresh_blocked_transactions()
+        self.flush_commits()
+
+    def _refresh_blocked_transactions(self):
+        # refresh blocked transactions, a transaction without blocked operations wakes up its commit
+        for trans_id in self._changed_transactions:
+            if trans_id in self._blocked_counts:
+                self.blocked_transactions.add(trans_id)
+            elif trans_id in self.blocked_transactions:
+                self.blocked_transactions.remove(trans_id)
+                self.notify(("trans", trans_id))
+        self._changed_transactions = set()
+
+    def in_flight(self):
+        """
+        Check if a two-phase commit still has messages to deliver, the simulation has to keep ticking until they are
+
+        :return: True or False
+        """
+        return self.coordinator is not None and self.coordinator.in_flight()
 
     def _distribute_operation(self, operation, tick):
+        if self.recorder is not None:
+            self.recorder.executing(operation)
         succeed = operation.execute(tick, self)
+        if self.recorder is not None:
+            self.recorder.executed(operation, succeed)
         if not succeed:
-            self.blocked.append(operation)
+            self._block(operation)
+            if self.metrics is not None:
+                self.metrics.inc("blocked")
+                self._block_info[operation] = [tick, 0]
+            self.deadlock_policy.on_blocked(operation, tick)
 
     def step(self, operation, tick):
         """
-        Process the new operation, if this cause a deadlock, the youngest transaction will be aborted
+        Process the new operation, deadlocks are then handled by self.deadlock_policy (by default, if this cause a
+        deadlock, the youngest transaction will be aborted)
+
+        An operation of a transaction which does not exist once the blocked operations have been retried (it never
+        began, or it was aborted by a deadlock policy or a site failure) is reported as ignored and not executed
 
         :param operation: new oepration
         :param tick: time
-        :return: None
+        :return: True if the operation was executed (or blocked), False if it was ignored
         """
         # 2 Steps:
         #   First, retry blocked transactions ans distribute it if possible
         #   Second, distribute the new operation
+        if self.metrics is not None:
+            return self._step_with_metrics(operation, tick)
+
         self.retry(tick)
-        self._distribute_operation(operation, tick)
+        executed = self._accepts(operation)
+        if executed:
+            self._distribute_operation(operation, tick)
+        self.flush_commits()
+        self.deadlock_policy.after_step(operation, tick)
+        self.gc.maybe_collect(tick)
+        return executed
+
+    def _accepts(self, operation):
+        # an operation of a transaction which does not exist is reported as ignored
+        if operation.get_op_t() in TRANSACTION_OPERATIONS and operation.para[0] not in self.transactions:
+            self.sink.ignored(operation)
+            if self.recorder is not None:
+                self.recorder.ignored(operation)
+            return False
+        return True
+
+    def step_batch(self, operations, tick):
+        """
+        Process many independent operations sharing the same tick, with a single retry pass before them, a single
+        deadlock check (or prevention step) and a single garbage collection after them, instead of one of each per
+        operation as with step
 
-        if operation.get_op_t() in {"R", "W"} and self.wait_for_graph.check_deadlock():
-            t = self.get_youngest_transaction(self.wait_for_graph.get_trace())[0]
-            self.abort(t, 2)
+        The operations are executed in the given order, an operation blocked by the batch is retried at the next
+        tick at the earliest, the blocked transactions are refreshed after each operation so the commit of a
+        transaction still waits for its operations blocked earlier in the batch. An operation of a transaction which
+        does not exist when its turn comes (aborted by the retry pass or by an earlier operation of the batch) is
+        skipped and reported as ignored. The commits, site failures and read-only starts of the batch are ordered by
+        their position in the batch (self.sub_tick), so a read-only transaction begun in the batch reads the commits of
+        the earlier operations and not those of the later ones, as if the operations had been stepped one by one
+
+        :param operations: A list of operations
+        :param tick: time
+        :return: A list of the skipped operations
+        """
+        metrics = self.metrics
+        if metrics is not None:
+            start = perf_counter_ns()
+            metrics.observe("batch_size", len(operations))
+
+        skipped = []
+        self.retry(tick)
+        try:
+            for sub_tick, operation in enumerate(operations, 1):
+                if not self._accepts(operation):
+                    skipped.append(operation)
+                    continue
+                if metrics is not None:
+                    metrics.inc("ops." + operation.get_op_t())
+                # a read-only transaction begun in the batch does not see the commits of the later operations
+                self.sub_tick = sub_tick
+                self._distribute_operation(operation, tick)
+                self._refresh_blocked_transactions()
+        finally:
+            self.sub_tick = 0
+        self.flush_commits()
+        self.deadlock_policy.after_batch(operations, tick)
+        self.gc.maybe_collect(tick)
+
+        if metrics is not None:
+            metrics.observe("step_ns.batch", perf_counter_ns() - start)
+        return skipped
+
+    def _step_with_metrics(self, operation, tick):
+        # same as step, timing each phase
+        metrics = self.metrics
+        op_t = operation.get_op_t()
+        metrics.inc("ops." + op_t)
+
+        start = perf_counter_ns()
+        self.retry(tick)
+        retried = perf_counter_ns()
+        executed = self._accepts(operation)
+        if executed:
+            self._distribute_operation(operation, tick)
+        else:
+            metrics.inc("ignored")
+        self.flush_commits()
+        executed_ns = perf_counter_ns()
+
+        self.deadlock_policy.after_step(operation, tick)
+        collect = perf_counter_ns()
+        self.gc.maybe_collect(tick)
+        end = perf_counter_ns()
+
+        metrics.observe("phase_ns.retry", retried - start)
+        metrics.observe("execute_ns." + op_t, executed_ns - retried)
+        metrics.observe("phase_ns.deadlock", collect - executed_ns)
+        metrics.observe("phase_ns.gc", end - collect)
+        metrics.observe("step_ns." + op_t, end - start)
+        return executed
 
     def attach_sites(self, sites):
         """
@@ -77,6 +409,75 @@ class TransactionManager(object):
         :return: None
         """
         self.sites = sites
+        for site in sites:
+            site.lock_manager.metrics = self.metrics
+            site.lock_manager.add_release_listener(self._on_lock_released)
+            site.lock_manager.add_grant_listener(self._on_lock_granted)
+
+    def try_lock(self, site, trans_id, var_id, lock_type, enqueue=True):
+        """
+        Request a lock at a site on behalf of a transaction, the site is remembered in Transaction.sites so the commit
+        or the abort of the transaction only visits the sites it accessed
+
+        :param site: Site
+        :param trans_id: transaction id
+        :param var_id: variable id
+        :param lock_type: 0 represent read lock (shared lock), 1 represent write lock (exclusive lock)
+        :param enqueue: whether to wait in the queue if the lock can not be granted (queued lock mode only)
+        :return: True if get lock otherwise False
+        """
+        self.transactions[trans_id].sites.add(site.site_id)
+        granted = site.lock_manager.try_lock_variable(trans_id, var_id, lock_type, enqueue)
+        if granted and self.recorder is not None:
+            self.recorder.granted(site.site_id, var_id, lock_type)
+        return granted
+
+    def commit(self, trans_id, tick):
+        """
+        Apply the write sets of a committing transaction in bulk at the up sites it wrote to, then release its locks
+        at the sites it accessed
+
+        With group commit, the locks are only released by flush_commits at the end of the retry pass or of the step,
+        so every transaction committed in the same tick wakes up the blocked operations in a single pass
+
+        :param trans_id: transaction id
+        :param tick: commit time
+        :return: None
+        """
+        sites = sorted(self.transactions[trans_id].sites)
+        for site_id in sites:
+            site = self.get_site(site_id)
+            if site.up:
+                site.data_manager.commit_transaction(trans_id, tick, self.sub_tick)
+
+        if self.group_commit:
+            self._commit_group.append((trans_id, sites))
+        else:
+            self._release(trans_id, sites)
+
+    def _release(self, trans_id, sites):
+        for site_id in sites:
+            self.get_site(site_id).lock_manager.release_transaction_locks(trans_id)
+
+    def flush_commits(self):
+        """
+        Release the locks of the transactions committed since the last flush (group commit only), the operations
+        waiting for them are woken up together and retried in the next retry
+
+        :return: None
+        """
+        if not self._commit_group:
+            return
+        group, self._commit_group = self._commit_group, []
+        if self.recorder is not None:
+            self.recorder.flushed()
+        if self.metrics is not None:
+            self.metrics.observe("commit_group_size", len(group))
+        # the whole group is made durable with one sync per site before any lock is released
+        for site_id in sorted({site_id for _, sites in group for site_id in sites}):
+            self.get_site(site_id).data_manager.sync_log()
+        for trans_id, sites in group:
+            self._release(trans_id, sites)
 
     def get_site(self, idx):
         """
@@ -89,45 +490,56 @@ class TransactionManager(object):
 
     def get_youngest_transaction(self, trace):
         """
-        Find the youngest transaction
+        Find the youngest transaction, the transactions begun in the same tick (by step_batch) are ordered by their
+        creation
 
         :param trace: The deadlock cycle
-        :return: The youngest transaction
+        :return: (the youngest transaction, its start order)
         """
-        ages = [(t, self.transactions[t].tick) for t in trace]
-        return sorted(ages, key=lambda x: -x[1])[0]
+        return max(((t, self.transactions[t].start_order) for t in trace), key=lambda x: x[1])
 
     # Abort given transaction
     # Steps:
     #   1. release locks
     #   2. revert transaction changes
     #   3. delete transaction in TM
-    def abort(self, transaction_id, abort_type):
+    def abort(self, transaction_id, abort_type, release=True):
         """
         Abort the transaction
 
         :param transaction_id: The transaction to be aborted
-        :param abort_type: Why does the transaction be aborted, 1 => site fail, 2 => dead lock, 3 => read-only no available version
+        :param abort_type: Why does the transaction be aborted, 1 => site fail, 2 => dead lock, 3 => read-only no available version,
+                           4 => deadlock prevention (wait-die or wound-wait), 5 => the client running the transaction
+                           disconnected (server mode)
+        :param release: Whether to release the locks and revert the changes now, False when the two-phase commit
+                        delivers the abort to the sites itself
         :return: None
         """
-        for site in self.sites:
-            if site.up:
-                site.lock_manager.release_transaction_locks(transaction_id)
-                site.data_manager.revert_transaction_changes(transaction_id)
+        # only the sites the transaction accessed hold its locks and changes
+        if release:
+            for site_id in sorted(self.transactions[transaction_id].sites):
+                site = self.get_site(site_id)
+                if site.up:
+                    site.lock_manager.release_transaction_locks(transaction_id)
+                    site.data_manager.revert_transaction_changes(transaction_id)
+
+        if self.coordinator is not None:
+            self.coordinator.forget(transaction_id)
 
         # Remove any blocked operation belongs to this transaction
-        self.blocked = [op for op in self.blocked if op.get_parameters()[0] != transaction_id]
+        for op in list(self._blocked_by_trans.get(transaction_id, ())):
+            self._unblock(op)
 
         # Remove transaction in wait graph
         self.wait_for_graph.remove_transaction(transaction_id)
 
         self.transactions.pop(transaction_id)
-        if abort_type == 1:
-            print(f"Transaction {transaction_id} aborted (site failure)")
-        elif abort_type == 2:
-            print(f"Transaction {transaction_id} aborted (deadlock)")
-        elif abort_type == 3:
-            print(f"Transaction {transaction_id} aborted (read-only, no version available of the variable to read)")
-        else:
+        self.active_readonly.pop(transaction_id, None)
+        if abort_type not in ABORT_CODES:
             raise ValueError(f"Unknown abort type: {abort_type}")
+        self.sink.abort(transaction_id, abort_type)
+        if self.metrics is not None:
+            self.metrics.inc("aborts." + ABORT_CODES[abort_type])
+        if self.recorder is not None:
+            self.recorder.aborted(transaction_id, abort_type)
 
@@ -0,0 +1,169 @@
+import configurations
+import heapq
+
+# Messages exchanged between the coordinator and the sites
+PREPARE = "prepare"
+VOTE = "vote"
+COMMIT = "commit"
+ABORT = "abort"
+
+
+class TwoPhaseCommit(object):
+    """
+    Two-phase commit, the transaction manager acts as the coordinator of a committing transaction and the sites where
+    the transaction holds locks are the participants
+
+    Every message takes delay ticks to arrive:
+        tick t          the coordinator sends prepare to every participant
+        tick t + d      a participant votes yes if it is up and still holds the locks of the transaction (it did not
+                        fail in between), its write set is then prepared (kept across a failure, see
+                        DataManager.prepare), otherwise it votes no
+        tick t + 2d     the votes reach the coordinator, the transaction commits if every participant voted yes and
+                        aborts (site failure) otherwise, the outcome is reported at this tick
+        tick t + 3d     the decision reaches the participants, which apply or drop the write set and release the locks
+
+    Messages due at a tick are delivered at the beginning of the retry of that tick (TransactionManager.retry), so
+    the operations waiting for the released locks run in the same pass. With a delay of 0 the whole protocol
+    completes within the step of the commit
+
+    :param self.tm: TransactionManager
+    :param self.delay: number of ticks a message takes to arrive
+    :param self.messages: heap of (arrival tick, sequence number, message, transaction id, site id, vote)
+    :param self.states: A dictionary mapping the transaction id of every commit in progress to its state, a
+                        dictionary with the participants, the votes still expected and the tick the commit started
+    """
+
+    def __init__(self, tm, delay):
+        if delay < 0:
+            raise ValueError(f"Invalid message delay: {delay}")
+        self.tm = tm
+        self.delay = delay
+        self.messages = []
+        self.states = {}
+        self._seq = 0
+
+    def _send(self, tick, message, trans_id, site_id, vote=None):
+        self._seq += 1
+        heapq.heappush(self.messages, (tick + self.delay, self._seq, message, trans_id, site_id, vote))
+        if self.tm.metrics is not None:
+            self.tm.metrics.inc("2pc.messages." + message)
+
+    def in_flight(self):
+        """
+        Check if any message has not been delivered yet
+
+        :return: True or False
+        """
+        return bool(self.messages)
+
+    def start(self, trans_id, tick):
+        """
+        Start the commit of a transaction, called by the End operation once the transaction has no blocked operation
+
+        :param trans_id: transaction id
+        :param tick: time
+        :return: None
+        """
+        tm = self.tm
+        participants = sorted(site_id for site_id in tm.transactions[trans_id].sites
+                              if tm.get_site(site_id).lock_manager.holds_locks(trans_id))
+        if not participants:
+            # nothing to prepare (a read-only transaction for example), the coordinator decides alone
+            self._decide(trans_id, tick, True, [])
+            return
+
+        self.states[trans_id] = {"participants": participants, "waiting": set(participants), "tick": tick}
+        for site_id in participants:
+            self._send(tick, PREPARE, trans_id, site_id)
+        self.deliver(tick)
+
+    def forget(self, trans_id):
+        """
+        Drop the commit in progress of a transaction aborted before the decision (by a deadlock for example), the
+        messages still in flight for it are ignored
+
+        :param trans_id: transaction id
+        :return: None
+        """
+        self.states.pop(trans_id, None)
+
+    def deliver(self, tick):
+        """
+        Deliver every message due at or before the tick, in the order they were sent
+
+        :param tick: time
+        :return: None
+        """
+        while self.messages and self.messages[0][0] <= tick:
+            _, _, message, trans_id, site_id, vote = heapq.heappop(self.messages)
+            if message == PREPARE:
+                self._on_prepare(tick, trans_id, site_id)
+            elif message == VOTE:
+                self._on_vote(tick, trans_id, site_id, vote)
+            else:
+                self._on_decision(tick, trans_id, site_id, message == COMMIT)
+
+    def _on_prepare(self, tick, trans_id, site_id):
+        if trans_id not in self.states:
+            return
+        site = self.tm.get_site(site_id)
+        vote = site.up and site.lock_manager.holds_locks(trans_id)
+        if vote:
+            site.data_manager.prepare(trans_id)
+        self._send(tick, VOTE, trans_id, site_id, vote)
+
+    def _on_vote(self, tick, trans_id, site_id, vote):
+        state = self.states.get(trans_id)
+        if state is None:
+            return
+        if not vote:
+            self._decide(trans_id, tick, False, state["participants"])
+            return
+        state["waiting"].discard(site_id)
+        if not state["waiting"]:
+            self._decide(trans_id, tick, True, state["participants"])
+
+    def _decide(self, trans_id, tick, commit, participants):
+        tm = self.tm
+        state = self.states.pop(trans_id, None)
+        if tm.metrics is not None and state is not None:
+            tm.metrics.observe("2pc.round_trip_ticks", tick - state["tick"])
+
+        if commit:
+            tm.transactions[trans_id].committed = True
+            tm.sink.commit(trans_id)
+            if tm.metrics is not None:
+                tm.metrics.inc("commits")
+            tm.active_readonly.pop(trans_id, None)
+            tm.wait_for_graph.remove_transaction(trans_id)
+        else:
+            if tm.metrics is not None:
+                tm.metrics.inc("2pc.aborted")
+            # the participants drop the write set and release the locks when the decision reaches them
+            tm.abort(trans_id, 1, release=False)
+
+        for site_id in participants:
+            self._send(tick, COMMIT if commit else ABORT, trans_id, site_id)
+
+    def _on_decision(self, tick, trans_id, site_id, commit):
+        site = self.tm.get_site(site_id)
+        # a prepared write set survives a failure of the site, so a commit is applied even if the site is down
+        if commit:
+            site.data_manager.commit_transaction(trans_id, tick)
+        else:
+            site.data_manager.revert_transaction_changes(trans_id)
+        site.lock_manager.release_transaction_locks(trans_id)
+
+
+def create_coordinator(tm):
+    """
+    Create the commit coordinator described by configurations.py
+
+    :param tm: TransactionManager
+    :return: TwoPhaseCommit, None for the local commit (the write sets are applied at once when a transaction ends)
+    """
+    if configurations.commit_protocol == "local":
+        return None
+    if configurations.commit_protocol == "2pc":
+        return TwoPhaseCommit(tm, configurations.message_delay)
+    raise KeyError(f"Unknown commit protocol: {configurations.commit_protocol}")
@@ -0,0 +1,178 @@
+import mmap
+import os
+import struct
+import zlib
+
+# Record types of the log
+COMMIT = 1
+FAIL = 2
+
+# type, tick, number of (variable id, value) pairs, followed by the pairs and a CRC32 of everything before it
+RECORD_HEADER = struct.Struct("<BqI")
+RECORD_ITEM = struct.Struct("<Iq")
+RECORD_CRC = struct.Struct("<I")
+
+# magic, format version, tick, number of entries, followed by the entries (variable id, value, accessible flag)
+CHECKPOINT_MAGIC = b"RCCP"
+CHECKPOINT_HEADER = struct.Struct("<4sIqI")
+CHECKPOINT_ENTRY = struct.Struct("<IqB")
+CHECKPOINT_VERSION = 1
+
+
+class WriteAheadLog(object):
+    """
+    Append-only log of the committed changes of one site, with periodic checkpoints of the committed data, so the
+    committed state of the site survives a restart of the simulation
+
+    Only committed data is logged: a record is appended when a transaction commits at the site (its whole write set
+    in one record) or when the site fails (its replicated variables become unreadable). Uncommitted changes are lost
+    by a failure anyway, so the log never needs to be undone
+
+    Records are buffered and made durable (flush + fsync) in batches of sync_batch records or when sync is called,
+    for example once per group commit. Every record carries a CRC32, recovery stops at the first torn or corrupted
+    record and truncates the log there
+
+    :param self.directory: the directory of the site, holding wal.log and checkpoint.bin
+    :param self.sync_batch: number of records appended between two fsync
+    :param self.checkpoint_interval: number of records appended between two checkpoints, 0 disables checkpoints
+    :param self.pending: number of records appended since the last fsync
+    :param self.records: number of records appended since the last checkpoint
+    :param self.last_tick: tick of the last record appended or recovered
+    """
+
+    def __init__(self, directory, sync_batch=1, checkpoint_interval=1000):
+        self.directory = directory
+        self.sync_batch = max(1, sync_batch)
+        self.checkpoint_interval = checkpoint_interval
+        self.pending = 0
+        self.records = 0
+        self.last_tick = 0
+
+        os.makedirs(directory, exist_ok=True)
+        self._log_path = os.path.join(directory, "wal.log")
+        self._checkpoint_path = os.path.join(directory, "checkpoint.bin")
+        self._file = None
+
+    def _open(self):
+        if self._file is None:
+            self._file = open(self._log_path, "ab")
+        return self._file
+
+    def _append(self, record_type, tick, items):
+        body = RECORD_HEADER.pack(record_type, tick, len(items)) + b"".join(RECORD_ITEM.pack(i, v) for i, v in items)
+        self._open().write(body + RECORD_CRC.pack(zlib.crc32(body)))
+        self.last_tick = max(self.last_tick, tick)
+        self.records += 1
+        self.pending += 1
+        if self.pending >= self.sync_batch:
+            self.sync()
+
+    def log_commit(self, tick, changes):
+        """
+        Append the write set a transaction committed at this site
+
+        :param tick: commit time
+        :param changes: A list of (variable id, value)
+        :return: None
+        """
+        self._append(COMMIT, tick, changes)
+
+    def log_fail(self, tick):
+        """
+        Append a site failure, the replicated variables of the site are not readable until a commit writes them
+
+        :param tick: time of the failure
+        :return: None
+        """
+        self._append(FAIL, tick, ())
+
+    def sync(self):
+        """
+        Make every appended record durable
+
+        :return: None
+        """
+        if self._file is not None and self.pending:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+        self.pending = 0
+
+    def should_checkpoint(self):
+        return self.checkpoint_interval > 0 and self.records >= self.checkpoint_interval
+
+    def checkpoint(self, entries):
+        """
+        Write the committed data of the site to a new checkpoint and start an empty log, the checkpoint is written to
+        a temporary file and atomically renamed, so a crash leaves either the old or the new checkpoint
+
+        :param entries: An iterable of (variable id, value, accessible flag) of every variable held by the site
+        :return: None
+        """
+        entries = list(entries)
+        tmp_path = self._checkpoint_path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(CHECKPOINT_HEADER.pack(CHECKPOINT_MAGIC, CHECKPOINT_VERSION, self.last_tick, len(entries)))
+            f.write(b"".join(CHECKPOINT_ENTRY.pack(i, v, 1 if a else 0) for i, v, a in entries))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self._checkpoint_path)
+
+        # everything logged so far is in the checkpoint
+        self.close()
+        with open(self._log_path, "wb") as f:
+            os.fsync(f.fileno())
+        self.records = 0
+
+    def recover(self):
+        """
+        Read the checkpoint (memory mapped) and replay the log after it
+
+        :return: (entries, records), entries is a dictionary mapping variable id to (value, accessible flag) from the
+                 checkpoint (empty if there is none), records is a list of (type, tick, [(variable id, value)])
+        """
+        entries = {}
+        if os.path.exists(self._checkpoint_path) and os.path.getsize(self._checkpoint_path) > 0:
+            with open(self._checkpoint_path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                magic, version, tick, count = CHECKPOINT_HEADER.unpack_from(mm, 0)
+                if magic != CHECKPOINT_MAGIC or version != CHECKPOINT_VERSION:
+                    raise ValueError(f"Invalid checkpoint: {self._checkpoint_path}")
+                self.last_tick = tick
+                end = CHECKPOINT_HEADER.size + count * CHECKPOINT_ENTRY.size
+                for var_id, value, accessible in CHECKPOINT_ENTRY.iter_unpack(mm[CHECKPOINT_HEADER.size:end]):
+                    entries[var_id] = (value, bool(accessible))
+
+        records = []
+        if os.path.exists(self._log_path):
+            with open(self._log_path, "rb") as f:
+                data = f.read()
+            pos = 0
+            while pos + RECORD_HEADER.size <= len(data):
+                record_type, tick, count = RECORD_HEADER.unpack_from(data, pos)
+                end = pos + RECORD_HEADER.size + count * RECORD_ITEM.size
+                if end + RECORD_CRC.size > len(data):
+                    break
+                (crc,) = RECORD_CRC.unpack_from(data, end)
+                if crc != zlib.crc32(data[pos:end]):
+                    break
+                items = list(RECORD_ITEM.iter_unpack(data[pos + RECORD_HEADER.size:end]))
+                records.append((record_type, tick, items))
+                self.last_tick = max(self.last_tick, tick)
+                pos = end + RECORD_CRC.size
+
+            # drop a torn tail, new records are appended after the last valid one
+            if pos < len(data):
+                with open(self._log_path, "r+b") as f:
+                    f.truncate(pos)
+        self.records = len(records)
+        return entries, records
+
+    def close(self):
+        """
+        Sync and close the log file
+
+        :return: None
+        """
+        self.sync()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
@@ -0,0 +1,110 @@
+import io
+import random
+import unittest
+from algorithms.DeadLockDetector import WaitFor
+from model.managers.TransactionManager import TransactionManager
+from model.Operation import OperationParser
+from model.OutputSink import TextSink
+from utils.driver import init_sites
+
+
+def reachable(graph, source):
+    seen, stack = set(), list(graph.get(source, ()))
+    while stack:
+        node = stack.pop()
+        if node not in seen:
+            seen.add(node)
+            stack.extend(graph.get(node, ()))
+    return seen
+
+
+def reference_components(graph):
+    # the exhaustive check of the original detector: a transaction is deadlocked if it can reach itself
+    closure = {node: reachable(graph, node) for node in graph}
+    components = set()
+    for node in graph:
+        if node in closure[node]:
+            components.add(frozenset(other for other in closure[node] if node in closure.get(other, ())))
+    return components
+
+
+def random_graph(rng, nodes, edges):
+    graph = {}
+    for _ in range(edges):
+        a, b = rng.sample(range(nodes), 2)
+        graph.setdefault(f"T{a}", set()).add(f"T{b}")
+    return graph
+
+
+def build(graph):
+    wait_for = WaitFor(None)
+    for source, targets in graph.items():
+        for target in sorted(targets):
+            wait_for._add_edge(source, target)
+    return wait_for
+
+
+class WaitForTest(unittest.TestCase):
+    def assert_cycle(self, graph, trace):
+        self.assertTrue(trace)
+        for cur, nxt in zip(trace, trace[1:] + trace[:1]):
+            self.assertIn(nxt, graph[cur])
+
+    def test_components_match_reference(self):
+        rng = random.Random(7)
+        for _ in range(300):
+            graph = random_graph(rng, rng.randint(2, 12), rng.randint(1, 24))
+            components = {frozenset(c) for c in build(graph).get_deadlocked_components()}
+            self.assertEqual(components, reference_components(graph))
+
+    def test_detection_matches_reference_until_resolved(self):
+        # abort a transaction of each cycle found until no cycle is left, both modes agree with the reference
+        rng = random.Random(11)
+        for _ in range(300):
+            graph = random_graph(rng, rng.randint(2, 12), rng.randint(1, 24))
+            for incremental in (True, False):
+                wait_for = build(graph)
+                remaining = {node: set(targets) for node, targets in graph.items()}
+                while True:
+                    found = wait_for.check_deadlock(incremental)
+                    self.assertEqual(found, bool(reference_components(remaining)))
+                    if not found:
+                        break
+                    trace = wait_for.get_trace()
+                    if incremental:
+                        self.assert_cycle(remaining, trace)
+                    else:
+                        self.assertIn(frozenset(trace), reference_components(remaining))
+                    victim = max(trace)
+                    wait_for.remove_transaction(victim)
+                    remaining.pop(victim, None)
+
+    def test_incremental_finds_cycle_closed_far_from_new_edge(self):
+        wait_for = build({"T1": {"T2"}, "T2": {"T3"}})
+        self.assertFalse(wait_for.check_deadlock())
+        self.assertEqual(wait_for.dirty, {})
+        wait_for._add_edge("T3", "T1")
+        self.assertTrue(wait_for.check_deadlock())
+        self.assertEqual(sorted(wait_for.get_trace()), ["T1", "T2", "T3"])
+
+
+class MultipleDeadlocksTest(unittest.TestCase):
+    def test_every_cycle_is_resolved(self):
+        stream = io.StringIO()
+        tm = TransactionManager(sink=TextSink(stream))
+        tm.attach_sites(init_sites())
+        operations = OperationParser.parse_many([
+            "begin(T1)", "begin(T2)", "begin(T3)", "begin(T4)",
+            "W(T1,x1,1)", "W(T2,x3,3)", "W(T3,x5,5)", "W(T4,x7,7)",
+            "W(T1,x3,1)", "W(T3,x7,5)", "W(T2,x1,3)", "W(T4,x5,7)"])
+        for tick, op in enumerate(operations[:-2], 1):
+            tm.step(op, tick)
+        # close both cycles in one batch, T2 and T4 are the youngest
+        tm.step_batch(operations[-2:], len(operations))
+
+        self.assertEqual(stream.getvalue().splitlines(), ["A T2 deadlock", "A T4 deadlock"])
+        self.assertFalse(tm.wait_for_graph.get_deadlocked_components())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,46 @@
+import unittest
+from model.managers.Metrics import Metrics
+from model.Operation import OperationParser
+from tests.test_transaction_manager import make_tm
+
+
+def run(tm, lines, tick):
+    for operation in OperationParser.parse_many(lines):
+        tick += 1
+        tm.step(operation, tick)
+    return tick
+
+
+class GarbageCollectorTest(unittest.TestCase):
+    def test_versions_older_than_oldest_readonly_are_pruned(self):
+        tm, stream = make_tm(Metrics())
+        tm.gc.interval = 0
+        tick = run(tm, ["begin(T1)", "W(T1,x2,21)", "end(T1)", "beginRO(T2)"], 0)
+        tick = run(tm, ["begin(T3)", "W(T3,x2,22)", "end(T3)", "begin(T4)", "W(T4,x2,23)", "end(T4)"], tick)
+        site = tm.sites[0].data_manager
+        # x2 has its initial value, the value read by T2 and two later ones
+        self.assertEqual(len(site.versions[2].ticks), 4)
+
+        tick += 1
+        reclaimed = tm.gc.collect(tick)
+        self.assertEqual(tm.gc.last_watermark, 4)
+        self.assertEqual(reclaimed, len(tm.sites))
+        self.assertEqual(len(site.versions[2].ticks), 3)
+
+        # the long-running read-only transaction still reads its snapshot
+        tick = run(tm, ["R(T2,x2)", "end(T2)"], tick)
+        self.assertEqual(stream.getvalue().splitlines()[-2:], ["R T2 x2 21 @1", "C T2"])
+
+        tick += 1
+        tm.gc.collect(tick)
+        self.assertNotIn(2, site.versions)
+        stats = tm.gc.get_stats()
+        self.assertEqual(stats["runs"], 2)
+        self.assertEqual(stats["reclaimed"], 3 * len(tm.sites))
+        self.assertEqual(stats["live_versions"], sum(s.data_manager.storage.count() for s in tm.sites))
+        self.assertEqual(tm.metrics.counters["gc.runs"], 2)
+        self.assertEqual(tm.metrics.counters["gc.reclaimed"], 3 * len(tm.sites))
+
+
+if __name__ == "__main__":
+    unittest.main()
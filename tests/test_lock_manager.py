@@ -0,0 +1,80 @@
+import unittest
+from model.managers.LockManager import LockManager
+
+
+class QueuedLockModeTest(unittest.TestCase):
+    def setUp(self):
+        self.lm = LockManager(queued=True)
+        self.granted = []
+        self.lm.add_grant_listener(lambda var_id, trans_id: self.granted.append((var_id, trans_id)))
+
+    def queue(self, var_id="x2"):
+        return [tuple(waiter) for waiter in self.lm.wait_queues.get(var_id, ())]
+
+    def test_new_reader_waits_behind_writer(self):
+        self.assertTrue(self.lm.try_lock_variable("T1", "x2", 0))
+        self.assertFalse(self.lm.try_lock_variable("T2", "x2", 1))
+        # compatible with the shared lock of T1, but a writer is waiting
+        self.assertFalse(self.lm.try_lock_variable("T3", "x2", 0))
+        self.assertEqual(self.queue(), [("T2", 1), ("T3", 0)])
+
+        self.lm.release_transaction_locks("T1")
+        self.assertEqual(self.granted, [("x2", "T2")])
+        self.assertEqual(self.lm.get_lock_type("T2", "x2"), 1)
+        self.assertEqual(self.queue(), [("T3", 0)])
+
+        self.lm.release_transaction_locks("T2")
+        self.assertEqual(self.granted, [("x2", "T2"), ("x2", "T3")])
+        self.assertEqual(self.queue(), [])
+
+    def test_waiting_readers_are_granted_together(self):
+        self.assertTrue(self.lm.try_lock_variable("T1", "x2", 1))
+        self.assertFalse(self.lm.try_lock_variable("T2", "x2", 0))
+        self.assertFalse(self.lm.try_lock_variable("T3", "x2", 0))
+        self.assertFalse(self.lm.try_lock_variable("T4", "x2", 1))
+
+        self.lm.release_transaction_locks("T1")
+        self.assertEqual(self.granted, [("x2", "T2"), ("x2", "T3")])
+        self.assertEqual(self.queue(), [("T4", 1)])
+
+    def test_upgrade_goes_ahead_of_waiting_writers(self):
+        self.assertTrue(self.lm.try_lock_variable("T1", "x2", 0))
+        self.assertTrue(self.lm.try_lock_variable("T2", "x2", 0))
+        self.assertFalse(self.lm.try_lock_variable("T3", "x2", 1))
+        # T1 already holds a shared lock, its upgrade waits in front of T3
+        self.assertFalse(self.lm.try_lock_variable("T1", "x2", 1))
+        self.assertEqual(self.queue(), [("T1", 1), ("T3", 1)])
+
+        self.lm.release_transaction_locks("T2")
+        self.assertEqual(self.granted, [("x2", "T1")])
+        self.assertEqual(self.lm.get_lock_type("T1", "x2"), 1)
+
+        self.lm.release_transaction_locks("T1")
+        self.assertEqual(self.granted, [("x2", "T1"), ("x2", "T3")])
+
+    def test_upgrades_keep_their_order(self):
+        for trans_id in ("T1", "T2", "T3"):
+            self.assertTrue(self.lm.try_lock_variable(trans_id, "x2", 0))
+        self.assertFalse(self.lm.try_lock_variable("T4", "x2", 1))
+        self.assertFalse(self.lm.try_lock_variable("T1", "x2", 1))
+        self.assertFalse(self.lm.try_lock_variable("T2", "x2", 1))
+        self.assertEqual(self.queue(), [("T1", 1), ("T2", 1), ("T4", 1)])
+
+        # T2 gives up (aborted), T1 still waits for the shared lock of T3
+        self.lm.release_transaction_locks("T2")
+        self.assertEqual(self.queue(), [("T1", 1), ("T4", 1)])
+        self.assertEqual(self.granted, [])
+        self.lm.release_transaction_locks("T3")
+        self.assertEqual(self.granted, [("x2", "T1")])
+        self.assertEqual(self.queue(), [("T4", 1)])
+
+    def test_conflicts_include_transactions_waiting_ahead(self):
+        self.assertTrue(self.lm.try_lock_variable("T1", "x2", 0))
+        self.assertFalse(self.lm.try_lock_variable("T2", "x2", 1))
+        self.assertFalse(self.lm.try_lock_variable("T3", "x2", 0))
+        self.assertEqual(self.lm.get_conflicting_transactions("T3", "x2", 0), {"T2"})
+        self.assertEqual(self.lm.get_conflicting_transactions("T2", "x2", 1), {"T1"})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,38 @@
+import io
+import unittest
+from model.managers.TransactionManager import TransactionManager
+from model.Operation import OperationParser
+from model.OutputSink import TextSink
+from utils.driver import init_sites
+
+
+class WriteRollbackTest(unittest.TestCase):
+    def setUp(self):
+        self.tm = TransactionManager(sink=TextSink(io.StringIO()))
+        self.tm.attach_sites(init_sites())
+        for tick, op in enumerate(OperationParser.parse_many(["begin(T1)", "begin(T2)", "R(T1,x2)"]), 1):
+            self.tm.step(op, tick)
+
+    def test_failed_write_keeps_previous_shared_lock(self):
+        # T2 only reads x2 at site 2, the write of T1 promotes its lock at site 1 and then fails at site 2
+        self.tm.get_site(2).lock_manager.try_lock_variable("T2", "x2", 0)
+        write = OperationParser.parse_many(["W(T1,x2,11)"])[0]
+        self.assertFalse(write.execute(4, self.tm))
+
+        self.assertEqual(self.tm.get_site(1).lock_manager.get_lock_type("T1", "x2"), 0)
+        self.assertEqual(self.tm.get_site(2).lock_manager.get_lock_type("T2", "x2"), 0)
+        # the sites after site 2 were never locked
+        self.assertIsNone(self.tm.get_site(3).lock_manager.get_lock_type("T1", "x2"))
+
+    def test_failed_write_releases_new_locks(self):
+        self.tm.get_site(3).lock_manager.try_lock_variable("T2", "x2", 0)
+        write = OperationParser.parse_many(["W(T1,x2,11)"])[0]
+        self.assertFalse(write.execute(4, self.tm))
+
+        self.assertEqual(self.tm.get_site(1).lock_manager.get_lock_type("T1", "x2"), 0)
+        self.assertIsNone(self.tm.get_site(2).lock_manager.get_lock_type("T1", "x2"))
+        self.assertFalse(self.tm.get_site(2).lock_manager.holds_locks("T1"))
+
+
+if __name__ == "__main__":
+    unittest.main()
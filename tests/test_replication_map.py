@@ -0,0 +1,65 @@
+import configurations
+import glob
+import os
+import unittest
+from model.OutputSink import NullSink
+from model.ReplicationMap import DefaultReplicationMap, RangeReplicationMap, HashReplicationMap
+from utils.driver import run
+from utils.FileLoader import iter_cases
+
+TEST_FILES = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "test_files")
+
+# (number of sites, number of variables, replication factor)
+SIZES = [(10, 20, 3), (10, 20, 1), (10, 20, 10), (7, 100, 2), (10, 5, 3), (1, 8, 1), (3, 1000, 3)]
+
+
+class InverseMappingTest(unittest.TestCase):
+    def assert_inverse(self, replication_map):
+        held = {site_id: [] for site_id in range(1, replication_map.number_of_sites + 1)}
+        for var_id in range(1, replication_map.variable_counts + 1):
+            sites = replication_map.sites_of(var_id)
+            self.assertEqual(sites, sorted(set(sites)))
+            self.assertTrue(sites)
+            for site_id in sites:
+                held[site_id].append(var_id)
+
+        for site_id, variables in held.items():
+            self.assertEqual(list(replication_map.variables_of(site_id)), variables, f"site {site_id}")
+
+    def test_default(self):
+        for sites, variables, _ in SIZES:
+            self.assert_inverse(DefaultReplicationMap(sites, variables))
+
+    def test_range(self):
+        for sites, variables, factor in SIZES:
+            replication_map = RangeReplicationMap(sites, variables, factor)
+            self.assert_inverse(replication_map)
+            for var_id in range(1, variables + 1):
+                self.assertEqual(len(replication_map.sites_of(var_id)), factor)
+
+    def test_hash(self):
+        for sites, variables, factor in SIZES:
+            replication_map = HashReplicationMap(sites, variables, factor)
+            self.assert_inverse(replication_map)
+            for var_id in range(1, variables + 1):
+                self.assertEqual(len(replication_map.sites_of(var_id)), factor)
+
+
+class PlacementRunTest(unittest.TestCase):
+    def setUp(self):
+        self.placement = configurations.placement
+
+    def tearDown(self):
+        configurations.placement = self.placement
+
+    def test_test_files_run_with_every_placement(self):
+        # transactions aborted by site failures under another layout still issue operations
+        for placement in ("range", "hash"):
+            configurations.placement = placement
+            for path in sorted(glob.glob(os.path.join(TEST_FILES, "*.txt"))):
+                for case in iter_cases(path):
+                    run(case, sink=NullSink())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,89 @@
+import asyncio
+import configurations
+import os
+import tempfile
+import unittest
+from utils.server import Server
+
+
+async def send(path, lines):
+    reader, writer = await asyncio.open_unix_connection(path)
+    writer.write("".join(line + "\n" for line in lines).encode())
+    await writer.drain()
+    output = await asyncio.wait_for(reader.read(), 5)
+    writer.close()
+    return output.decode().splitlines()
+
+
+class ServerTest(unittest.TestCase):
+    def setUp(self):
+        self.output_format = configurations.output_format
+        configurations.output_format = "text"
+
+    def tearDown(self):
+        configurations.output_format = self.output_format
+
+    def test_disconnect_aborts_transactions_of_client(self):
+        async def scenario(path):
+            server = Server(tick_interval=0.001)
+            task = asyncio.create_task(server.serve(path=path))
+            while not os.path.exists(path):
+                await asyncio.sleep(0.001)
+
+            first = await send(path, ["begin(T1)", "W(T1,x2,5)", "quit"])
+            second = await send(path, ["begin(T2)", "R(T2,x2)", "end(T2)", "quit"])
+            task.cancel()
+            return first, second
+
+        with tempfile.TemporaryDirectory() as directory:
+            first, second = asyncio.run(scenario(os.path.join(directory, "server.sock")))
+
+        self.assertEqual(first, ["A T1 disconnected"])
+        self.assertEqual(second, ["R T2 x2 20 @1", "C T2"])
+
+    def test_idle_ticks_resolve_periodic_deadlocks(self):
+        configurations.deadlock_policy, deadlock_policy = "periodic", configurations.deadlock_policy
+        configurations.deadlock_interval, deadlock_interval = 1000, configurations.deadlock_interval
+
+        async def write(writer, lines):
+            writer.write("".join(line + "\n" for line in lines).encode())
+            await writer.drain()
+
+        async def scenario(path):
+            server = Server(tick_interval=0.001)
+            task = asyncio.create_task(server.serve(path=path))
+            while not os.path.exists(path):
+                await asyncio.sleep(0.001)
+
+            first_reader, first_writer = await asyncio.open_unix_connection(path)
+            second_reader, second_writer = await asyncio.open_unix_connection(path)
+            await write(first_writer, ["begin(T1)", "W(T1,x1,1)"])
+            await write(second_writer, ["begin(T2)", "W(T2,x3,2)"])
+            while len(server.owners) < 2:
+                await asyncio.sleep(0.001)
+
+            # both writes block, no operation arrives afterwards, only the idle ticks can break the deadlock
+            await write(first_writer, ["W(T1,x3,1)"])
+            await write(second_writer, ["W(T2,x1,2)"])
+            aborted = await asyncio.wait_for(second_reader.readline(), 5)
+            await write(first_writer, ["end(T1)", "quit"])
+            await write(second_writer, ["quit"])
+            first = await asyncio.wait_for(first_reader.read(), 5)
+            second = aborted + await asyncio.wait_for(second_reader.read(), 5)
+            first_writer.close()
+            second_writer.close()
+            task.cancel()
+            return first.decode().splitlines(), second.decode().splitlines(), server.tm.blocked
+
+        try:
+            with tempfile.TemporaryDirectory() as directory:
+                first, second, blocked = asyncio.run(scenario(os.path.join(directory, "server.sock")))
+        finally:
+            configurations.deadlock_policy, configurations.deadlock_interval = deadlock_policy, deadlock_interval
+
+        self.assertEqual(first, ["C T1"])
+        self.assertEqual(second, ["A T2 deadlock"])
+        self.assertEqual(blocked, {})
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,78 @@
+import configurations
+import glob
+import io
+import os
+import unittest
+from model.managers.TransactionManager import TransactionManager
+from model.Operation import OperationParser
+from model.OutputSink import TextSink
+from utils.driver import init_sites, run
+from utils.FileLoader import iter_cases
+
+TEST_FILES = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "test_files")
+
+
+def run_cases(cases):
+    stream = io.StringIO()
+    for case in cases:
+        run(case, sink=TextSink(stream))
+    return stream.getvalue()
+
+
+class ShardPoolTest(unittest.TestCase):
+    def setUp(self):
+        self.settings = configurations.shards, configurations.commit_protocol
+
+    def tearDown(self):
+        configurations.shards, configurations.commit_protocol = self.settings
+
+    def assert_same_output(self):
+        cases = [case for path in sorted(glob.glob(os.path.join(TEST_FILES, "*.txt"))) for case in iter_cases(path)]
+        configurations.shards = 0
+        expected = run_cases(cases)
+        configurations.shards = 2
+        self.assertEqual(run_cases(cases), expected)
+
+    def test_sharded_sites_give_same_output(self):
+        self.assert_same_output()
+
+    def test_sharded_sites_give_same_output_with_two_phase_commit(self):
+        configurations.commit_protocol = "2pc"
+        self.assert_same_output()
+
+    def test_mirrored_state_follows_shards(self):
+        configurations.shards = 2
+        tm = TransactionManager(sink=TextSink(io.StringIO()))
+        tm.attach_sites(init_sites())
+        operations = OperationParser.parse_many(["begin(T1)", "W(T1,x2,21)", "W(T1,x3,31)", "fail(1)", "recover(1)",
+                                                 "begin(T2)", "W(T2,x4,41)", "end(T2)", "fail(2)", "recover(2)"])
+        for tick, operation in enumerate(operations, 1):
+            tm.step(operation, tick)
+
+        for site in tm.sites:
+            manager = site.data_manager
+            self.assertEqual(manager.accessible, set(manager.pool.call(site.site_id, "accessible_variables")))
+        self.assertEqual(tm.sites[0].data_manager.accessible, {4})
+        self.assertEqual(tm.sites[3].data_manager.read_for_transaction("T1", 2), 21)
+        self.assertEqual(tm.sites[3].data_manager.read_for_transaction("T1", 4), 41)
+
+    def test_versions_are_collected_in_every_shard(self):
+        lines = ["begin(T1)", "W(T1,x2,21)", "end(T1)", "beginRO(T2)", "begin(T3)", "W(T3,x2,22)", "end(T3)",
+                 "begin(T4)", "W(T4,x4,41)", "end(T4)"]
+        stats = []
+        for shards in (0, 2):
+            configurations.shards = shards
+            tm = TransactionManager(sink=TextSink(io.StringIO()))
+            tm.attach_sites(init_sites())
+            tm.gc.interval = 0
+            for tick, operation in enumerate(OperationParser.parse_many(lines), 1):
+                tm.step(operation, tick)
+            tm.gc.collect(len(lines) + 1)
+            stats.append(tm.gc.get_stats())
+        self.assertEqual(stats[0]["reclaimed"], 10)
+        self.assertEqual(stats[1], stats[0])
+
+
+
+if __name__ == "__main__":
+    unittest.main()
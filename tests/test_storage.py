@@ -0,0 +1,81 @@
+import configurations
+import glob
+import io
+import os
+import random
+import unittest
+from contextlib import redirect_stdout
+from model.managers.Storage import ListStorage, CompactStorage
+from model.ReplicationMap import DefaultReplicationMap, HashReplicationMap
+from utils.driver import run
+from utils.FileLoader import iter_cases
+
+TEST_FILES = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "test_files")
+
+
+class StorageEquivalenceTest(unittest.TestCase):
+    def assert_same(self, a, b, variable_counts):
+        for var_id in range(1, variable_counts + 1):
+            self.assertEqual(a.holds(var_id), b.holds(var_id), f"x{var_id}")
+            self.assertEqual(a.get(var_id), b.get(var_id), f"x{var_id}")
+            if a.holds(var_id):
+                self.assertEqual(a.is_accessible(var_id), b.is_accessible(var_id), f"x{var_id}")
+        self.assertEqual(a.count(), b.count())
+        self.assertEqual(a.row(), b.row())
+
+    def test_random_operations(self):
+        rng = random.Random(3)
+        for replication_map in (DefaultReplicationMap(10, 20), HashReplicationMap(7, 300, 2)):
+            counts = replication_map.variable_counts
+            for site_id in range(1, replication_map.number_of_sites + 1):
+                held = list(replication_map.variables_of(site_id))
+                a, b = ListStorage(held, counts), CompactStorage(held, counts)
+                self.assert_same(a, b, counts)
+
+                for _ in range(200):
+                    var_id = rng.choice(held)
+                    action = rng.randrange(3)
+                    if action == 0:
+                        value = rng.randint(-2 ** 40, 2 ** 40)
+                        a.set(var_id, value)
+                        b.set(var_id, value)
+                    elif action == 1:
+                        flag = rng.random() < 0.5
+                        a.set_accessible(var_id, flag)
+                        b.set_accessible(var_id, flag)
+                    else:
+                        items = [(i, rng.randint(0, 1000)) for i in rng.sample(held, min(3, len(held)))]
+                        a.commit_many(items)
+                        b.commit_many(items)
+                self.assert_same(a, b, counts)
+
+    def test_compact_rejects_variables_not_held(self):
+        storage = CompactStorage([2, 4], 5)
+        self.assertIsNone(storage.get(3))
+        self.assertFalse(storage.is_accessible(3))
+        with self.assertRaises(KeyError):
+            storage.set(3, 1)
+
+
+class StorageRunTest(unittest.TestCase):
+    def setUp(self):
+        self.storage = configurations.storage
+
+    def tearDown(self):
+        configurations.storage = self.storage
+
+    def run_files(self, storage):
+        configurations.storage = storage
+        buffer = io.StringIO()
+        with redirect_stdout(buffer):
+            for path in sorted(glob.glob(os.path.join(TEST_FILES, "*.txt"))):
+                for case in iter_cases(path):
+                    run(case)
+        return buffer.getvalue()
+
+    def test_same_output_on_test_files(self):
+        self.assertEqual(self.run_files("compact"), self.run_files("list"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,65 @@
+import io
+import unittest
+from model.managers.Metrics import Metrics
+from model.managers.TransactionManager import TransactionManager
+from model.Operation import OperationParser
+from model.OutputSink import TextSink
+from utils.driver import init_sites
+
+
+def make_tm(metrics=None):
+    stream = io.StringIO()
+    tm = TransactionManager(sink=TextSink(stream), metrics=metrics)
+    tm.attach_sites(init_sites())
+    return tm, stream
+
+
+class StepBatchTest(unittest.TestCase):
+    def test_readonly_does_not_see_later_commit_of_its_batch(self):
+        tm, stream = make_tm()
+        begin, write, begin_ro, end, read = OperationParser.parse_many(
+            ["begin(T1)", "W(T1,x2,99)", "beginRO(T2)", "end(T1)", "R(T2,x2)"])
+        tm.step(begin, 1)
+        tm.step(write, 2)
+        tm.step_batch([begin_ro, end], 3)
+        tm.step(read, 4)
+        self.assertEqual(stream.getvalue().splitlines(), ["C T1", "R T2 x2 20 @1"])
+
+    def test_readonly_sees_earlier_commit_of_its_batch(self):
+        tm, stream = make_tm()
+        begin, write, end, begin_ro, read = OperationParser.parse_many(
+            ["begin(T1)", "W(T1,x2,99)", "end(T1)", "beginRO(T2)", "R(T2,x2)"])
+        tm.step(begin, 1)
+        tm.step(write, 2)
+        tm.step_batch([end, begin_ro], 3)
+        tm.step(read, 4)
+        self.assertEqual(stream.getvalue().splitlines(), ["C T1", "R T2 x2 99 @1"])
+
+
+class StepTest(unittest.TestCase):
+    def assert_ignored(self, metrics):
+        tm, stream = make_tm(metrics)
+        begin, read = OperationParser.parse_many(["begin(T1)", "R(T9,x1)"])
+        self.assertIs(tm.step(begin, 1), True)
+        self.assertIs(tm.step(read, 2), False)
+        self.assertEqual(stream.getvalue().splitlines(), ["I R(T9,x1)"])
+
+    def test_operation_of_missing_transaction_is_ignored(self):
+        self.assert_ignored(None)
+
+    def test_operation_of_missing_transaction_is_ignored_with_metrics(self):
+        metrics = Metrics()
+        self.assert_ignored(metrics)
+        self.assertEqual(metrics.counters["ignored"], 1)
+
+
+class YoungestTransactionTest(unittest.TestCase):
+    def test_transactions_begun_in_same_batch_are_ordered_by_creation(self):
+        tm, _ = make_tm()
+        tm.step_batch(OperationParser.parse_many(["begin(T2)", "begin(T1)"]), 1)
+        self.assertEqual(tm.get_youngest_transaction(["T2", "T1"])[0], "T1")
+        self.assertEqual(tm.get_youngest_transaction(["T1", "T2"])[0], "T1")
+
+
+if __name__ == "__main__":
+    unittest.main()
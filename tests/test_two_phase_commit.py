@@ -0,0 +1,78 @@
+import configurations
+import io
+import unittest
+from model.managers.TransactionManager import TransactionManager
+from model.Operation import OperationParser
+from model.OutputSink import TextSink
+from utils.driver import init_sites
+
+
+class TwoPhaseCommitTest(unittest.TestCase):
+    def setUp(self):
+        self.settings = (configurations.commit_protocol, configurations.message_delay)
+        configurations.commit_protocol, configurations.message_delay = "2pc", 2
+
+        self.stream = io.StringIO()
+        self.tm = TransactionManager(sink=TextSink(self.stream))
+        self.tm.attach_sites(init_sites())
+        # x1 is only held by site 2, the commit of T1 starts at tick 4
+        operations = OperationParser.parse_many(["begin(T1)", "begin(T2)", "W(T1,x1,5)", "end(T1)"])
+        for tick, op in enumerate(operations, 1):
+            self.tm.step(op, tick)
+        self.site = self.tm.get_site(2)
+
+    def tearDown(self):
+        configurations.commit_protocol, configurations.message_delay = self.settings
+
+    def events(self):
+        return self.stream.getvalue().splitlines()
+
+    def test_timeline(self):
+        # prepare arrives at tick 6, the votes at tick 8, the decision at tick 10
+        self.tm.retry(5)
+        self.assertNotIn("T1", self.site.data_manager.prepared)
+        self.tm.retry(6)
+        self.assertIn("T1", self.site.data_manager.prepared)
+
+        self.tm.retry(7)
+        self.assertEqual(self.events(), [])
+        self.tm.retry(8)
+        self.assertEqual(self.events(), ["C T1"])
+        self.assertTrue(self.tm.transactions["T1"].committed)
+        # the decision has not reached the site yet
+        self.assertTrue(self.site.lock_manager.holds_locks("T1"))
+        self.assertEqual(self.site.data_manager.get_variable(1), 10)
+
+        self.tm.retry(9)
+        self.assertTrue(self.tm.in_flight())
+        self.tm.retry(10)
+        self.assertFalse(self.site.lock_manager.holds_locks("T1"))
+        self.assertEqual(self.site.data_manager.get_variable(1), 5)
+        self.assertFalse(self.tm.in_flight())
+
+    def test_waiter_runs_when_decision_arrives(self):
+        read = OperationParser.parse_many(["R(T2,x1)"])[0]
+        self.tm.step(read, 5)
+        for tick in range(6, 10):
+            self.tm.retry(tick)
+        self.assertEqual(self.events(), ["C T1"])
+        self.tm.retry(10)
+        self.assertEqual(self.events(), ["C T1", "R T2 x1 5 @2"])
+
+    def test_failed_participant_votes_no(self):
+        fail = OperationParser.parse_many(["fail(2)"])[0]
+        self.tm.step(fail, 5)
+        for tick in range(6, 8):
+            self.tm.retry(tick)
+        self.assertEqual(self.events(), [])
+        self.tm.retry(8)
+        self.assertEqual(self.events(), ["A T1 site_failure"])
+        self.assertNotIn("T1", self.tm.transactions)
+
+        self.tm.retry(10)
+        self.assertFalse(self.tm.in_flight())
+        self.assertEqual(self.site.data_manager.get_variable(1), 10)
+
+
+if __name__ == "__main__":
+    unittest.main()
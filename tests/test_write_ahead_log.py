@@ -0,0 +1,164 @@
+import configurations
+import io
+import os
+import tempfile
+import unittest
+from model.managers.DataManager import DataManager
+from model.OutputSink import TextSink
+from utils.driver import run, case_wal_dir
+from model.managers.WriteAheadLog import WriteAheadLog, COMMIT, FAIL, RECORD_HEADER, RECORD_ITEM, RECORD_CRC
+
+
+def record_size(items):
+    return RECORD_HEADER.size + items * RECORD_ITEM.size + RECORD_CRC.size
+
+
+class WriteAheadLogTest(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.directory = os.path.join(self._tmp.name, "site1")
+        self.log_path = os.path.join(self.directory, "wal.log")
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def write_records(self):
+        wal = WriteAheadLog(self.directory)
+        wal.log_commit(3, [(2, 21), (4, 41)])
+        wal.log_fail(5)
+        wal.log_commit(8, [(2, 22)])
+        wal.close()
+
+    def test_round_trip(self):
+        self.write_records()
+        wal = WriteAheadLog(self.directory)
+        entries, records = wal.recover()
+        self.assertEqual(entries, {})
+        self.assertEqual(records, [(COMMIT, 3, [(2, 21), (4, 41)]), (FAIL, 5, []), (COMMIT, 8, [(2, 22)])])
+        self.assertEqual(wal.last_tick, 8)
+
+    def test_checkpoint_then_records(self):
+        wal = WriteAheadLog(self.directory)
+        wal.log_commit(3, [(2, 21)])
+        wal.last_tick = 3
+        wal.checkpoint([(1, 10, True), (2, 21, False)])
+        wal.log_commit(7, [(1, 11)])
+        wal.close()
+
+        wal = WriteAheadLog(self.directory)
+        entries, records = wal.recover()
+        self.assertEqual(entries, {1: (10, True), 2: (21, False)})
+        self.assertEqual(records, [(COMMIT, 7, [(1, 11)])])
+
+    def test_torn_tail_is_truncated(self):
+        self.write_records()
+        valid = os.path.getsize(self.log_path)
+        with open(self.log_path, "ab") as f:
+            # a record cut in the middle of its items
+            f.write(RECORD_HEADER.pack(COMMIT, 9, 2) + RECORD_ITEM.pack(2, 23))
+
+        wal = WriteAheadLog(self.directory)
+        _, records = wal.recover()
+        self.assertEqual(len(records), 3)
+        self.assertEqual(os.path.getsize(self.log_path), valid)
+
+        # new records are appended after the last valid one
+        wal.log_commit(10, [(4, 42)])
+        wal.close()
+        _, records = WriteAheadLog(self.directory).recover()
+        self.assertEqual(records[-1], (COMMIT, 10, [(4, 42)]))
+        self.assertEqual(len(records), 4)
+
+    def test_corrupted_record_stops_recovery(self):
+        self.write_records()
+        with open(self.log_path, "r+b") as f:
+            # flip a byte of the value of the first item of the second commit
+            pos = record_size(2) + record_size(0) + RECORD_HEADER.size + 4
+            f.seek(pos)
+            byte = f.read(1)
+            f.seek(pos)
+            f.write(bytes([byte[0] ^ 0xFF]))
+
+        _, records = WriteAheadLog(self.directory).recover()
+        self.assertEqual(records, [(COMMIT, 3, [(2, 21), (4, 41)]), (FAIL, 5, [])])
+        self.assertEqual(os.path.getsize(self.log_path), record_size(2) + record_size(0))
+
+
+class DataManagerRecoveryTest(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.settings = (configurations.wal_dir, configurations.wal_checkpoint_interval)
+        configurations.wal_dir = self._tmp.name
+
+    def tearDown(self):
+        configurations.wal_dir, configurations.wal_checkpoint_interval = self.settings
+        self._tmp.cleanup()
+
+    def run_site(self):
+        dm = DataManager(2)
+        dm.write_uncommitted("T1", 2, 200)
+        dm.write_uncommitted("T1", 1, 100)
+        dm.commit_transaction("T1", 3)
+        dm.disable_accessibility(4)
+        dm.write_uncommitted("T2", 4, 400)
+        dm.commit_transaction("T2", 5)
+        # never committed, not recovered
+        dm.write_uncommitted("T3", 6, 600)
+        dm.wal.close()
+
+    def assert_recovered(self):
+        dm = DataManager(2)
+        self.assertEqual(dm.get_variable(2), 200)
+        self.assertEqual(dm.get_variable(1), 100)
+        self.assertEqual(dm.get_variable(4), 400)
+        self.assertEqual(dm.get_variable(6), 60)
+        # replicated variables are readable only if committed since the failure
+        self.assertFalse(dm.check_accessibility(2))
+        self.assertTrue(dm.check_accessibility(4))
+        self.assertTrue(dm.check_accessibility(1))
+        dm.wal.close()
+
+    def test_recovery_from_log(self):
+        self.run_site()
+        self.assert_recovered()
+
+    def test_recovery_from_checkpoint(self):
+        configurations.wal_checkpoint_interval = 2
+        self.run_site()
+        self.assertTrue(os.path.exists(os.path.join(self._tmp.name, "site2", "checkpoint.bin")))
+        self.assert_recovered()
+
+
+class CaseScopeTest(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.wal_dir = configurations.wal_dir
+        configurations.wal_dir = self._tmp.name
+
+    def tearDown(self):
+        configurations.wal_dir = self.wal_dir
+        self._tmp.cleanup()
+
+    def run_case(self, case, input_file, case_id):
+        stream = io.StringIO()
+        run(case, case_id=case_id, sink=TextSink(stream), wal_dir=case_wal_dir(input_file, case_id))
+        return stream.getvalue().splitlines()
+
+    def test_case_directories(self):
+        self.assertEqual(case_wal_dir("tests/test3.txt.gz", 2), os.path.join(self._tmp.name, "test3", "case2"))
+        self.assertEqual(case_wal_dir(None, 1), os.path.join(self._tmp.name, "stdin", "case1"))
+        configurations.wal_dir = None
+        self.assertIsNone(case_wal_dir("test1.txt", 1))
+
+    def test_cases_do_not_share_state(self):
+        write = ["begin(T1)", "W(T1,x1,5)", "end(T1)"]
+        read = ["begin(T1)", "R(T1,x1)", "end(T1)"]
+        self.run_case(write, "a.txt", 1)
+        self.assertEqual(self.run_case(read, "a.txt", 2), ["R T1 x1 10 @2", "C T1"])
+        self.assertEqual(self.run_case(read, "b.txt", 1), ["R T1 x1 10 @2", "C T1"])
+        # a run of the same case again recovers its own state
+        self.assertEqual(self.run_case(read, "a.txt", 1), ["R T1 x1 5 @2", "C T1"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,18 +1,69 @@
+import gzip
+import io
+import sys
 
-class FileLoader(object):
+# The first two bytes of every gzip stream
+GZIP_MAGIC = b"\x1f\x8b"
+
+
+def open_source(source):
     """
-    FileLoader is used to open test file and extract cases and operations
+    Open a test file for reading text line by line, gzip compressed files are detected by their magic bytes and
+    decompressed on the fly, None or "-" reads the standard input (which may be compressed as well)
+
+    :param source: file path, "-" or None
+    :return: A text stream, the caller closes it (closing it never closes the standard input)
     """
-    def __init__(self, file_name):
-        self._lines = []
+    if source is None or source == "-":
+        raw = io.BufferedReader(open(sys.stdin.fileno(), "rb", closefd=False))
+    else:
+        raw = open(source, "rb")
+
+    if raw.peek(2)[:2] == GZIP_MAGIC:
+        raw = gzip.GzipFile(fileobj=raw)
+    return io.TextIOWrapper(raw, encoding="utf-8")
+
+
+def iter_lines(source):
+    """
+    Lazily yield the stripped lines of a test file, lines starting with "//" are comments and are ignored
+
+    :param source: file path, "-" or None (standard input)
+    :return: A generator of lines
+    """
+    with open_source(source) as f:
+        for line in f:
+            if not line.startswith("//"):  # ignore comments
+                yield line.strip()
+
 
-        with open(file_name, 'r') as f:
-            for line in f.readlines():
-                if not line.startswith("//"):  # ignore comments
-                    self._lines.append(line.strip())
+def iter_cases(source):
+    """
+    Lazily yield the test cases of a test file, a case is the list of operations before the next "<END>" line
+    (or the end of the file), only the case being yielded is kept in memory
+
+    :param source: file path, "-" or None (standard input)
+    :return: A generator of lists of operations
+    """
+    loader = FileLoader(source)
+    try:
+        while loader.has_next():
+            yield loader.next_case()
+    finally:
+        loader.close()
+
+
+class FileLoader(object):
+    """
+    FileLoader is used to open test file and extract cases and operations, the file is streamed so only the
+    operations of the current case are held in memory
 
-        self._end_idx = len(self._lines) - 1
-        self._buffer_idx = -1
+    :param self._lines: A generator of the remaining lines of the file
+    :param self._peeked: The next line read ahead by has_next, None if no line was read ahead
+    """
+    def __init__(self, file_name):
+        self._lines = iter_lines(file_name)
+        self._peeked = None
 
     def next_case(self):
         """
@@ -21,12 +72,12 @@ class FileLoader(object):
         :return: list of operations
         """
         operations = []
-        for idx, line in enumerate(self._lines[self._buffer_idx + 1:]):
-            self._buffer_idx += 1
-            if not line.startswith('//') and line.strip() != "<END>" and line.strip() != '':
-                operations.append(line.strip())
-            if line.strip() == "<END>":
+        while self.has_next():
+            line, self._peeked = self._peeked, None
+            if line == "<END>":
                 break
+            if not line.startswith('//') and line != '':
+                operations.append(line)
 
         return operations
 
@@ -36,5 +87,15 @@ class FileLoader(object):
 
         :return: True or False
         """
-        return self._buffer_idx < self._end_idx
+        if self._peeked is None:
+            self._peeked = next(self._lines, None)
+        return self._peeked is not None
 
+    def close(self):
+        """
+        Close the underlying file before it is fully read
+
+        :return: None
+        """
+        self._lines.close()
+        self._peeked = None
@@ -0,0 +1,145 @@
+import configurations
+import platform
+import time
+from model.managers.TransactionManager import TransactionManager
+from model.Operation import OperationParser, TRANSACTION_OPERATIONS
+from model.OutputSink import NullSink, ABORT_CODES
+from utils.driver import init_sites, drain
+
+
+class BenchSink(NullSink):
+    """
+    Count the events of a benchmark run instead of reporting them
+
+    :param self.reads: the number of reads
+    :param self.commits: the number of committed transactions
+    :param self.aborts: A dictionary mapping abort code (see OutputSink.ABORT_CODES) to the number of aborts
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.reads = 0
+        self.commits = 0
+        self.aborts = {code: 0 for code in ABORT_CODES.values()}
+
+    def read(self, trans_id, site_id, var_id, value):
+        self.reads += 1
+
+    def commit(self, trans_id):
+        self.commits += 1
+
+    def abort(self, trans_id, abort_type):
+        self.aborts[ABORT_CODES[abort_type]] += 1
+
+
+def run_bench(lines, batch=1):
+    """
+    Run a workload through a fresh transaction manager and measure it, the operations are parsed before the clock
+    starts so only the simulation (TransactionManager.step and the final retries) is timed
+
+    Operations of a transaction which has already been aborted (the workload generator can not know when a
+    transaction will be aborted) are skipped and counted, as well as operations whose transaction is aborted by the
+    retries of their own step
+
+    :param lines: An iterable of textual operations
+    :param batch: number of consecutive operations sharing a tick, run with TransactionManager.step_batch if above 1
+    :return: A dictionary of results
+    """
+    operations = OperationParser.parse_many(lines)
+    sink = BenchSink()
+    tm = TransactionManager(sink)
+    tm.attach_sites(init_sites())
+
+    tick = 0
+    skipped = 0
+    samples = 0
+    blocked_total = 0
+    blocked_max = 0
+
+    start = time.perf_counter()
+    if batch > 1:
+        for i in range(0, len(operations), batch):
+            tick += 1
+            skipped += len(tm.step_batch(operations[i:i + batch], tick))
+
+            blocked = len(tm.blocked)
+            samples += 1
+            blocked_total += blocked
+            if blocked > blocked_max:
+                blocked_max = blocked
+    else:
+        for operation in operations:
+            if operation.get_op_t() in TRANSACTION_OPERATIONS and operation.para[0] not in tm.transactions:
+                skipped += 1
+                continue
+            tick += 1
+            if not tm.step(operation, tick):
+                # the transaction was aborted by the retry pass of this very step
+                skipped += 1
+                continue
+
+            blocked = len(tm.blocked)
+            samples += 1
+            blocked_total += blocked
+            if blocked > blocked_max:
+                blocked_max = blocked
+
+    # same as the driver, retry until nothing is blocked or no progress is made
+    tick, _ = drain(tm, tick)
+    elapsed = time.perf_counter() - start
+
+    executed = len(operations) - skipped
+    transactions = sink.commits + sum(sink.aborts.values())
+    return {
+        "operations": executed,
+        "skipped_operations": skipped,
+        "ticks": tick,
+        "seconds": elapsed,
+        "ops_per_sec": executed / elapsed if elapsed > 0 else None,
+        "reads": sink.reads,
+        "commits": sink.commits,
+        "aborts": sink.aborts,
+        "commit_rate": sink.commits / transactions if transactions else None,
+        "abort_rate": 1 - sink.commits / transactions if transactions else None,
+        "deadlocks": sink.aborts[ABORT_CODES[2]],
+        "mean_blocked": blocked_total / samples if samples else 0,
+        "max_blocked": blocked_max,
+        "stalled_operations": len(tm.blocked),
+        "version_gc": tm.gc.get_stats(),
+        "metrics": tm.metrics.snapshot() if tm.metrics is not None else None
+    }
+
+
+def bench(generator, repeat=1, batch=1):
+    """
+    Generate a workload once and run it repeat times, the best run (highest ops/sec) is reported with the settings
+    needed to compare results across versions
+
+    :param generator: WorkloadGenerator
+    :param repeat: the number of runs
+    :param batch: number of consecutive operations sharing a tick (see run_bench)
+    :return: A dictionary of the settings and results, ready to be saved as JSON
+    """
+    lines = list(generator.generate())
+    runs = [run_bench(lines, batch) for _ in range(max(1, repeat))]
+    best = max(runs, key=lambda r: r["ops_per_sec"] or 0)
+
+    return {
+        "workload": {
+            "transactions": generator.transactions,
+            "concurrency": generator.concurrency,
+            "operations_per_transaction": generator.operations_per_transaction,
+            "read_ratio": generator.read_ratio,
+            "readonly_fraction": generator.readonly_fraction,
+            "skew": generator.skew,
+            "fail_rate": generator.fail_rate,
+            "recover_rate": generator.recover_rate,
+            "seed": generator.seed,
+            "operations": len(lines),
+            "batch": batch
+        },
+        "configurations": configurations.snapshot(),
+        "python": platform.python_version(),
+        "runs": [r["ops_per_sec"] for r in runs],
+        "result": best
+    }
@@ -1,45 +1,144 @@
-from configurations import *
+import configurations
+import io
+import os
+from collections import deque
+from contextlib import redirect_stdout
+from multiprocessing import Pool
 from model.Site import Site
 from model.managers.TransactionManager import TransactionManager
+from model.managers.Metrics import create_metrics
+from model.managers.ShardPool import get_shard_pool
 from model.Operation import OperationParser, OperationCreator
 
 
-def init_sites():
+def init_sites(wal_dir=None):
     """
-    Initialize sites and return list of sites
+    Initialize sites and return list of sites, with sharding their data is reset in the shard processes
 
+    :param wal_dir: directory of the write-ahead logs of the sites, configurations.wal_dir by default
     :return: list of sites
     """
-    return [Site(idx) for idx in range(1, number_of_sites + 1)]
+    pool = get_shard_pool()
+    if pool is None:
+        return [Site(idx, wal_dir=wal_dir) for idx in range(1, configurations.number_of_sites + 1)]
+    pool.reset(wal_dir)
+    return [Site(idx, pool.data_manager(idx)) for idx in range(1, configurations.number_of_sites + 1)]
 
 
-def run(case):
+def case_wal_dir(input_file, case_id):
+    """
+    Get the directory of the write-ahead logs of a test case, every case of every test file has its own logs under
+    configurations.wal_dir, so a case only recovers the state left by a previous run of the same case
+
+    :param input_file: File path of the test file, None or "-" for the standard input
+    :param case_id: the index of the case in its file
+    :return: directory path, None if the logs are disabled
+    """
+    if not configurations.wal_dir:
+        return None
+    name = "stdin" if input_file in (None, "-") else os.path.basename(input_file)
+    for suffix in (".gz", ".txt"):
+        if name.endswith(suffix):
+            name = name[:-len(suffix)]
+    return os.path.join(configurations.wal_dir, name, f"case{case_id}")
+
+
+def drain(tm, tick):
+    """
+    Retry the blocked operations after the last operation until nothing is blocked or no progress can be made, the
+    messages of a two-phase commit still in flight may release locks in a later tick, the operations left blocked are
+    reported as stalled
+
+    :param tm: TransactionManager
+    :param tick: the tick of the last operation
+    :return: (the last tick, list of the operations left blocked)
+    """
+    while tm.blocked or tm.in_flight():
+        cur_blocked_size = len(tm.blocked)
+        tick += 1
+        tm.retry(tick)
+
+        if tm.blocked and cur_blocked_size == len(tm.blocked) and not tm.in_flight():
+            if tm.deadlock_policy.on_idle(tick):
+                continue
+            tm.sink.stalled(tm.blocked)
+            break
+    return tick, list(tm.blocked)
+
+
+def run(case, recorder=None, case_id=1, sink=None, wal_dir=None):
     """
     Run RepCRec algorithm on a list of operations (single test case), the result will be saved in the stdout
 
     :param case: a list of operations
+    :param recorder: TraceRecorder tracing the run (see utils/trace.py), None if the run is not traced
+    :param case_id: the index of the case in its file, saved in the trace
+    :param sink: OutputSink receiving the events of the case, None for the sink of configurations.output_format
+    :param wal_dir: directory of the write-ahead logs of the case (see case_wal_dir), configurations.wal_dir by
+                    default
     :return: None
     """
-    tm = TransactionManager()
-    tm.attach_sites(init_sites())
+    tm = TransactionManager(sink=sink)
+    tm.attach_sites(init_sites(wal_dir))
+
+    operations = OperationParser.parse_many(case)
+    if recorder is not None:
+        tm.recorder = recorder
+        recorder.start_case(case_id, case, operations)
 
     tick = 0
-    for op in case:
+    for operation in operations:
         tick += 1
-        op_t, para = OperationParser.parse(op)
-        operation = OperationCreator.create(op_t, para)
         tm.step(operation, tick)
+    tick, stalled = drain(tm, tick)
 
-    while tm.blocked:
-        cur_blocked_size = len(tm.blocked)
-        tick += 1
-        tm.retry(tick)
+    if recorder is not None:
+        recorder.end_case(tick, stalled)
+    for site in tm.sites:
+        site.data_manager.sync_log()
 
-        if cur_blocked_size == len(tm.blocked):
-            print("Following operation can not be executed, maybe the test case is not terminable:")
-            for op in tm.blocked:
-                print(op)
-            break
+
+def run_to_string(case):
+    """
+    Run RepCRec algorithm on a single test case and return its output instead of printing it
+
+    :param case: a list of operations
+    :return: the output of the case
+    """
+    buffer = io.StringIO()
+    with redirect_stdout(buffer):
+        run(case)
+    return buffer.getvalue()
+
+
+def run_parallel(tasks, jobs, window=None, worker=run_to_string):
+    """
+    Run independent test cases in a pool of worker processes, each case builds its own transaction manager and sites
+    and its output is captured in its own buffer
+
+    At most window cases are submitted ahead of the oldest unfinished one, so cases may be streamed from large files
+
+    :param tasks: An iterable of (key, case), case is a list of operations
+    :param jobs: the number of worker processes
+    :param window: the maximum number of cases in flight, 4 * jobs by default
+    :param worker: A module level function running a case in a worker and returning its result, run_to_string by
+                   default
+    :return: A generator of (key, output), in the order of tasks regardless of which worker finishes first
+    """
+    window = window or 4 * jobs
+
+    # worker processes may be spawned instead of forked, so the parent's configurations are copied explicitly
+    with Pool(jobs, initializer=configurations.restore, initargs=(configurations.snapshot(),)) as pool:
+        pending = deque()
+        for key, case in tasks:
+            pending.append((key, pool.apply_async(worker, (case,))))
+            if len(pending) >= window:
+                key, result = pending.popleft()
+                yield key, result.get()
+
+        while pending:
+            key, result = pending.popleft()
+            yield key, result.get()
 
 
 def run_interactive():
@@ -48,8 +147,9 @@ def run_interactive():
 
     :return: None
     """
-    # Initialized Transaction manager and sites
-    tm = TransactionManager()
+    # Initialized Transaction manager and sites, the metrics (if enabled) are kept across test cases
+    metrics = create_metrics()
+    tm = TransactionManager(metrics=metrics)
     tm.attach_sites(init_sites())
     tick = 0
 
@@ -57,26 +157,23 @@ def run_interactive():
         command = input("RepCRec >: ")
         try:
             if command == "refresh":
-                tm = TransactionManager()
+                tm = TransactionManager(metrics=metrics)
                 tm.attach_sites(init_sites())
                 tick = 0
             elif command == "<END>":
-                while tm.blocked:
-                    cur_blocked_size = len(tm.blocked)
-                    tick += 1
-                    tm.retry(tick)
-
-                    if cur_blocked_size == len(tm.blocked):
-                        print("Following operation can not be executed, maybe the test case is not terminable:")
-                        for op in tm.blocked:
-                            print(op)
-                        break
-
-                tm = TransactionManager()
+                drain(tm, tick)
+                tm = TransactionManager(metrics=metrics)
                 tm.attach_sites(init_sites())
                 tick = 0
 
+            elif command == "metrics":
+                print(metrics.report() if metrics is not None else "Metrics are disabled, run with -metrics")
+            elif command == "metrics reset":
+                if metrics is not None:
+                    metrics.reset()
             elif command == "quit":
+                for site in tm.sites:
+                    site.data_manager.sync_log()
                 print("bye")
                 break
             else:
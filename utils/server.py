@@ -0,0 +1,290 @@
+import asyncio
+import configurations
+import io
+import logging
+from model.managers.TransactionManager import TransactionManager
+from model.Operation import OperationParser, OperationCreator, TRANSACTION_OPERATIONS
+from model.OutputSink import OutputSink, NullSink, create_sink
+from utils.driver import init_sites
+
+# Operations starting a transaction, the client sending them owns the transaction
+BEGIN_OPERATIONS = {"begin", "beginRO"}
+
+logger = logging.getLogger(__name__)
+
+
+class Client(object):
+    """
+    A connected client, the events of its transactions are formatted by its own sink (configurations.output_format)
+    into a buffer which is sent once per batch
+
+    :param self.writer: asyncio.StreamWriter of the connection
+    :param self.buffer: A text buffer of the events not sent yet
+    :param self.sink: OutputSink writing to self.buffer
+    :param self.closed: Whether the connection has been closed
+    :param self.quitting: Whether the client has sent every operation, the connection is closed once their events
+                          have been sent
+    """
+
+    def __init__(self, writer):
+        self.writer = writer
+        self.buffer = io.StringIO()
+        self.sink = create_sink(configurations.output_format, self.buffer)
+        self.closed = False
+        self.quitting = False
+
+    def error(self, e):
+        print(f"error: {e}", file=self.buffer)
+
+    async def flush(self):
+        """
+        Send the buffered events to the client
+
+        :return: None
+        """
+        data = self.buffer.getvalue()
+        if not data or self.closed:
+            return
+        self.buffer.seek(0)
+        self.buffer.truncate()
+        try:
+            self.writer.write(data.encode())
+            await self.writer.drain()
+        except ConnectionError:
+            self.closed = True
+
+    def close(self):
+        self.closed = True
+        self.writer.close()
+
+
+class ClientSink(OutputSink):
+    """
+    Route every event to the client owning the transaction, the events of a transaction whose client has gone are
+    dropped, a dump and an ignored operation go to the client which sent them
+
+    :param self.server: Server
+    """
+
+    _dropped = NullSink()
+
+    def __init__(self, server):
+        super().__init__()
+        self.server = server
+
+    def _owner(self, trans_id):
+        client = self.server.owners.get(trans_id)
+        return client.sink if client is not None and not client.closed else self._dropped
+
+    def read(self, trans_id, site_id, var_id, value):
+        self._owner(trans_id).read(trans_id, site_id, var_id, value)
+
+    def commit(self, trans_id):
+        self._owner(trans_id).commit(trans_id)
+        self.server.owners.pop(trans_id, None)
+
+    def abort(self, trans_id, abort_type):
+        self._owner(trans_id).abort(trans_id, abort_type)
+        self.server.owners.pop(trans_id, None)
+
+    def dump(self, sites):
+        if self.server.current is not None:
+            self.server.current.sink.dump(sites)
+
+    def ignored(self, operation):
+        # the transaction has no owner anymore, the client which sent the operation is told
+        if self.server.current is not None:
+            self.server.current.sink.ignored(operation)
+
+
+class Server(object):
+    """
+    Serve the transaction manager to many concurrent clients over TCP or a Unix socket
+
+    Clients send operations with the grammar of the test files, one per line ("quit" closes the connection). The
+    connections only enqueue the operations, a single writer task executes them with TransactionManager.step in the
+    order they arrived, one tick each, so the simulation stays deterministic for a given arrival order. The writer
+    takes every operation queued when it wakes up (at most batch_size) as one batch and sends the events produced
+    by the batch to each client at once
+
+    When no operation arrives, the writer still advances the ticks every tick_interval seconds while operations are
+    blocked or messages of a two-phase commit are in flight, so blocked clients make progress: each idle tick
+    retries the woken operations, lets the deadlock policy resolve the deadlocks left among the blocked operations
+    (DeadlockPolicy.on_idle) and runs the garbage collector
+
+    :param self.tm: TransactionManager, its sink is a ClientSink
+    :param self.tick: the current tick
+    :param self.owners: A dictionary mapping transaction id to the Client which began it
+    :param self.current: the Client whose operation is being executed
+    :param self.tick_interval: seconds between two ticks without operations
+    :param self.batch_size: the maximum number of operations executed in one batch
+    """
+
+    def __init__(self, tick_interval=0.01, batch_size=1024):
+        self.tm = TransactionManager(sink=ClientSink(self))
+        self.tm.attach_sites(init_sites())
+        self.tick = 0
+        self.owners = {}
+        self.current = None
+        self.tick_interval = tick_interval
+        self.batch_size = batch_size
+        self._clients = set()
+        self._queue = None
+
+    async def handle_client(self, reader, writer):
+        """
+        Read the operations of one connection and enqueue them for the writer, the end of the connection (or "quit")
+        is enqueued as well so the events of the operations already sent still reach the client, the transactions
+        the client leaves running are then aborted
+
+        :param reader: asyncio.StreamReader
+        :param writer: asyncio.StreamWriter
+        :return: None
+        """
+        client = Client(writer)
+        self._clients.add(client)
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                line = line.decode().strip()
+                if line == "quit":
+                    break
+                if line and not line.startswith("//"):
+                    await self._queue.put((client, line))
+        except ConnectionError:
+            client.closed = True
+        await self._queue.put((client, None))
+
+    def execute(self, client, line):
+        """
+        Execute one operation on behalf of a client, errors are reported to the client
+
+        :param client: Client
+        :param line: A textual operation
+        :return: None
+        """
+        try:
+            op_t, para = OperationParser.parse(line)
+            operation = OperationCreator.create(op_t, para)
+            if op_t in TRANSACTION_OPERATIONS:
+                owner = self.owners.get(para[0])
+                if owner is not None and owner is not client:
+                    raise KeyError(f"Transaction {para[0]} belongs to another client")
+
+            self.tick += 1
+            self.current = client
+            self.tm.step(operation, self.tick)
+            if op_t in BEGIN_OPERATIONS:
+                self.owners[para[0]] = client
+        except Exception as e:
+            client.error(e)
+        finally:
+            self.current = None
+
+    def abort_transactions_of(self, client):
+        """
+        Abort the transactions a client left running when its connection ended, their locks are released and the
+        operations of other clients waiting for them are woken up, a transaction whose commit has been decided (and
+        is waiting for a two-phase commit to complete) is left to finish
+
+        :param client: Client
+        :return: None
+        """
+        for trans_id in [trans_id for trans_id, owner in self.owners.items() if owner is client]:
+            transaction = self.tm.transactions.get(trans_id)
+            if transaction is None or transaction.committed:
+                continue
+            try:
+                self.tm.abort(trans_id, 5)
+            except Exception as e:
+                client.error(e)
+
+    def _has_pending_work(self):
+        return bool(self.tm.woken) or bool(self.tm.blocked) or self.tm.in_flight()
+
+    def idle_tick(self):
+        """
+        Advance the time without a new operation, errors are logged since no client sent an operation
+
+        :return: None
+        """
+        self.tick += 1
+        tm = self.tm
+        try:
+            tm.retry(self.tick)
+            if tm.blocked:
+                tm.deadlock_policy.on_idle(self.tick)
+            tm.gc.maybe_collect(self.tick)
+        except Exception:
+            logger.exception("Error in the idle tick %d", self.tick)
+
+    async def run_writer(self):
+        """
+        Execute the queued operations batch by batch, forever
+
+        :return: None
+        """
+        while True:
+            try:
+                timeout = self.tick_interval if self._has_pending_work() else None
+                batch = [await asyncio.wait_for(self._queue.get(), timeout)]
+            except asyncio.TimeoutError:
+                # nothing arrived, advance the time for the blocked operations
+                self.idle_tick()
+                batch = []
+
+            while len(batch) < self.batch_size and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            for client, line in batch:
+                if line is None:
+                    client.quitting = True
+                    self.abort_transactions_of(client)
+                else:
+                    self.execute(client, line)
+
+            for client in list(self._clients):
+                await client.flush()
+                if client.quitting:
+                    self._clients.discard(client)
+                    client.close()
+
+    async def serve(self, host=None, port=None, path=None):
+        """
+        Accept connections on a Unix socket (path) or on a TCP address (host, port) and run the writer
+
+        :param host: TCP host
+        :param port: TCP port
+        :param path: Unix socket path, used instead of the TCP address if given
+        :return: None
+        """
+        self._queue = asyncio.Queue()
+        if path is not None:
+            server = await asyncio.start_unix_server(self.handle_client, path)
+        else:
+            server = await asyncio.start_server(self.handle_client, host, port)
+
+        async with server:
+            writer = asyncio.create_task(self.run_writer())
+            try:
+                await server.serve_forever()
+            finally:
+                writer.cancel()
+                for site in self.tm.sites:
+                    site.data_manager.sync_log()
+
+
+def run_server(host="127.0.0.1", port=7070, path=None):
+    """
+    Run the server until interrupted
+
+    :param host: TCP host
+    :param port: TCP port
+    :param path: Unix socket path, used instead of the TCP address if given
+    :return: None
+    """
+    try:
+        asyncio.run(Server().serve(host, port, path))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,262 @@
+import configurations
+import struct
+from algorithms.DeadlockPolicy import DeadlockPolicy
+from model import parse_variable_id
+from model.managers.TransactionManager import TransactionManager
+from model.Operation import OperationParser
+from model.OutputSink import create_sink
+from utils.driver import init_sites
+
+# magic and format version at the beginning of a trace file
+TRACE_MAGIC = b"RCTR"
+TRACE_HEADER = struct.Struct("<4sI")
+TRACE_VERSION = 1
+
+# every event is (type, tick, a, b)
+EVENT = struct.Struct("<BIII")
+
+# a test case starts, a = case id, b = length of its operations (utf-8, one per line) which follow the event
+CASE = 0
+# an execution of an operation, a = index of the operation in the case, b = 1 if it completed, 0 if it was blocked
+EXEC = 1
+# a lock granted to the next execution, a = site id, b = 2 * variable number + lock type
+LOCK = 2
+# a transaction aborted outside of any execution (deadlock resolution or prevention), a = index of its begin
+# operation, b = abort type
+ABORT = 3
+# the locks of a group commit were released
+FLUSH = 4
+# an operation left blocked by a case which can not terminate, a = index of the operation
+STALLED = 5
+# the case completed at tick
+END = 6
+# an operation of a transaction which did not exist was ignored, a = index of the operation
+IGNORED = 7
+
+
+class TraceRecorder(object):
+    """
+    Record what the transaction manager did in a compact binary trace: every execution of an operation and its
+    outcome, the locks granted to it, the aborts decided outside of the operations, the group commit flushes and the
+    ignored operations
+
+    The operations of each case are saved in the trace, so a trace can be replayed on its own (see replay_case)
+
+    :param self.stream: A writable binary stream
+    :param self.tick: the current tick
+    """
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.stream.write(TRACE_HEADER.pack(TRACE_MAGIC, TRACE_VERSION))
+        self.tick = 0
+        self._index = {}
+        self._begins = {}
+        self._current = None
+
+    def _event(self, event_type, a=0, b=0):
+        self.stream.write(EVENT.pack(event_type, self.tick, a, b))
+
+    def start_case(self, case_id, lines, operations):
+        """
+        A new case starts
+
+        :param case_id: the index of the case in its file, starting from 1
+        :param lines: the textual operations of the case
+        :param operations: the operation objects parsed from lines
+        :return: None
+        """
+        data = "\n".join(line.strip() for line in lines).encode()
+        self.tick = 0
+        self._event(CASE, case_id, len(data))
+        self.stream.write(data)
+        self._index = {op: i for i, op in enumerate(operations)}
+        self._begins = {}
+        self._current = None
+
+    def begin_tick(self, tick):
+        self.tick = tick
+
+    def executing(self, operation):
+        self._current = operation
+
+    def executed(self, operation, succeed):
+        idx = self._index[operation]
+        if succeed and operation.get_op_t() in ("begin", "beginRO"):
+            self._begins[operation.para[0]] = idx
+        self._current = None
+        self._event(EXEC, idx, 1 if succeed else 0)
+
+    def granted(self, site_id, var_id, lock_type):
+        self._event(LOCK, site_id, 2 * parse_variable_id(var_id)[1] + lock_type)
+
+    def aborted(self, trans_id, abort_type):
+        # an abort during an execution happens again when the execution is replayed
+        if self._current is None:
+            self._event(ABORT, self._begins[trans_id], abort_type)
+
+    def flushed(self):
+        self._event(FLUSH)
+
+    def ignored(self, operation):
+        self._event(IGNORED, self._index[operation])
+
+    def end_case(self, tick, stalled=()):
+        """
+        The case completed
+
+        :param tick: the last tick of the case
+        :param stalled: the operations left blocked if the case can not terminate
+        :return: None
+        """
+        self.tick = tick
+        for op in stalled:
+            self._event(STALLED, self._index[op])
+        self._event(END)
+
+
+def read_trace(stream):
+    """
+    Read a trace case by case
+
+    :param stream: A readable binary stream
+    :return: A generator of (case id, textual operations, events), events is a list of (type, tick, a, b)
+    """
+    header = stream.read(TRACE_HEADER.size)
+    if len(header) < TRACE_HEADER.size or TRACE_HEADER.unpack(header) != (TRACE_MAGIC, TRACE_VERSION):
+        raise ValueError("Not a trace file, or a trace of another version")
+
+    case = None
+    while True:
+        data = stream.read(EVENT.size)
+        if len(data) < EVENT.size:
+            break
+        event = EVENT.unpack(data)
+        if event[0] == CASE:
+            if case is not None:
+                yield case
+            lines = stream.read(event[3]).decode().split("\n") if event[3] else []
+            case = (event[2], lines, [])
+        elif case is None:
+            raise ValueError("Trace event before any case")
+        else:
+            case[2].append(event)
+    if case is not None:
+        yield case
+
+
+class KnownOutcomes(DeadlockPolicy):
+    """
+    The deadlock policy of a replay, the aborts are already known from the trace so nothing is detected or prevented
+    and the wait-for graph is not maintained
+    """
+    uses_graph = False
+
+
+class _GrantCollector(object):
+    # receives the lock grants of the replayed executions, the other events of a replay are not needed
+
+    def __init__(self):
+        self.grants = []
+
+    def granted(self, site_id, var_id, lock_type):
+        self.grants.append((site_id, 2 * parse_variable_id(var_id)[1] + lock_type))
+
+    def aborted(self, trans_id, abort_type):
+        pass
+
+    def flushed(self):
+        pass
+
+
+def replay_case(case_id, lines, events):
+    """
+    Replay a recorded case through a fresh transaction manager, only the executions which completed are executed
+    again, in the recorded order, with the recorded aborts and group commit flushes in between: blocked executions,
+    retry passes, wait queues and deadlock detection are skipped, which makes a replay much faster than the run
+
+    Every replayed execution has to complete and to be granted the recorded locks, otherwise the replay stops with a
+    ValueError describing the first divergence. The output of the replay is reported to the sink like a run, so it
+    can be compared with the output of the run (or with the reference results)
+
+    Replays need the behaviour of the run to depend on the completed executions only, so the run must use the "try"
+    lock mode (a blocked request leaves nothing in a queue), the "local" commit and the "first" replica selection
+
+    :param case_id: the index of the case in its file
+    :param lines: the textual operations of the case
+    :param events: the recorded events of the case
+    :return: None
+    """
+    if (configurations.lock_mode, configurations.commit_protocol, configurations.replica_selection) != \
+            ("try", "local", "first"):
+        raise ValueError("Traces can only be replayed with the 'try' lock mode, the 'local' commit and the 'first' "
+                         "replica selection")
+
+    operations = OperationParser.parse_many(lines)
+    tm = TransactionManager()
+    tm.attach_sites(init_sites())
+    tm.deadlock_policy = KnownOutcomes(tm)
+    collector = _GrantCollector()
+    tm.recorder = collector
+
+    started = set()
+    expected = []
+    stalled = []
+    completed = False
+    for event_type, tick, a, b in events:
+        if event_type == LOCK:
+            expected.append((a, b))
+        elif event_type == EXEC:
+            op = operations[a]
+            if not b:
+                # a blocked first execution still saves the operation to its transaction
+                if a not in started:
+                    started.add(a)
+                    op.save_to_transaction(tm)
+                expected = []
+                continue
+
+            collector.grants = []
+            if not op.execute(tick, tm, a in started):
+                raise ValueError(f"Case {case_id} diverged at tick {tick}: {op} was blocked")
+            started.add(a)
+            if collector.grants != expected:
+                raise ValueError(f"Case {case_id} diverged at tick {tick}: {op} was granted locks {collector.grants}"
+                                 f" instead of {expected}")
+            expected = []
+        elif event_type == ABORT:
+            tm.abort(operations[a].para[0], b)
+        elif event_type == FLUSH:
+            tm.flush_commits()
+        elif event_type == IGNORED:
+            tm.sink.ignored(operations[a])
+        elif event_type == STALLED:
+            stalled.append(operations[a])
+        elif event_type == END:
+            completed = True
+
+    # the commits of the last execution may still be in the group
+    tm.flush_commits()
+    if not completed:
+        raise ValueError(f"The recorded run of case {case_id} did not complete")
+    if stalled:
+        tm.sink.stalled(stalled)
+    for site in tm.sites:
+        site.data_manager.sync_log()
+
+
+def replay_file(trace_file):
+    """
+    Replay every case of a trace file, the output goes to the current sys.stdout
+
+    :param trace_file: File path of the trace
+    :return: the number of cases replayed
+    """
+    sink = create_sink(configurations.output_format)
+    replayed = 0
+    with open(trace_file, "rb") as f:
+        for case_id, lines, events in read_trace(f):
+            sink.case(case_id)
+            replay_case(case_id, lines, events)
+            replayed += 1
+    return replayed
@@ -0,0 +1,212 @@
+import io
+import json
+import os
+import re
+import time
+from model.OutputSink import TextSink, ABORT_MESSAGES, ABORT_CODES
+from utils.driver import run, run_parallel
+from utils.FileLoader import iter_cases, iter_lines
+
+# The normalized event stream of a case is its output in the "text" format, one event per line (see TextSink):
+#   R <transaction> x<i> <value> @<site>    a read
+#   C <transaction>                         a commit
+#   A <transaction> <abort code>            an abort
+#   D <site> up|down x<i>=<value> ...       a site in a dump, with the variables it holds
+#   I <operation>                           an operation of a transaction which does not exist
+#   S <operation>                           an operation left blocked by a case which can not terminate
+
+CASE_HEADER = re.compile(r"^Test (\d+) Result$")
+TABLE_COMMIT = re.compile(r"^Transaction (\S+) commit$")
+TABLE_ABORT = re.compile(r"^Transaction (\S+) aborted \((.*)\)$")
+TABLE_IGNORED = re.compile(r"^Operation (\S+) ignored, transaction \S+ does not exist$")
+TABLE_SITE = re.compile(r"^Site (\d+) \((up|down)\)$")
+TABLE_STALLED = "Following operation can not be executed, maybe the test case is not terminable:"
+
+# abort message of the table format => abort code of the text format
+ABORT_CODES_BY_MESSAGE = {message: ABORT_CODES[abort_type] for abort_type, message in ABORT_MESSAGES.items()}
+
+
+def normalize_json(event):
+    """
+    Convert an event of the "jsonl" format to normalized events
+
+    :param event: A decoded JSON object
+    :return: A list of normalized events
+    """
+    kind = event["event"]
+    if kind == "read":
+        return [f"R {event['trans']} {event['var']} {event['value']} @{event['site']}"]
+    if kind == "commit":
+        return [f"C {event['trans']}"]
+    if kind == "abort":
+        return [f"A {event['trans']} {event['reason']}"]
+    if kind == "dump":
+        values = " ".join(f"{var}={val}" for var, val in event["values"].items())
+        return [f"D {event['site']} {'up' if event['up'] else 'down'} {values}".rstrip()]
+    if kind == "ignored":
+        return [f"I {event['operation']}"]
+    if kind == "stalled":
+        return [f"S {op}" for op in event["operations"]]
+    raise ValueError(f"Unknown event: {event}")
+
+
+def iter_reference(source):
+    """
+    Lazily read the expected output of a test file case by case as normalized events, the output may be in the
+    "table", "text" or "jsonl" format (or a mix of them) and may be gzip compressed
+
+    Tables are parsed row by row, so a large reference is never held in memory beyond the case being compared
+
+    :param source: file path
+    :return: A generator of (case id, list of normalized events)
+    """
+    case_id, events = None, []
+    header = None
+    stalled = False
+    for line in iter_lines(source):
+        if not line:
+            continue
+
+        match = CASE_HEADER.match(line)
+        if match is not None or line.startswith('{"event": "case"'):
+            if case_id is not None or events:
+                yield case_id or 1, events
+            case_id = int(match.group(1)) if match is not None else json.loads(line)["case"]
+            events, header, stalled = [], None, False
+        elif line.startswith("{"):
+            events.extend(normalize_json(json.loads(line)))
+        elif line.startswith("+"):
+            # border of a table
+            continue
+        elif line.startswith("|"):
+            cells = [cell.strip() for cell in line.strip("|").split("|")]
+            if cells[0] in ("Transaction", "Site Name"):
+                header = cells
+            elif header is not None and header[0] == "Transaction":
+                events.append(f"R {cells[0]} {header[2]} {cells[2]} @{cells[1]}")
+            elif header is not None:
+                site = TABLE_SITE.match(cells[0])
+                if site is None:
+                    raise ValueError(f"Unknown site in {source}: {cells[0]}")
+                site_id, state = site.groups()
+                values = " ".join(f"{var}={val}" for var, val in zip(header[1:], cells[1:]) if val != "None")
+                events.append(f"D {site_id} {state} {values}".rstrip())
+            else:
+                raise ValueError(f"Table row without header in {source}: {line}")
+        elif line == TABLE_STALLED:
+            stalled = True
+        elif TABLE_COMMIT.match(line):
+            events.append(f"C {TABLE_COMMIT.match(line).group(1)}")
+        elif TABLE_ABORT.match(line):
+            trans_id, message = TABLE_ABORT.match(line).groups()
+            events.append(f"A {trans_id} {ABORT_CODES_BY_MESSAGE.get(message, message)}")
+        elif TABLE_IGNORED.match(line):
+            events.append(f"I {TABLE_IGNORED.match(line).group(1)}")
+        elif stalled:
+            events.append(f"S {line}")
+        else:
+            # the lines of the text format are normalized events already, an unknown line is kept as well so the
+            # case diverges where it is
+            events.append(line)
+
+    if case_id is not None or events:
+        yield case_id or 1, events
+
+
+def run_case_events(case):
+    """
+    Run a single test case and collect its normalized events, this is the task of the verify workers
+
+    :param case: a list of operations
+    :return: (list of normalized events, the exception raised by the case as a string or None, seconds)
+    """
+    buffer = io.StringIO()
+    error = None
+    start = time.perf_counter()
+    try:
+        run(case, sink=TextSink(buffer))
+    except Exception as e:
+        error = repr(e)
+    elapsed = time.perf_counter() - start
+    return [line.rstrip() for line in buffer.getvalue().splitlines()], error, elapsed
+
+
+def first_divergence(expected, actual):
+    """
+    Find the first event where two normalized event streams differ
+
+    :param expected: A list of normalized events
+    :param actual: A list of normalized events
+    :return: (index, expected event, actual event), an event is None past the end of its stream, None if the streams
+             are equal
+    """
+    for i, (e, a) in enumerate(zip(expected, actual)):
+        if e != a:
+            return i, e, a
+    if len(expected) != len(actual):
+        i = min(len(expected), len(actual))
+        return i, expected[i] if i < len(expected) else None, actual[i] if i < len(actual) else None
+    return None
+
+
+def verify_files(files, jobs=1, stream=None):
+    """
+    Run the cases of test files and compare their normalized events with the expected outputs, one line is reported
+    per case with its running time and, if it diverged, its first divergence, followed by a summary line
+
+    Cases are streamed from the test files and the references alike, with more than one job they run in a process
+    pool (see run_parallel) and are still reported in order
+
+    :param files: A list of (input file, reference file)
+    :param jobs: the number of worker processes
+    :param stream: A writable text stream for the report, None means the current sys.stdout
+    :return: (the number of cases, the number of cases which diverged)
+    """
+    start = time.perf_counter()
+    tasks = (((index, case_id), case) for index, (input_file, _) in enumerate(files)
+             for case_id, case in enumerate(iter_cases(input_file), 1))
+    if jobs <= 1:
+        results = ((key, run_case_events(case)) for key, case in tasks)
+    else:
+        results = run_parallel(tasks, jobs, worker=run_case_events)
+
+    total, diverged, running = 0, 0, 0.0
+    pending = next(results, None)
+    for index, (input_file, reference_file) in enumerate(files):
+        references = iter_reference(reference_file) if os.path.exists(reference_file) else iter(())
+        # results come back in order, so the cases of a file are contiguous (a file may have none)
+        while pending is not None and pending[0][0] == index:
+            (_, case_id), (events, error, elapsed) = pending
+            pending = next(results, None)
+            total += 1
+            running += elapsed
+            reference = next(references, None)
+            if reference is None:
+                problem = "no expected output"
+            elif reference[0] != case_id:
+                problem = f"expected output of case {reference[0]} found instead"
+            else:
+                # the events reported before an exception are still compared
+                expected = reference[1] if error is None else reference[1][:len(events)]
+                divergence = first_divergence(expected, events)
+                if divergence is not None:
+                    problem = f"diverged at event {divergence[0] + 1}, expected {divergence[1]!r}, " \
+                              f"got {divergence[2]!r}"
+                elif error is not None:
+                    problem = f"raised {error} after {len(events)} events"
+                else:
+                    problem = None
+
+            status = "ok" if problem is None else problem
+            print(f"{input_file} case {case_id}: {status} ({elapsed * 1000:.2f} ms)", file=stream)
+            if problem is not None:
+                diverged += 1
+
+        for case_id, _ in references:
+            total += 1
+            diverged += 1
+            print(f"{input_file} case {case_id}: expected but not run", file=stream)
+
+    print(f"{total} cases, {diverged} diverged, {running:.3f} s running the cases, "
+          f"{time.perf_counter() - start:.3f} s in total", file=stream)
+    return total, diverged
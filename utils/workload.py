@@ -0,0 +1,106 @@
+import random
+from itertools import accumulate
+
+
+class WorkloadGenerator(object):
+    """
+    Generate synthetic test cases, a fixed number of transactions run concurrently, each one issues a random number of
+    reads and writes on variables drawn from a Zipf distribution and ends, sites fail and recover at random
+
+    :param self.transactions: the number of transactions of the workload
+    :param self.concurrency: the number of transactions running at the same time
+    :param self.operations_per_transaction: the mean number of reads and writes of a transaction
+    :param self.read_ratio: the probability that an operation of a read-write transaction is a read
+    :param self.readonly_fraction: the probability that a transaction is read-only
+    :param self.skew: the exponent of the Zipf distribution of the accessed variables, 0 is uniform
+    :param self.fail_rate: the probability that a site fails before an operation
+    :param self.recover_rate: the probability that a failed site recovers before an operation
+    :param self.number_of_sites: the number of sites
+    :param self.variable_counts: the number of distinct variables
+    :param self.seed: the random seed, the same parameters and seed always give the same workload
+    :param self.random: random.Random seeded with self.seed
+    """
+
+    def __init__(self, transactions=1000, concurrency=10, operations_per_transaction=5, read_ratio=0.7,
+                 readonly_fraction=0.1, skew=0.0, fail_rate=0.0, recover_rate=0.1, number_of_sites=10,
+                 variable_counts=20, seed=0):
+        if transactions < 1 or concurrency < 1 or operations_per_transaction < 1:
+            raise ValueError("Transactions, concurrency and operations per transaction must be positive")
+        for name, p in (("read_ratio", read_ratio), ("readonly_fraction", readonly_fraction),
+                        ("fail_rate", fail_rate), ("recover_rate", recover_rate)):
+            if not 0 <= p <= 1:
+                raise ValueError(f"Invalid {name}: {p}")
+        if skew < 0:
+            raise ValueError(f"Invalid skew: {skew}")
+
+        self.transactions = transactions
+        self.concurrency = concurrency
+        self.operations_per_transaction = operations_per_transaction
+        self.read_ratio = read_ratio
+        self.readonly_fraction = readonly_fraction
+        self.skew = skew
+        self.fail_rate = fail_rate
+        self.recover_rate = recover_rate
+        self.number_of_sites = number_of_sites
+        self.variable_counts = variable_counts
+        self.seed = seed
+        self.random = random.Random(seed)
+
+        # cumulative Zipf weights, variable x1 is the most popular one
+        self._variables = list(range(1, variable_counts + 1))
+        self._cum_weights = list(accumulate(1 / rank ** skew for rank in self._variables))
+
+    def _variable(self):
+        return self.random.choices(self._variables, cum_weights=self._cum_weights)[0]
+
+    def _site_events(self, failed):
+        # keep at least one site up, otherwise every transaction would wait forever
+        up = [s for s in range(1, self.number_of_sites + 1) if s not in failed]
+        if len(up) > 1 and self.random.random() < self.fail_rate:
+            site_id = self.random.choice(up)
+            failed.add(site_id)
+            yield f"fail({site_id})"
+        if failed and self.random.random() < self.recover_rate:
+            site_id = self.random.choice(sorted(failed))
+            failed.remove(site_id)
+            yield f"recover({site_id})"
+
+    def generate(self):
+        """
+        Generate the operations of the workload
+
+        :return: A generator of textual operations, for example "R(T1,x2)"
+        """
+        rnd = self.random
+        started = 0
+        # running transactions, [transaction id, is read-only, remaining operations]
+        running = []
+        failed = set()
+
+        while started < self.transactions or running:
+            while started < self.transactions and len(running) < self.concurrency:
+                started += 1
+                trans_id = f"T{started}"
+                readonly = rnd.random() < self.readonly_fraction
+                length = rnd.randint(1, 2 * self.operations_per_transaction - 1)
+                running.append([trans_id, readonly, length])
+                yield f"beginRO({trans_id})" if readonly else f"begin({trans_id})"
+
+            yield from self._site_events(failed)
+
+            idx = rnd.randrange(len(running))
+            trans_id, readonly, remaining = running[idx]
+            if remaining == 0:
+                running[idx] = running[-1]
+                running.pop()
+                yield f"end({trans_id})"
+                continue
+
+            running[idx][2] -= 1
+            if readonly or rnd.random() < self.read_ratio:
+                yield f"R({trans_id},x{self._variable()})"
+            else:
+                yield f"W({trans_id},x{self._variable()},{rnd.randrange(1000)})"
+
+        for site_id in sorted(failed):
+            yield f"recover({site_id})"